@@ -0,0 +1,225 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tree_generator import generate_tree
+
+# Tree shapes measured by default; any generate_tree argument can be set per preset
+PRESETS = {
+    "small": dict(files=2000, depth=3, link_fanout=1),
+    "medium": dict(files=50000, depth=3, dirs_per_level=30, link_fanout=2),
+    "deep": dict(files=20000, depth=6, dirs_per_level=6, link_fanout=1, cross_dir_fraction=0.5),
+    "fanout": dict(files=10000, depth=3, link_fanout=5),
+    "broken": dict(files=5000, depth=3, link_fanout=2, copied_fraction=0.3, sparse_files=4, sparse_size=64 << 20),
+}
+
+# Entry points in the order they run; restore goes last because it changes the tree
+ENTRIES = ["build_inode_map", "create_snapshot", "create_snapshot_sorted", "find_video_files_with_no_hardlinks",
+           "find_orphans", "create_hardlinks", "restore_hardlinks"]
+
+# os functions counted as filesystem calls. DirEntry.stat() inside os.scandir cannot be wrapped,
+# so walker stats are not included; read/write syscall totals come from /proc/self/io instead.
+COUNTED_OS_FUNCTIONS = ['stat', 'lstat', 'scandir', 'listdir', 'link', 'unlink', 'remove', 'open', 'mkdir',
+                        'rename', 'replace', 'pread', 'copy_file_range', 'sendfile']
+
+
+@contextlib.contextmanager
+def count_os_calls():
+    counts = {}
+    originals = {name: getattr(os, name) for name in COUNTED_OS_FUNCTIONS if hasattr(os, name)}
+
+    def counted(name, function):
+        def wrapper(*args, **kwargs):
+            counts[name] = counts.get(name, 0) + 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    for name, function in originals.items():
+        setattr(os, name, counted(name, function))
+    try:
+        yield counts
+    finally:
+        for name, function in originals.items():
+            setattr(os, name, function)
+
+
+def _proc_io():
+    try:
+        with open('/proc/self/io') as f:
+            return {key: int(value) for key, value in (line.split(': ') for line in f)}
+    except OSError:
+        return {}
+
+
+def _peak_rss_kib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_entry(entry, tree, workers, work_dir):
+    """Run one entry point against a generated tree in this process and return its measurements."""
+    from hardlink_manager import build_inode_map, create_snapshot, create_snapshot_sorted, restore_hardlinks
+    from missing_finder import find_orphans, find_video_files_with_no_hardlinks
+    from raw_linker import create_hardlinks
+
+    snapshot_file = os.path.join(work_dir, 'snapshot.json')
+    non_restored_file = os.path.join(work_dir, 'non_restored.json')
+    raw_dest = os.path.join(work_dir, 'raw_dest')
+
+    # Setup that is not part of the measured call
+    inode_map = None
+    if entry == "create_snapshot":
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            inode_map = build_inode_map(tree["targets"], workers=workers)
+    elif entry == "restore_hardlinks" and not os.path.exists(snapshot_file):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            create_snapshot(tree["source"], build_inode_map(tree["targets"], workers=workers), snapshot_file,
+                            workers=workers)
+
+    calls = {
+        "build_inode_map": lambda: build_inode_map(tree["targets"], workers=workers),
+        "create_snapshot": lambda: create_snapshot(tree["source"], inode_map, snapshot_file, workers=workers),
+        # Walks the targets itself, so it is comparable to build_inode_map plus create_snapshot
+        "create_snapshot_sorted": lambda: create_snapshot_sorted(tree["source"], tree["targets"], snapshot_file,
+                                                                 workers=workers),
+        "find_video_files_with_no_hardlinks": lambda: find_video_files_with_no_hardlinks(tree["source"],
+                                                                                           workers=workers),
+        "find_orphans": lambda: find_orphans([tree["source"]], tree["targets"], workers=workers),
+        "create_hardlinks": lambda: create_hardlinks(tree["source"], raw_dest, workers=workers),
+        "restore_hardlinks": lambda: restore_hardlinks(snapshot_file, non_restored_file, workers=workers),
+    }
+
+    io_before = _proc_io()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), count_os_calls() as counts:
+        start = time.perf_counter()
+        calls[entry]()
+        wall = time.perf_counter() - start
+    io_after = _proc_io()
+
+    if entry == "create_hardlinks":
+        shutil.rmtree(raw_dest, ignore_errors=True)
+
+    return {
+        "entry": entry,
+        "wall_s": round(wall, 4),
+        "files_per_s": round(tree["files"] / wall, 1) if wall else None,
+        "os_calls": sum(counts.values()),
+        "os_calls_by_function": counts,
+        "read_syscalls": io_after.get("syscr", 0) - io_before.get("syscr", 0) if io_before else None,
+        "write_syscalls": io_after.get("syscw", 0) - io_before.get("syscw", 0) if io_before else None,
+        "peak_rss_kib": _peak_rss_kib(),
+    }
+
+
+def run_preset(name, params, entries, workers, keep_trees=False):
+    """Generate one tree and run each entry point on it in a fresh child process."""
+    root = tempfile.mkdtemp(prefix=f'hardlinker-bench-{name}-')
+    results = []
+    try:
+        print(f"[{name}] generating tree: {params}")
+        tree = generate_tree(os.path.join(root, 'tree'), **params)
+        work_dir = os.path.join(root, 'work')
+        os.makedirs(work_dir)
+        for entry in entries:
+            command = [sys.executable, os.path.abspath(__file__), '--child', entry,
+                       '--tree_file', os.path.join(tree["root"], 'tree.json'), '--work_dir', work_dir]
+            if workers is not None:
+                command += ['--workers', str(workers)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result["tree"] = name
+            results.append(result)
+            print(f"[{name}] {entry}: {result['wall_s']}s, {result['files_per_s']} files/s, "
+                  f"{result['os_calls']} os calls, peak RSS {result['peak_rss_kib']} KiB")
+    finally:
+        if not keep_trees:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def compare_results(results, baseline_file, threshold):
+    """Return a list of regressions of more than `threshold` (a fraction) against a previous run."""
+    with open(baseline_file) as f:
+        baseline = {(r["tree"], r["entry"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["tree"], result["entry"]))
+        if not previous:
+            continue
+        for metric in ("wall_s", "os_calls", "peak_rss_kib"):
+            if previous.get(metric) and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{result['tree']}/{result['entry']}: {metric} "
+                                   f"{previous[metric]} -> {result[metric]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hardlinker entry points on synthetic trees.")
+    parser.add_argument('--presets', nargs='+', choices=sorted(PRESETS), default=['small'],
+                        help="Tree shapes to generate")
+    parser.add_argument('--entries', nargs='+', choices=ENTRIES, default=ENTRIES, help="Entry points to run")
+    parser.add_argument('--files', type=int, help="Override the file count of every preset")
+    parser.add_argument('--workers', type=int, default=None, help="Worker threads passed to each entry point")
+    parser.add_argument('--output', default='bench_results.json', help="JSON file to write results to")
+    parser.add_argument('--compare', help="Previous results JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed slowdown before flagging, e.g. 0.2")
+    parser.add_argument('--keep_trees', action='store_true', help="Do not delete the generated trees")
+    parser.add_argument('--child', choices=ENTRIES, help=argparse.SUPPRESS)
+    parser.add_argument('--tree_file', help=argparse.SUPPRESS)
+    parser.add_argument('--work_dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.tree_file) as f:
+            tree = json.load(f)
+        print(json.dumps(run_entry(args.child, tree, args.workers, args.work_dir)))
+        return
+
+    results = []
+    presets = {}
+    for name in args.presets:
+        params = presets[name] = dict(PRESETS[name])
+        if args.files:
+            params["files"] = args.files
+        results.extend(run_preset(name, params, [e for e in ENTRIES if e in args.entries], args.workers,
+                                  args.keep_trees))
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "workers": args.workers,
+            "presets": presets,
+        },
+        "results": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        regressions = compare_results(results, args.compare, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import random
+import shutil
+
+
+def _directory_names(rng, depth, dirs_per_level):
+    # Series / Season NN / Extras ... up to the requested depth
+    parts = [f"Series {rng.randrange(dirs_per_level):03d}"]
+    if depth > 1:
+        parts.append(f"Season {rng.randrange(dirs_per_level) + 1:02d}")
+    for level in range(2, depth):
+        parts.append(f"Part {rng.randrange(dirs_per_level):02d}")
+    return parts
+
+
+def generate_tree(root, files=10000, depth=3, dirs_per_level=10, link_fanout=1, linked_fraction=0.9,
+                  cross_dir_fraction=0.1, copied_fraction=0.0, sparse_files=0, sparse_size=1 << 30,
+                  extension='.mkv', seed=0):
+    """Create a source tree and `link_fanout` library trees of hardlinks under `root`.
+
+    The layout mirrors a media pool: Series/Season/... folders of episodes in the source tree,
+    linked into library trees that mostly, but not always, use the same relative folders.
+
+    files              number of files in the source tree
+    depth              directory depth below each tree's root
+    dirs_per_level     distinct directory names per level
+    link_fanout        number of library trees each linked file is linked into
+    linked_fraction    share of source files that have library links at all
+    cross_dir_fraction share of links placed in a different directory than their source
+    copied_fraction    share of links replaced by identical copies (broken links for restore)
+    sparse_files       number of additional sparse files of `sparse_size` bytes, all linked
+    Returns a description of the tree, also written to `root`/tree.json.
+    """
+    rng = random.Random(seed)
+    source = os.path.join(root, 'source')
+    targets = [os.path.join(root, f'library{i}') for i in range(link_fanout)]
+    created_dirs = set()
+    links = copies = 0
+
+    def make_dirs(dirpath):
+        if dirpath not in created_dirs:
+            os.makedirs(dirpath, exist_ok=True)
+            created_dirs.add(dirpath)
+
+    def add_links(source_file, relative_dir, name, force=False):
+        nonlocal links, copies
+        if not force and rng.random() >= linked_fraction:
+            return
+        for target in targets:
+            link_dir = relative_dir
+            if rng.random() < cross_dir_fraction:
+                link_dir = os.path.join(*_directory_names(rng, depth, dirs_per_level))
+            target_dir = os.path.join(target, link_dir)
+            make_dirs(target_dir)
+            target_file = os.path.join(target_dir, name)
+            if os.path.exists(target_file):
+                continue
+            if rng.random() < copied_fraction:
+                shutil.copy2(source_file, target_file)
+                copies += 1
+            else:
+                os.link(source_file, target_file)
+                links += 1
+
+    for i in range(files):
+        relative_dir = os.path.join(*_directory_names(rng, depth, dirs_per_level))
+        source_dir = os.path.join(source, relative_dir)
+        make_dirs(source_dir)
+        name = f"Episode {i:07d}{extension}"
+        source_file = os.path.join(source_dir, name)
+        with open(source_file, 'wb') as f:
+            f.write(f"content of file {i}\n".encode() * rng.randrange(1, 64))
+        add_links(source_file, relative_dir, name)
+
+    for i in range(sparse_files):
+        relative_dir = os.path.join(*_directory_names(rng, depth, dirs_per_level))
+        source_dir = os.path.join(source, relative_dir)
+        make_dirs(source_dir)
+        name = f"Sparse {i:04d}{extension}"
+        source_file = os.path.join(source_dir, name)
+        with open(source_file, 'wb') as f:
+            f.write(f"sparse file {i}\n".encode())
+            f.truncate(sparse_size)
+        add_links(source_file, relative_dir, name, force=True)
+
+    description = {
+        "root": root,
+        "source": source,
+        "targets": targets,
+        "files": files + sparse_files,
+        "links": links,
+        "copies": copies,
+        "directories": len(created_dirs),
+        "params": {
+            "files": files, "depth": depth, "dirs_per_level": dirs_per_level, "link_fanout": link_fanout,
+            "linked_fraction": linked_fraction, "cross_dir_fraction": cross_dir_fraction,
+            "copied_fraction": copied_fraction, "sparse_files": sparse_files, "sparse_size": sparse_size,
+            "seed": seed,
+        },
+    }
+    with open(os.path.join(root, 'tree.json'), 'w') as f:
+        json.dump(description, f, indent=4)
+    return description
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic media-library tree.")
+    parser.add_argument('root', help="Directory to create the tree in")
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--dirs_per_level', type=int, default=10)
+    parser.add_argument('--link_fanout', type=int, default=1)
+    parser.add_argument('--linked_fraction', type=float, default=0.9)
+    parser.add_argument('--cross_dir_fraction', type=float, default=0.1)
+    parser.add_argument('--copied_fraction', type=float, default=0.0)
+    parser.add_argument('--sparse_files', type=int, default=0)
+    parser.add_argument('--sparse_size', type=int, default=1 << 30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    description = generate_tree(args.root, args.files, args.depth, args.dirs_per_level, args.link_fanout,
+                                args.linked_fraction, args.cross_dir_fraction, args.copied_fraction,
+                                args.sparse_files, args.sparse_size, seed=args.seed)
+    print(json.dumps(description, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import errno
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+# What to do when source and target are on different filesystems, where a hardlink cannot work:
+#   skip     report the link as failed without attempting it
+#   reflink  clone the file (FICLONE), sharing its data blocks; fail where that is not supported
+#   copy     clone if possible, otherwise copy the data inside the kernel
+CROSS_DEVICE_MODES = ('skip', 'reflink', 'copy')
+
+# ioctl(dest_fd, FICLONE, src_fd) from linux/fs.h
+FICLONE = 0x40049409
+
+# Errors meaning a reflink or copy_file_range cannot be done here, rather than that it failed
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS}
+
+# Bytes asked of copy_file_range or sendfile per call; smaller when throttled, so the read rate
+# limit is kept over short intervals too
+COPY_CHUNK_SIZE = 1 << 30
+THROTTLED_COPY_CHUNK_SIZE = 8 << 20
+
+
+def cross_device_error(target):
+    return OSError(errno.EXDEV, "Source and target are on different filesystems, not linked", target)
+
+
+def reflink(source, target):
+    """Create `target` as a copy-on-write clone of `source`; no data is read or written."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform", target)
+    with open(source, 'rb') as src:
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            fcntl.ioctl(fd, FICLONE, src.fileno())
+        except OSError:
+            os.close(fd)
+            os.unlink(target)
+            raise
+        os.close(fd)
+    shutil.copystat(source, target)
+
+
+def _copy_range(src_fd, dst_fd, size, throttle=None):
+    chunk_size = THROTTLED_COPY_CHUNK_SIZE if throttle else COPY_CHUNK_SIZE
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < size:
+                n = os.copy_file_range(src_fd, dst_fd, min(chunk_size, size - copied))
+                if n == 0:
+                    break
+                copied += n
+                if throttle:
+                    throttle.read(n)
+            return
+        except OSError as e:
+            # Kernels before 5.3 refuse copy_file_range across filesystems
+            if copied or e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+    while copied < size:
+        n = os.sendfile(dst_fd, src_fd, copied, min(chunk_size, size - copied))
+        if n == 0:
+            break
+        copied += n
+        if throttle:
+            throttle.read(n)
+
+
+def copy_file(source, target, throttle=None):
+    """Copy `source` to a new `target` with copy_file_range, or sendfile, keeping the data in the kernel.
+
+    The bytes copied count against `throttle` (a throttle.Throttle), if given, like any other read.
+    """
+    with open(source, 'rb') as src, open(target, 'xb') as dst:
+        try:
+            _copy_range(src.fileno(), dst.fileno(), os.fstat(src.fileno()).st_size, throttle)
+        except BaseException:
+            os.unlink(target)
+            raise
+        if throttle:
+            throttle.done(src.fileno())
+            throttle.done(dst.fileno())
+    shutil.copystat(source, target)
+
+
+def clone_file(source, target, mode, throttle=None):
+    """Create `target` from `source` on another filesystem; returns "reflink" or "copy".
+
+    `mode` is one of CROSS_DEVICE_MODES; with "skip" nothing is attempted. A copy is limited by
+    `throttle`, if given; a reflink reads no data.
+    """
+    if mode == 'skip':
+        raise cross_device_error(target)
+    try:
+        reflink(source, target)
+        return "reflink"
+    except OSError as e:
+        if mode != 'copy' or e.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+    copy_file(source, target, throttle)
+    return "copy"
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from inode_index import InodeIndex
+from verify import DEFAULT_ALGORITHM, DEFAULT_WORKERS, _read_at, contents_equal, hash_file, new_hasher
+from walker import walk_files
+
+# Bytes read from the head and from the tail of each candidate for the partial hash
+PARTIAL_BLOCK_SIZE = 64 * 1024
+
+# Candidate inodes hashed per round; bounds the number of queued futures
+HASH_BATCH_SIZE = 10000
+
+# Files smaller than this are not worth a link (and empty files are all "identical")
+DEFAULT_MIN_SIZE = 1
+
+
+def partial_hash(path, algorithm=DEFAULT_ALGORITHM, block_size=PARTIAL_BLOCK_SIZE, throttle=None):
+    """Hash the first and last `block_size` bytes of a file; the whole file if it is that small."""
+    with open(path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        hasher = new_hasher(algorithm)
+        try:
+            hasher.update(_read_at(f.fileno(), block_size, 0, throttle))
+            if size > block_size:
+                hasher.update(_read_at(f.fileno(), block_size, max(block_size, size - block_size), throttle))
+        finally:
+            if throttle:
+                throttle.done(f.fileno())
+        return hasher.hexdigest()
+
+
+def _split_by_digest(groups, digest, executor):
+    """Split each group of [ino, nlink, path] members by digest(path) of its members.
+
+    Yields the subgroups that still have two or more members. Files that cannot be read are
+    reported and dropped.
+    """
+    groups = iter(groups)
+    while True:
+        batch = []
+        for group in groups:
+            batch.append(group)
+            if sum(len(members) for _, members in batch) >= HASH_BATCH_SIZE:
+                break
+        if not batch:
+            return
+        futures = [[executor.submit(digest, member[2]) for member in members] for _, members in batch]
+        for (key, members), member_futures in zip(batch, futures):
+            by_digest = {}
+            for member, future in zip(members, member_futures):
+                try:
+                    by_digest.setdefault(future.result(), []).append(member)
+                except OSError as e:
+                    print(f"Error reading {member[2]}: {e}")
+            for subgroup in by_digest.values():
+                if len(subgroup) > 1:
+                    yield key, subgroup
+
+
+def find_duplicates(folders, algorithm=DEFAULT_ALGORITHM, workers=None, min_size=DEFAULT_MIN_SIZE,
+                    hash_cache=None, throttle=None):
+    """Find distinct inodes with identical contents in `folders`.
+
+    Returns (index, groups): an InodeIndex of every file scanned, and a list of
+    ((dev, size), [[ino, nlink, path], ...]) groups of two or more identical inodes. Paths that
+    already share an inode are one member, so existing links are never read or compared. Files
+    are grouped by device and size from the directory scan alone; only files whose size is shared
+    get a partial hash of their head and tail, and only those whose partial hashes collide are
+    read in full. Symlinks are left out. Reads are limited by `throttle`, if given.
+    """
+    index = InodeIndex()
+    by_size = {}  # (dev, size) -> {ino: nlink}
+
+    def report_error(path, error):
+        print(f"Error processing file {path}: {error}")
+
+    # A symlink can be neither the canonical path nor replaced by a link
+    for record in walk_files(folders, workers=workers, onerror=report_error, skip_symlinks=True):
+        index.add(record.dev, record.ino, record.path)
+        if record.size >= min_size:
+            by_size.setdefault((record.dev, record.size), {})[record.ino] = record.nlink
+    print(f"Scanned {len(index)} files.")
+
+    # Links can only be made within one device, so files on different devices never group
+    candidates = [((dev, size), [[ino, nlink, index.get(dev, ino)[0]] for ino, nlink in inodes.items()])
+                  for (dev, size), inodes in by_size.items() if len(inodes) > 1]
+    del by_size
+    print(f"{sum(len(members) for _, members in candidates)} files share their size with another file.")
+
+    groups = []
+    to_hash = []
+    with ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS, thread_name_prefix='dedupe') as executor:
+        for group in _split_by_digest(candidates, lambda path: partial_hash(path, algorithm, throttle=throttle), executor):
+            # For small files the partial hash already covered every byte
+            (groups if group[0][1] <= 2 * PARTIAL_BLOCK_SIZE else to_hash).append(group)
+        full_hash = partial(hash_file, algorithm=algorithm, hash_cache=hash_cache, throttle=throttle)
+        groups.extend(_split_by_digest(to_hash, full_hash, executor))
+    return index, groups
+
+
+def _replace_with_link(canonical, path, expected):
+    """Atomically replace `path`, if it is still inode `expected`, with a hardlink to `canonical`."""
+    st = os.lstat(path)
+    if (st.st_dev, st.st_ino) != expected:
+        raise OSError(f"{path} changed since it was scanned")
+    dirpath, name = os.path.split(path)
+    tmp_path = os.path.join(dirpath, f".{name}.dedupe-tmp")
+    os.link(canonical, tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def dedupe(folders, report_file=None, algorithm=DEFAULT_ALGORITHM, workers=None, min_size=DEFAULT_MIN_SIZE,
+           hash_cache=None, dry_run=False, throttle=None):
+    """Replace identical copies in `folders` with hardlinks to one canonical inode per content.
+
+    The canonical inode of each group is the one with the most links already, so the fewest
+    paths change. Every path of the other inodes is replaced atomically (link to a temporary
+    name, then rename over the path). With an algorithm that is not cryptographic, each pair is
+    also compared byte for byte before linking. Space is reclaimed for an inode only once all
+    of its links were seen in `folders`. Reads and replacements are limited by `throttle` (a
+    throttle.Throttle), if given. Returns the report, also written to `report_file`.
+    """
+    index, groups = find_duplicates(folders, algorithm, workers, min_size, hash_cache, throttle)
+    confirm = algorithm not in hashlib.algorithms_guaranteed
+
+    report = []
+    replaced_files = reclaimed = 0
+    for (dev, size), members in groups:
+        members.sort(key=lambda member: (-member[1], member[2]))
+        canonical_ino, _, canonical = members[0]
+        entry = {"canonical": canonical, "size": size, "replaced": [], "reclaimed": 0}
+        try:
+            st = os.lstat(canonical)
+        except OSError as e:
+            print(f"Error processing file {canonical}: {e}")
+            continue
+        if (st.st_dev, st.st_ino) != (dev, canonical_ino):
+            print(f"{canonical} changed since it was scanned, skipping its duplicates.")
+            continue
+        for ino, nlink, path in members[1:]:
+            paths = index.get(dev, ino)
+            try:
+                if confirm and not contents_equal(canonical, path, throttle=throttle):
+                    print(f"Contents of {path} differ from {canonical} despite equal hashes, skipping.")
+                    continue
+                for replaced in paths:
+                    if not dry_run:
+                        if throttle:
+                            throttle.op()
+                        _replace_with_link(canonical, replaced, (dev, ino))
+                    entry["replaced"].append(replaced)
+                    replaced_files += 1
+            except OSError as e:
+                print(f"Error linking {path} to {canonical}: {e}")
+                continue
+            if nlink == len(paths):
+                entry["reclaimed"] += size
+        if entry["replaced"]:
+            reclaimed += entry["reclaimed"]
+            report.append(entry)
+
+    action = "Would replace" if dry_run else "Replaced"
+    print(f"{action} {replaced_files} files with hardlinks in {len(report)} groups, "
+          f"reclaiming {reclaimed} bytes.")
+    if report_file:
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Dedupe report saved to {report_file}")
+    return report
@@ -0,0 +1,81 @@
+import json
+import os
+
+from walker import walk_files
+
+
+def _containing_roots(roots):
+    """Return a function mapping a walked path to the indexes of the roots that contain it."""
+    prefixes = [(i, root.rstrip(os.sep) + os.sep) for i, root in enumerate(roots)]
+
+    def containing(path):
+        return [i for i, prefix in prefixes if path.startswith(prefix)]
+    return containing
+
+
+def _outermost(roots):
+    """The roots not inside another root; walking just these visits every file once."""
+    return [root for root in roots
+            if not any(other != root and root.startswith(other.rstrip(os.sep) + os.sep) for other in roots)]
+
+
+def disk_usage(roots, report_file=None, workers=None):
+    """Account the space used by `roots` with every inode counted once, from a single walk.
+
+    Each file's (device, inode) is keyed to its size, its link count and how many of its links
+    were seen in each root. For every root, and for all roots together, the report gives:
+        total_bytes      distinct inodes with a link in the root
+        exclusive_bytes  inodes all of whose links are in the root, i.e. what deleting it would free
+        shared_bytes     inodes also linked from outside the root (another root, or elsewhere)
+    Sizes are apparent sizes and symlinks are ignored. Roots may be nested; each file is walked once. Returns the report,
+    also written to `report_file`.
+    """
+    # A root given twice would otherwise be walked, and counted, twice
+    roots = list(dict.fromkeys(os.path.normpath(root) for root in roots))
+    containing = _containing_roots(roots)
+    inodes = {}  # (dev, ino) -> [size, nlink, links seen, {root index: links seen in it}]
+    files = [0] * len(roots)
+
+    def report_error(path, error):
+        print(f"Error processing file {path}: {error}")
+
+    # A symlink frees nothing when deleted and is not one of its target's links
+    for record in walk_files(_outermost(roots), workers=workers, onerror=report_error, skip_symlinks=True):
+        entry = inodes.get((record.dev, record.ino))
+        if entry is None:
+            entry = inodes[(record.dev, record.ino)] = [record.size, record.nlink, 0, {}]
+        entry[2] += 1
+        for i in containing(record.path):
+            entry[3][i] = entry[3].get(i, 0) + 1
+            files[i] += 1
+    print(f"Indexed {len(inodes)} distinct inodes.")
+
+    totals = [[0, 0] for _ in roots]  # [total bytes, exclusive bytes] per root
+    combined = [0, 0]
+    for size, nlink, seen, counts in inodes.values():
+        for i, count in counts.items():
+            totals[i][0] += size
+            if count >= nlink:
+                totals[i][1] += size
+        combined[0] += size
+        if seen >= nlink:
+            combined[1] += size
+
+    def usage_entry(root, file_count, total, exclusive):
+        return {"root": root, "files": file_count, "total_bytes": total, "exclusive_bytes": exclusive,
+                "shared_bytes": total - exclusive}
+
+    report = {
+        "roots": [usage_entry(root, files[i], *totals[i]) for i, root in enumerate(roots)],
+        "combined": usage_entry(None, sum(entry[2] for entry in inodes.values()), *combined),
+    }
+
+    for entry in report["roots"] + [report["combined"]]:
+        name = entry["root"] or "All roots together"
+        print(f"{name}: {entry['total_bytes']} bytes in {entry['files']} files, "
+              f"{entry['exclusive_bytes']} freed if deleted, {entry['shared_bytes']} shared")
+    if report_file:
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Usage report saved to {report_file}")
+    return report
@@ -0,0 +1,109 @@
+import heapq
+import os
+import struct
+import tempfile
+
+# Memory the sort buffers of one snapshot may use in total
+DEFAULT_MEMORY_LIMIT = 256 << 20
+
+# Sorted runs merged at once; more runs are first merged into fewer, larger ones
+MAX_OPEN_RUNS = 64
+
+# Per-record cost of a buffered bytes object and its list slot, on top of the record itself
+RECORD_OVERHEAD = 64
+
+# Write buffer for a run being spilled, and read buffer for each run being merged
+WRITE_BUFFER_SIZE = 1 << 20
+READ_BUFFER_SIZE = 64 * 1024
+
+# A record is a big-endian (dev, ino) key followed by the encoded path, so sorting the raw bytes
+# orders records by device, inode and then path
+_KEY = struct.Struct('>QQ')
+KEY_SIZE = _KEY.size
+_LENGTH = struct.Struct('>I')
+
+
+def _read_run(run_file):
+    with open(run_file, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        while True:
+            header = f.read(_LENGTH.size)
+            if not header:
+                return
+            yield f.read(_LENGTH.unpack(header)[0])
+
+
+class ExternalSorter:
+    """Sort (dev, ino, path) records using at most about `memory_limit` bytes of memory.
+
+    Records are buffered as packed bytes; whenever the buffer reaches the limit it is sorted
+    and written to a run file in `tmp_dir`. Iterating the sorter merges the runs and the
+    remaining buffer, yielding records in (dev, ino, path) order.
+    """
+
+    def __init__(self, tmp_dir, memory_limit=DEFAULT_MEMORY_LIMIT):
+        self.tmp_dir = tmp_dir
+        self.memory_limit = memory_limit
+        self.count = 0
+        self.runs = []
+        self._buffer = []
+        self._buffered = 0
+
+    def add(self, dev, ino, path):
+        record = _KEY.pack(dev, ino) + os.fsencode(path)
+        self._buffer.append(record)
+        self._buffered += len(record) + RECORD_OVERHEAD
+        self.count += 1
+        if self._buffered >= self.memory_limit:
+            self._buffer.sort()
+            self.runs.append(self._write_run(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def _write_run(self, records):
+        fd, run_file = tempfile.mkstemp(suffix='.run', dir=self.tmp_dir)
+        with open(fd, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            for record in records:
+                f.write(_LENGTH.pack(len(record)))
+                f.write(record)
+        return run_file
+
+    def _merge_runs(self, runs):
+        merged = self._write_run(heapq.merge(*(_read_run(run) for run in runs)))
+        for run in runs:
+            os.remove(run)
+        return merged
+
+    def __iter__(self):
+        """Yield the packed records in sorted order."""
+        while len(self.runs) > MAX_OPEN_RUNS:
+            self.runs = self.runs[MAX_OPEN_RUNS:] + [self._merge_runs(self.runs[:MAX_OPEN_RUNS])]
+        self._buffer.sort()
+        return heapq.merge(iter(self._buffer), *(_read_run(run) for run in self.runs))
+
+
+def _grouped(records):
+    """Group sorted records by (dev, ino) key; yields (key bytes, [paths])."""
+    key = None
+    paths = []
+    for record in records:
+        if record[:KEY_SIZE] != key:
+            if paths:
+                yield key, paths
+            key = record[:KEY_SIZE]
+            paths = []
+        paths.append(os.fsdecode(record[KEY_SIZE:]))
+    if paths:
+        yield key, paths
+
+
+def merge_join(left, right):
+    """Yield ((dev, ino), left_paths, right_paths) for every inode present in both sorted streams."""
+    right_groups = _grouped(right)
+    right_key, right_paths = next(right_groups, (None, None))
+    for key, left_paths in _grouped(left):
+        while right_key is not None and right_key < key:
+            right_key, right_paths = next(right_groups, (None, None))
+        if right_key is None:
+            return
+        if right_key == key:
+            yield _KEY.unpack(key), left_paths, right_paths
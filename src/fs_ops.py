@@ -0,0 +1,248 @@
+import errno
+import os
+from collections import OrderedDict
+
+from cross_device import clone_file
+
+# Directory file descriptors kept open at once by DirFdOps
+DEFAULT_MAX_OPEN_DIRS = 256
+
+# O_PATH opens a directory just to anchor *at() calls, without needing read permission
+_DIR_OPEN_FLAGS = os.O_RDONLY | os.O_DIRECTORY | getattr(os, 'O_CLOEXEC', 0) | getattr(os, 'O_PATH', 0)
+
+
+def dir_fds_supported():
+    """Whether this platform supports the dir_fd arguments DirFdOps relies on."""
+    return all(function in os.supports_dir_fd for function in (os.stat, os.link, os.unlink, os.rename, os.open))
+
+
+class PathOps:
+    """Filesystem operations used by restore, addressed by full paths.
+
+    Directories already known to exist are remembered, so ensuring a parent directory for many
+    links in the same folder costs one check. The device of each directory is remembered too:
+    a link whose source and target directories are on different devices is not attempted, and
+    is handled according to `cross_device` (see cross_device.CROSS_DEVICE_MODES) instead.
+    Links and unlinks wait for `throttle` (a throttle.Throttle), if given, and copies made
+    across filesystems count against its read rate.
+    """
+
+    def __init__(self, cross_device='skip', throttle=None):
+        self.known_dirs = set()
+        self.cross_device = cross_device
+        self.throttle = throttle
+        self._devices = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        pass
+
+    def stat(self, path, missing_ok=False):
+        """Stat `path`, following symlinks; returns None for a missing file when `missing_ok`."""
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            if missing_ok:
+                return None
+            raise
+
+    def _device(self, dirpath):
+        device = self._devices.get(dirpath)
+        if device is None:
+            try:
+                device = self._devices[dirpath] = self._stat_dir(dirpath).st_dev
+            except OSError:
+                # Let the link itself report the problem
+                return None
+        return device
+
+    def _stat_dir(self, dirpath):
+        return os.stat(dirpath)
+
+    def link(self, source, target):
+        """Hardlink `target` to `source`; returns "link", or "reflink"/"copy" if it fell back to one."""
+        if self.throttle:
+            self.throttle.op()
+        source_device = self._device(os.path.dirname(source))
+        target_device = self._device(os.path.dirname(target))
+        if source_device is not None and target_device is not None and source_device != target_device:
+            return clone_file(source, target, self.cross_device, self.throttle)
+        try:
+            self._link(source, target)
+        except OSError as e:
+            # Union filesystems such as mergerfs report one device for branches that are not
+            if e.errno != errno.EXDEV:
+                raise
+            return clone_file(source, target, self.cross_device, self.throttle)
+        return "link"
+
+    def _link(self, source, target):
+        os.link(source, target)
+
+    def replace(self, source, target):
+        """Replace the existing `target` with a link to `source`, as link() makes it.
+
+        The link is made under a temporary name in the target's directory and renamed over the
+        target, so if linking fails the target is left as it was. Returns what link() returns.
+        """
+        dirpath, name = os.path.split(target)
+        tmp_target = os.path.join(dirpath, f".{name}.hardlinker-tmp")
+        try:
+            method = self.link(source, tmp_target)
+        except FileExistsError:
+            # Left behind by an interrupted run
+            self._unlink(tmp_target)
+            method = self.link(source, tmp_target)
+        try:
+            self._replace(tmp_target, target)
+        except BaseException:
+            self._unlink(tmp_target)
+            raise
+        return method
+
+    def _replace(self, source, target):
+        os.replace(source, target)
+
+    def unlink(self, path):
+        if self.throttle:
+            self.throttle.op()
+        self._unlink(path)
+
+    def _unlink(self, path):
+        os.unlink(path)
+
+    def ensure_dir(self, dirpath):
+        """Create `dirpath` if needed; returns True if it had to be created."""
+        if dirpath in self.known_dirs:
+            return False
+        created = False
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath, exist_ok=True)
+            created = True
+        self.known_dirs.add(dirpath)
+        return created
+
+
+class DirFdOps(PathOps):
+    """The same operations through cached directory file descriptors.
+
+    Each directory is opened once and files in it are reached with dir_fd= relative names, so the
+    kernel (or NFS server) resolves only the last path component per call instead of the full
+    absolute path. Up to `max_open` directories stay open, least recently used closed first.
+    A descriptor whose directory was removed or replaced meanwhile is only noticed when a call
+    through it fails; it is then closed and the call retried through the path, as PathOps would.
+    """
+
+    def __init__(self, max_open=DEFAULT_MAX_OPEN_DIRS, cross_device='skip', throttle=None):
+        super().__init__(cross_device, throttle)
+        self.max_open = max_open
+        self._fds = OrderedDict()
+
+    def close(self):
+        while self._fds:
+            os.close(self._fds.popitem()[1])
+
+    def _dir_fd(self, dirpath):
+        fd = self._fds.get(dirpath)
+        if fd is not None:
+            self._fds.move_to_end(dirpath)
+            return fd
+        fd = os.open(dirpath, _DIR_OPEN_FLAGS)
+        self._fds[dirpath] = fd
+        self.known_dirs.add(dirpath)
+        if len(self._fds) > self.max_open:
+            os.close(self._fds.popitem(last=False)[1])
+        return fd
+
+    def _split(self, path):
+        dirpath, name = os.path.split(path)
+        return self._dir_fd(dirpath), name
+
+    def _drop_stale(self, paths):
+        """Close the cached descriptors of the parents of `paths` whose directory was removed; returns whether any was."""
+        dropped = False
+        for dirpath in {os.path.dirname(path) for path in paths}:
+            fd = self._fds.get(dirpath)
+            if fd is None:
+                continue
+            try:
+                # A removed directory has no links left; NFS reports its handle as stale
+                stale = os.fstat(fd).st_nlink == 0
+            except OSError as e:
+                if e.errno != errno.ESTALE:
+                    raise
+                stale = True
+            if stale:
+                self._forget_dir(dirpath)
+                dropped = True
+        return dropped
+
+    def _retry_stale(self, operation, *paths):
+        # Checked only once a call fails, so the descriptors cost nothing while they are valid
+        try:
+            return operation()
+        except OSError as e:
+            if e.errno not in (errno.ENOENT, errno.ESTALE) or not self._drop_stale(paths):
+                raise
+        # The directory was removed, or replaced, since it was opened: reach it by its path again
+        return operation()
+
+    def stat(self, path, missing_ok=False):
+        def stat_at():
+            dir_fd, name = self._split(path)
+            return os.stat(name, dir_fd=dir_fd)
+        try:
+            if missing_ok:
+                # A missing target is the usual case; link() finds out if its directory went stale
+                return stat_at()
+            return self._retry_stale(stat_at, path)
+        except FileNotFoundError:
+            if missing_ok:
+                return None
+            raise
+
+    def _stat_dir(self, dirpath):
+        return os.fstat(self._dir_fd(dirpath))
+
+    def _link(self, source, target):
+        def link_at():
+            source_fd, source_name = self._split(source)
+            target_fd, target_name = self._split(target)
+            os.link(source_name, target_name, src_dir_fd=source_fd, dst_dir_fd=target_fd)
+        self._retry_stale(link_at, source, target)
+
+    def _replace(self, source, target):
+        def replace_at():
+            source_fd, source_name = self._split(source)
+            target_fd, target_name = self._split(target)
+            os.replace(source_name, target_name, src_dir_fd=source_fd, dst_dir_fd=target_fd)
+        self._retry_stale(replace_at, source, target)
+
+    def _unlink(self, path):
+        def unlink_at():
+            dir_fd, name = self._split(path)
+            os.unlink(name, dir_fd=dir_fd)
+        self._retry_stale(unlink_at, path)
+
+    def _forget_dir(self, dirpath):
+        fd = self._fds.pop(dirpath, None)
+        if fd is not None:
+            os.close(fd)
+        self.known_dirs.discard(dirpath)
+
+    def ensure_dir(self, dirpath):
+        if dirpath in self.known_dirs:
+            return False
+        try:
+            # Opening it both checks that it exists and caches the descriptor for the links
+            self._dir_fd(dirpath)
+            return False
+        except FileNotFoundError:
+            os.makedirs(dirpath, exist_ok=True)
+            self._dir_fd(dirpath)
+            return True
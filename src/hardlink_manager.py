@@ -1,29 +1,82 @@
 import argparse
 import hashlib
 import json
+import multiprocessing
 import os
+import shutil
+import tempfile
 import time
+import zlib
 
-def build_inode_map(target_folders, debug_inode_map_file=None):
-    """Build a map of inodes to lists of files in the target folders."""
-    inode_map = {}
+from cross_device import CROSS_DEVICE_MODES
+from dedupe import DEFAULT_MIN_SIZE, dedupe
+from disk_usage import disk_usage
+from external_sort import DEFAULT_MEMORY_LIMIT, ExternalSorter, merge_join
+from fs_ops import DirFdOps, PathOps, dir_fds_supported
+from hash_cache import DEFAULT_MAX_ENTRIES, HashCache
+from index_cache import DirectoryCache
+from inode_index import InodeIndex
+from journal import Journal
+from snapshot_io import SnapshotWriter, iter_snapshot
+from throttle import Throttle, set_idle_io_priority
+from verify import COMPARE_MODES, DEFAULT_ALGORITHM, Verifier, available_algorithms
+from walker import walk_files
+
+# Number of snapshot links read and restored together; bounds memory and the verification queue
+RESTORE_BATCH_SIZE = 1000
+
+# Worker processes used by snapshot and restore with --jobs
+DEFAULT_JOBS = 1
+
+# Top-level source directories walked, and journaled, together by the sharded snapshot
+SNAPSHOT_SHARD_DIRS = 16
+
+# How each outcome of PathOps.link is reported
+LINK_NAMES = {"link": "hardlink", "reflink": "reflink", "copy": "copy"}
+
+def _walk_targets(target_folders, workers, cache_file, onerror):
+    """Yield a FileRecord for every file in the target folders.
+
+    If an index watcher keeps the `cache_file` index live for these folders, the records are read
+    from it, opened read-only, without touching the disk; otherwise the folders are walked, reusing
+    the cached unchanged directories.
+    """
+    live = DirectoryCache.open_live(cache_file, target_folders) if cache_file else None
+    if live:
+        print("Reading the target folders from the live index cache.")
+        with live:
+            yield from live.iter_files(target_folders)
+        return
+    cache = DirectoryCache(cache_file) if cache_file else None
+    try:
+        yield from walk_files(target_folders, workers=workers, onerror=onerror, listing_cache=cache)
+        if cache:
+            cache.prune(target_folders)
+            print(f"Reused {cache.hits} cached directories, listed {cache.misses} from disk.")
+    finally:
+        if cache:
+            cache.close()
+
+
+def build_inode_map(target_folders, debug_inode_map_file=None, workers=None, cache_file=None):
+    """Build an index of (device, inode) to the files sharing it in the target folders.
+
+    With `cache_file`, directory listings are kept in that SQLite database and only directories
+    whose mtime changed since the previous run are listed again. While index_watcher.py keeps
+    that database live, the target folders are not walked at all.
+    """
+    inode_map = InodeIndex()
     total_files = 0
 
+    def report_error(path, error):
+        print(f"Error processing file {path}: {error}")
+
     # Traverse the target folders and build inode map
-    for target_folder in target_folders:
-        for dirpath, _, filenames in os.walk(target_folder):
-            for filename in filenames:
-                filepath = os.path.join(dirpath, filename)
-                try:
-                    inode = os.stat(filepath).st_ino
-                    if inode not in inode_map:
-                        inode_map[inode] = []
-                    inode_map[inode].append(filepath)
-                    total_files += 1
-                    if total_files % 1000 == 0:
-                        print(f"Processed {total_files} files...")
-                except Exception as e:
-                    print(f"Error processing file {filepath}: {e}")
+    for record in _walk_targets(target_folders, workers, cache_file, report_error):
+        inode_map.add(record.dev, record.ino, record.path)
+        total_files += 1
+        if total_files % 1000 == 0:
+            print(f"Processed {total_files} files...")
     
     print(f"Finished building inode map for {total_files} files.")
     
@@ -31,7 +84,7 @@ def build_inode_map(target_folders, debug_inode_map_file=None):
     if debug_inode_map_file:
         try:
             with open(debug_inode_map_file, 'w') as debug_file:
-                json.dump(inode_map, debug_file, indent=2)
+                json.dump(inode_map.to_dict(), debug_file, indent=2)
             print(f"Inode map saved to {debug_inode_map_file}")
         except Exception as e:
             print(f"Failed to save inode map: {e}")
@@ -39,107 +92,228 @@ def build_inode_map(target_folders, debug_inode_map_file=None):
     return inode_map
 
 
-def create_snapshot(source_folder, inode_map, snapshot_file):
-    """Create a snapshot of hard links from source folder based on inode map."""
-    snapshot = {}
+def create_snapshot(source_folder, inode_map, snapshot_file, workers=None, compression=None):
+    """Create a snapshot of hard links from source folder based on inode map.
+
+    Each match is written out as the walk finds it, so memory does not grow with the snapshot.
+    """
     total_files = 0
 
-    # Traverse the source folder and check each file's inode
-    for dirpath, _, filenames in os.walk(source_folder):
-        for filename in filenames:
-            source_file = os.path.join(dirpath, filename)
-            try:
-                inode = os.stat(source_file).st_ino
-                if inode in inode_map:
+    def report_error(path, error):
+        print(f"Error processing file {path}: {error}")
+
+    try:
+        with SnapshotWriter(snapshot_file, compression) as writer:
+            # Traverse the source folder and check each file's inode
+            for record in walk_files(source_folder, workers=workers, onerror=report_error):
+                target_hardlinks = inode_map.get(record.dev, record.ino)
+                if target_hardlinks:
                     # Found matching hard links in the target folders
-                    target_hardlinks = inode_map[inode]
-                    snapshot[source_file] = target_hardlinks
+                    writer.write(record.path, target_hardlinks)
                     total_files += 1
                     if total_files % 1000 == 0:
                         print(f"Processed {total_files} source files...")
-            except Exception as e:
-                print(f"Error processing file {source_file}: {e}")
+        print(f"Snapshot saved to {snapshot_file}")
+    except Exception as e:
+        print(f"Error saving snapshot to {snapshot_file}: {e}")
+
+def create_snapshot_sorted(source_folder, target_folders, snapshot_file, workers=None, compression=None,
+                           memory_limit=DEFAULT_MEMORY_LIMIT, tmp_dir=None, cache_file=None):
+    """Create the same snapshot as build_inode_map and create_snapshot, in bounded memory.
+
+    Instead of holding every target file in an inode map, the (dev, ino, path) records of both
+    walks go to external sorters in `tmp_dir` (the system temporary directory by default), which
+    together keep at most about `memory_limit` bytes in memory and spill sorted runs to disk.
+    The sorted streams are then merge-joined on (dev, ino). Snapshot entries come out in inode
+    order rather than walk order.
+    """
+    total_files = 0
+    work_dir = tempfile.mkdtemp(prefix='hardlinker-sort-', dir=tmp_dir)
+
+    def report_error(path, error):
+        print(f"Error processing file {path}: {error}")
 
-    # Write the snapshot to the output file in JSON format
     try:
-        with open(snapshot_file, 'w') as f:
-            json.dump(snapshot, f, indent=4)
+        targets = ExternalSorter(work_dir, memory_limit // 2)
+        for record in _walk_targets(target_folders, workers, cache_file, report_error):
+            targets.add(record.dev, record.ino, record.path)
+
+        sources = ExternalSorter(work_dir, memory_limit // 2)
+        for record in walk_files(source_folder, workers=workers, onerror=report_error):
+            sources.add(record.dev, record.ino, record.path)
+        print(f"Sorted {targets.count} target and {sources.count} source files "
+              f"({len(targets.runs) + len(sources.runs)} runs on disk).")
+
+        with SnapshotWriter(snapshot_file, compression) as writer:
+            for _, source_paths, target_hardlinks in merge_join(sources, targets):
+                for source_path in source_paths:
+                    writer.write(source_path, target_hardlinks)
+                    total_files += 1
+                    if total_files % 1000 == 0:
+                        print(f"Processed {total_files} source files...")
         print(f"Snapshot saved to {snapshot_file}")
     except Exception as e:
         print(f"Error saving snapshot to {snapshot_file}: {e}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-def hash_file(file_path):
-    """Generate a SHA256 hash for the given file."""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        # Read in 4K chunks to avoid loading large files into memory all at once
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
-
-def restore_hardlinks(snapshot_file, non_restored_file="non_restored_hardlinks.json"):
-    """Restore hard links based on the snapshot, check file attributes and skip if they do not match."""
-    
-    non_restored_links = []  # List to store non-restored links for review
-    
-    with open(snapshot_file, 'r') as f:
-        snapshot_data = json.load(f)
 
-    for source_file, target_files in snapshot_data.items():
+def _iter_links(snapshot_file):
+    for source_file, target_files in iter_snapshot(snapshot_file):
         for target_file in target_files:
-            try:
-                # Check if the target file exists
-                if os.path.exists(target_file):
-                    source_stat = os.stat(source_file)
-                    target_stat = os.stat(target_file)
-
-                    # Check if source and target are already hardlinked (same inode)
-                    if source_stat.st_ino == target_stat.st_ino:
-                        print(f"Source {source_file} and target {target_file} are already hardlinked, skipping.")
-                        continue  # Skip creating the link if they are already hardlinked
-
-                    # Check if the file sizes and modification times match
-                    if source_stat.st_size == target_stat.st_size and source_stat.st_mtime == target_stat.st_mtime:
-                        # Hash the contents of both the source and target files
-                        source_hash = hash_file(source_file)
-                        target_hash = hash_file(target_file)
-
-                        # If hashes do not match, skip restoration and add to non-restored list
-                        if source_hash != target_hash:
-                            print(f"Source {source_file} and target {target_file} have different contents, skipping restoration.")
-                            non_restored_links.append({
-                                "source_file": source_file,
-                                "target_file": target_file,
-                                "reason": "Content mismatch (hashes do not match)"
-                            })
-                            continue  # Skip restoration if contents are different
-
-                        # If hashes match, delete the target file and create the hard link
-                        os.remove(target_file)
-                        os.link(source_file, target_file)
-                        print(f"Deleted {target_file} and created hardlink from {source_file} -> {target_file}")
-                    else:
-                        # If attributes don't match, skip this link and add to non-restored list
-                        print(f"Attributes do not match for {target_file}, skipping restoration.")
-                        non_restored_links.append({
-                            "source_file": source_file,
-                            "target_file": target_file,
-                            "reason": "Attributes do not match"
-                        })
+            yield source_file, target_file
+
+
+def _restore_batch(links, verifier, ops, non_restored_links):
+    """Restore one batch of (source, target) links, verifying candidate pairs in parallel.
+
+    Links are handled in target directory order, each source is stat'ed once per batch and all
+    filesystem calls go through `ops` (PathOps or DirFdOps).
+    """
+    to_verify = []  # Pairs whose attributes match and whose contents must be compared
+    source_stats = {}  # Source stats taken before any link in this batch
+
+    for source_file, target_file in sorted(links, key=lambda link: os.path.split(link[1])):
+        try:
+            # Check if the target file exists; a single stat answers both questions
+            target_stat = ops.stat(target_file, missing_ok=True)
+            if target_stat is not None:
+                source_stat = source_stats.get(source_file)
+                if source_stat is None:
+                    source_stat = source_stats[source_file] = ops.stat(source_file)
+
+                # Check if source and target are already hardlinked (same inode)
+                if (source_stat.st_dev, source_stat.st_ino) == (target_stat.st_dev, target_stat.st_ino):
+                    print(f"Source {source_file} and target {target_file} are already hardlinked, skipping.")
+                    continue  # Skip creating the link if they are already hardlinked
+
+                # A copy on another filesystem can only be replaced by a reflink, if at all
+                if source_stat.st_dev != target_stat.st_dev and ops.cross_device != 'reflink':
+                    print(f"Source {source_file} and target {target_file} are on different filesystems, skipping restoration.")
+                    non_restored_links.append({
+                        "source_file": source_file,
+                        "target_file": target_file,
+                        "reason": "Source and target are on different filesystems"
+                    })
+                    continue
+
+                # Check if the file sizes and modification times match
+                if source_stat.st_size == target_stat.st_size and source_stat.st_mtime == target_stat.st_mtime:
+                    to_verify.append((source_file, target_file))
                 else:
-                    # If the target file doesn't exist, ensure parent directories exist and create the hard link
-                    parent_dir = os.path.dirname(target_file)
+                    # If attributes don't match, skip this link and add to non-restored list
+                    print(f"Attributes do not match for {target_file}, skipping restoration.")
+                    non_restored_links.append({
+                        "source_file": source_file,
+                        "target_file": target_file,
+                        "reason": "Attributes do not match"
+                    })
+            else:
+                # If the target file doesn't exist, ensure parent directories exist and create the hard link
+                parent_dir = os.path.dirname(target_file)
+
+                # Ensure the parent directory exists (create it if it doesn't)
+                if ops.ensure_dir(parent_dir):
+                    print(f"Created parent directory: {parent_dir}")
+
+                method = ops.link(source_file, target_file)
+                print(f"Created {LINK_NAMES[method]}: {source_file} -> {target_file}")
+
+        except Exception as e:
+            print(f"Error processing link from {source_file} to {target_file}: {e}")
+
+    # Compare the contents of the source and target files, many pairs at once
+    for (source_file, target_file), same_content in verifier.compare(to_verify):
+        try:
+            if isinstance(same_content, Exception):
+                raise same_content
+
+            # If contents do not match, skip restoration and add to non-restored list
+            if not same_content:
+                print(f"Source {source_file} and target {target_file} have different contents, skipping restoration.")
+                non_restored_links.append({
+                    "source_file": source_file,
+                    "target_file": target_file,
+                    "reason": verifier.mismatch_reason
+                })
+                continue  # Skip restoration if contents are different
+
+            # If contents match, replace the target file with the hard link; the target is only
+            # removed once its replacement exists
+            method = ops.replace(source_file, target_file)
+            print(f"Replaced {target_file} with a {LINK_NAMES[method]} from {source_file} -> {target_file}")
+            # The new link moved the source's ctime; keep its cached hash valid for later batches
+            verifier.relinked(source_file, source_stats[source_file])
+
+        except Exception as e:
+            print(f"Error processing link from {source_file} to {target_file}: {e}")
+
+
+def restore_hardlinks(snapshot_file, non_restored_file="non_restored_hardlinks.json",
+                      algorithm=DEFAULT_ALGORITHM, workers=None, batch_size=RESTORE_BATCH_SIZE,
+                      compare='hash', hash_cache=None, use_dir_fds=False, cross_device='skip',
+                      journal_file=None, resume=False, throttle=None):
+    """Restore hard links based on the snapshot, check file attributes and skip if they do not match.
 
-                    # Ensure the parent directory exists (create it if it doesn't)
-                    if not os.path.exists(parent_dir):
-                        os.makedirs(parent_dir)
-                        print(f"Created parent directory: {parent_dir}")
+    The snapshot is read lazily in batches of `batch_size` links. Within a batch, pairs that need
+    their contents compared are checked on a pool of `workers` threads, either by hashing with
+    `algorithm` or, with `compare` set to "bytes" or "tiered", by comparing them directly.
+    Hashes are kept in `hash_cache` (a HashCache; an in-memory one is used if none is given),
+    so a source with several targets is read once. With `use_dir_fds`, directories are opened
+    once and links, stats and unlinks are issued relative to them.
+    Links between filesystems are skipped, or made as reflinks or copies, according to
+    `cross_device`; an existing target on another filesystem is only replaced in "reflink" mode.
+    With `journal_file`, every finished batch and its non-restored links are journaled; with
+    `resume`, batches an interrupted run had finished are skipped without being stat'ed or
+    hashed again. The journal is removed once the restore completes. Content reads, links and
+    unlinks are limited by `throttle` (a throttle.Throttle), if given.
+    """
     
-                    os.link(source_file, target_file)
-                    print(f"Created hardlink: {source_file} -> {target_file}")
-            
-            except Exception as e:
-                print(f"Error processing link from {source_file} to {target_file}: {e}")
+    non_restored_links = []  # List to store non-restored links for review
+
+    journal = None
+    done_batches = set()
+    if journal_file:
+        snapshot_stat = os.stat(snapshot_file)
+        journal = Journal(journal_file, {"action": "restore", "snapshot": os.path.abspath(snapshot_file),
+                                         "size": snapshot_stat.st_size, "mtime_ns": snapshot_stat.st_mtime_ns,
+                                         "batch_size": batch_size}, resume)
+        for entry in journal.completed:
+            done_batches.add(entry["batch"])
+            non_restored_links.extend(entry["non_restored"])
+    
+    if hash_cache is None:
+        hash_cache = HashCache()
+
+    if use_dir_fds and not dir_fds_supported():
+        print("Directory file descriptors are not supported on this platform, using full paths.")
+        use_dir_fds = False
+
+    try:
+        with Verifier(algorithm, workers, mode=compare, hash_cache=hash_cache, throttle=throttle) as verifier, \
+                (DirFdOps(cross_device=cross_device, throttle=throttle) if use_dir_fds
+                 else PathOps(cross_device, throttle)) as ops:
+            for number, links in enumerate(_batched(_iter_links(snapshot_file), batch_size)):
+                if number in done_batches:
+                    continue
+                batch_non_restored = []
+                _restore_batch(links, verifier, ops, batch_non_restored)
+                non_restored_links.extend(batch_non_restored)
+                if journal:
+                    journal.record({"batch": number, "non_restored": batch_non_restored})
+    finally:
+        if journal:
+            journal.close()
     
     # After processing, save the list of non-restored links to a file if any
     if non_restored_links:
@@ -149,24 +323,356 @@ def restore_hardlinks(snapshot_file, non_restored_file="non_restored_hardlinks.j
     else:
         print("All hardlinks were restored successfully.")
 
+    if journal:
+        journal.remove()
     print("Restoration complete.")
+
+
+def _fork_available(jobs):
+    """Whether `jobs` worker processes can be forked; they inherit the parent's data without pickling."""
+    if jobs <= 1:
+        return False
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        print("Worker processes need fork(), which this platform lacks; using one process.")
+        return False
+    return True
+
+
+def _run_processes(targets):
+    """Run each (function, args) in a forked process; raises if any of them failed."""
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=function, args=args) for function, args in targets]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failed = [i for i, process in enumerate(processes) if process.exitcode != 0]
+    if failed:
+        raise RuntimeError(f"Worker processes {failed} failed")
+
+
+def _run_shards(function, per_process_args, jobs):
+    """Run function(*args) for each entry of `per_process_args`, in forked processes when jobs > 1."""
+    if jobs > 1:
+        _run_processes([(function, args) for args in per_process_args])
+    else:
+        for args in per_process_args:
+            function(*args)
+
+
+def _snapshot_shard(source_folder, names, inode_map, shard_file, workers):
+    """Write the snapshot entries of some top-level entries of the source folder to `shard_file`.
+
+    `names` are top-level directory names; "" stands for the files directly in the source folder.
+    Returns the number of source files written.
+    """
+    def report_error(path, error):
+        print(f"Error processing file {path}: {error}")
+
+    roots = [os.path.join(source_folder, name) for name in names if name]
+    with SnapshotWriter(shard_file) as writer:
+        if "" in names:
+            # Files directly in the source folder; its subdirectories are walked below
+            with os.scandir(source_folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            st = entry.stat()
+                            target_hardlinks = inode_map.get(st.st_dev, st.st_ino)
+                            if target_hardlinks:
+                                writer.write(entry.path, target_hardlinks)
+                    except OSError as e:
+                        report_error(entry.path, e)
+        if roots:
+            for record in walk_files(roots, workers=workers, onerror=report_error):
+                target_hardlinks = inode_map.get(record.dev, record.ino)
+                if target_hardlinks:
+                    writer.write(record.path, target_hardlinks)
+    return writer.count
+
+
+def _shard_file_name(names):
+    return "shard." + hashlib.sha1(os.fsencode("\0".join(names))).hexdigest()
+
+
+def _snapshot_shards(source_folder, chunks, inode_map, work_dir, workers, journal):
+    for names in chunks:
+        shard_file = os.path.join(work_dir, _shard_file_name(names))
+        count = _snapshot_shard(source_folder, names, inode_map, shard_file, workers)
+        if journal:
+            journal.record({"dirs": names, "file": os.path.basename(shard_file), "count": count})
+    if journal:
+        journal.flush()
+
+
+def create_snapshot_parallel(source_folder, inode_map, snapshot_file, jobs=DEFAULT_JOBS, workers=None,
+                             compression=None, tmp_dir=None, journal_file=None, resume=False, target_folders=()):
+    """create_snapshot with the source folder split by top-level directory over `jobs` processes.
+
+    The top-level directories are taken SNAPSHOT_SHARD_DIRS at a time; each chunk is walked into
+    a shard snapshot, and the shards are then merged into `snapshot_file`. The processes are
+    forked, so they share the inode map instead of each building or loading it. With
+    `journal_file`, the shards are kept next to the journal until the snapshot is complete and
+    every finished chunk is journaled, so with `resume` an interrupted run walks only the
+    top-level directories it had not finished (the inode map is built again; an index cache
+    makes that cheap). `target_folders`, the folders the inode map was built from, are part of
+    the journal's key, so a snapshot against other folders never resumes this one's shards.
+    """
+    jobs = jobs if _fork_available(jobs) else 1
+    if jobs == 1 and journal_file is None:
+        return create_snapshot(source_folder, inode_map, snapshot_file, workers=workers, compression=compression)
+
+    inode_map.sort()  # Once here, not once in every process
+    journal = None
+    if journal_file:
+        work_dir = journal_file + '.shards'
+        journal = Journal(journal_file, {"action": "snapshot", "source": os.path.abspath(source_folder),
+                                         "targets": [os.path.abspath(folder) for folder in target_folders],
+                                         "snapshot": os.path.abspath(snapshot_file)}, resume)
+        if not journal.completed:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir, exist_ok=True)
+    else:
+        work_dir = tempfile.mkdtemp(prefix='hardlinker-shards-', dir=tmp_dir)
+
+    try:
+        with os.scandir(source_folder) as entries:
+            names = [""] + sorted(entry.name for entry in entries if entry.is_dir(follow_symlinks=False))
+        shards = {tuple(entry["dirs"]): entry["file"] for entry in journal.completed} if journal else {}
+        done = {name for dirs in shards for name in dirs}
+        remaining = [name for name in names if name not in done]
+        chunks = [remaining[i:i + SNAPSHOT_SHARD_DIRS] for i in range(0, len(remaining), SNAPSHOT_SHARD_DIRS)]
+        if done:
+            print(f"Skipping {len(done)} top-level entries already in the journal.")
+
+        _run_shards(_snapshot_shards, [(source_folder, chunks[i::jobs], inode_map, work_dir, workers, journal)
+                                       for i in range(jobs)], jobs)
+
+        shard_files = list(shards.values())
+        shard_files += [_shard_file_name(chunk) for chunk in chunks]
+        with SnapshotWriter(snapshot_file, compression) as writer:
+            for shard_file in shard_files:
+                for source_file, target_files in iter_snapshot(os.path.join(work_dir, shard_file)):
+                    writer.write(source_file, target_files)
+        print(f"Snapshot of {writer.count} source files saved to {snapshot_file}")
+    except Exception as e:
+        print(f"Error saving snapshot to {snapshot_file}: {e}")
+        if journal:
+            journal.close()
+            print(f"Progress is kept in {journal_file}; run again with --resume to continue.")
+            return
+    else:
+        if journal:
+            journal.remove()
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def shard_of(target_file, jobs):
+    """Shard of a link, by a stable hash of its target directory.
+
+    All links into one directory land in the same shard, so no two processes work in the same
+    directory and each keeps its directory descriptors and parent checks to itself.
+    """
+    return zlib.crc32(os.fsencode(os.path.dirname(target_file))) % jobs
+
+
+def _restore_shard(shard, shard_file, non_restored_file, journal, options):
+    restore_hardlinks(shard_file, non_restored_file, **options)
+    if journal:
+        journal.record({"shard": shard})
+        journal.flush()
+
+
+def restore_hardlinks_parallel(snapshot_file, non_restored_file="non_restored_hardlinks.json", jobs=DEFAULT_JOBS,
+                               tmp_dir=None, journal_file=None, resume=False, **options):
+    """restore_hardlinks with the links split over `jobs` processes by target directory (see shard_of).
+
+    The snapshot is read once and split into shard snapshots, each restored by its own process
+    with its own thread pool; their non-restored links are merged into `non_restored_file`.
+    `options` are passed to restore_hardlinks. A hash cache cannot be shared between processes,
+    so each keeps its own in memory; each process gets an equal share of a throttle's limits.
+    With `journal_file`, the shards are kept next to the journal, which records the split and
+    every finished shard, and each shard journals its own batches; with `resume`, only the
+    unfinished batches of unfinished shards are restored.
+    """
+    if not _fork_available(jobs):
+        return restore_hardlinks(snapshot_file, non_restored_file, journal_file=journal_file, resume=resume,
+                                 **options)
+    options.pop('hash_cache', None)
+    if options.get('throttle'):
+        options['throttle'] = options['throttle'].split(jobs)
+
+    journal = None
+    done = set()
+    if journal_file:
+        work_dir = journal_file + '.shards'
+        snapshot_stat = os.stat(snapshot_file)
+        journal = Journal(journal_file, {"action": "restore", "snapshot": os.path.abspath(snapshot_file),
+                                         "size": snapshot_stat.st_size, "mtime_ns": snapshot_stat.st_mtime_ns,
+                                         "jobs": jobs}, resume)
+        done = {entry.get("shard", "split") for entry in journal.completed}
+    else:
+        work_dir = tempfile.mkdtemp(prefix='hardlinker-shards-', dir=tmp_dir)
+
+    try:
+        shard_files = [os.path.join(work_dir, f"snapshot.{i}") for i in range(jobs)]
+        non_restored_files = [os.path.join(work_dir, f"non_restored.{i}.json") for i in range(jobs)]
+        if "split" not in done:
+            if journal:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                os.makedirs(work_dir)
+            writers = [SnapshotWriter(shard_file) for shard_file in shard_files]
+            try:
+                for source_file, target_files in iter_snapshot(snapshot_file):
+                    shards = {}
+                    for target_file in target_files:
+                        shards.setdefault(shard_of(target_file, jobs), []).append(target_file)
+                    for shard, shard_targets in shards.items():
+                        writers[shard].write(source_file, shard_targets)
+            finally:
+                for writer in writers:
+                    writer.close()
+            if journal:
+                journal.record({"split": True})
+                journal.flush()
+
+        # A shard resumes its own journal only if it is restoring the same split as before
+        targets = []
+        for i in range(jobs):
+            if i in done:
+                continue
+            shard_options = dict(options, journal_file=os.path.join(work_dir, f"journal.{i}") if journal else None,
+                                 resume="split" in done)
+            targets.append((_restore_shard, (i, shard_files[i], non_restored_files[i], journal, shard_options)))
+        _run_processes(targets)
+
+        non_restored_links = []
+        for shard_non_restored in non_restored_files:
+            if os.path.exists(shard_non_restored):
+                with open(shard_non_restored) as f:
+                    non_restored_links.extend(json.load(f))
+    except BaseException:
+        if journal:
+            journal.close()
+            print(f"Progress is kept in {journal_file}; run again with --resume to continue.")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    if non_restored_links:
+        with open(non_restored_file, 'w') as f:
+            json.dump(non_restored_links, f, indent=4)
+        print(f"Non-restored hardlinks of all {jobs} shards saved to {non_restored_file}")
+    else:
+        print("All hardlinks were restored successfully.")
+    if journal:
+        journal.remove()
+    shutil.rmtree(work_dir, ignore_errors=True)
     
     
 def main():
     parser = argparse.ArgumentParser(description="Snapshot and restore hardlinks.")
-    parser.add_argument('action', choices=['snapshot', 'restore'], help="Action to perform")
+    parser.add_argument('action', choices=['snapshot', 'restore', 'dedupe', 'usage'], help="Action to perform")
     parser.add_argument('source_folder', help="Path to the source folder")
     parser.add_argument('target_folders', nargs='+', help="List of target folders to track hard links")
-    parser.add_argument('snapshot_file', help="Snapshot file path (for restore or save)")
+    parser.add_argument('snapshot_file', help="Snapshot file path (for restore or save); the report file for dedupe and usage")
     parser.add_argument('--debug_inode_map_file', help="File to save the inode map for debugging", default=None)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of threads used to scan directories and to verify file contents")
+    parser.add_argument('--hash_algorithm', choices=available_algorithms(), default=DEFAULT_ALGORITHM,
+                        help="Hash used to compare file contents during restore and dedupe "
+                             "(matches of non-cryptographic ones are confirmed byte for byte)")
+    parser.add_argument('--compare', choices=COMPARE_MODES, default='hash',
+                        help="How restore compares contents: hash both files, compare bytes with early exit, "
+                             "or check sampled blocks before comparing bytes (tiered)")
+    parser.add_argument('--compression', choices=['gzip', 'xz'], default=None,
+                        help="Compress the snapshot (default: from the .gz/.xz extension)")
+    parser.add_argument('--dir_fds', action='store_true',
+                        help="Restore through cached directory file descriptors to cut per-link path lookups")
+    parser.add_argument('--hash_cache', help="SQLite file keeping content hashes between restores", default=None)
+    parser.add_argument('--hash_cache_size', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help="Maximum number of hashes kept in the hash cache")
+    parser.add_argument('--index_cache', default=None,
+                        help="SQLite file caching target folder listings between snapshots (see index_watcher.py)")
+    parser.add_argument('--cross_device', choices=CROSS_DEVICE_MODES, default='skip',
+                        help="For links between filesystems: skip them, reflink them, or reflink or copy them")
+    parser.add_argument('--engine', choices=['memory', 'sort'], default='memory',
+                        help="Snapshot by an in-memory inode map, or by sorting both walks on disk (for huge trees)")
+    parser.add_argument('--memory_limit', type=int, default=DEFAULT_MEMORY_LIMIT >> 20,
+                        help="Memory, in MiB, the sort engine may use for its buffers")
+    parser.add_argument('--tmp_dir', default=None, help="Directory for the sort runs and --jobs shard files")
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS,
+                        help="Worker processes for snapshot (by top-level source folder) and restore (by target folder)")
+    parser.add_argument('--journal', default=None,
+                        help="Journal the progress of snapshot and restore to this file")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted snapshot or restore from its journal "
+                             "(default journal: the snapshot file + .journal)")
+    parser.add_argument('--min_size', type=int, default=DEFAULT_MIN_SIZE,
+                        help="Smallest file size, in bytes, that dedupe links")
+    parser.add_argument('--dry_run', action='store_true', help="Only report what dedupe would link")
+    parser.add_argument('--max_read_rate', type=float, default=None,
+                        help="Limit content reads by restore and dedupe to this many MiB/s")
+    parser.add_argument('--max_ops_rate', type=float, default=None,
+                        help="Limit links and unlinks by restore and dedupe to this many per second")
+    parser.add_argument('--idle_io', action='store_true',
+                        help="Run in the idle I/O priority class, yielding the disks to every other process")
+    parser.add_argument('--drop_cache', action='store_true',
+                        help="Drop each file read from the page cache, keeping other services' data cached")
 
     args = parser.parse_args()
+    if args.idle_io:
+        # Before any thread or worker process starts, so they all inherit the class
+        set_idle_io_priority()
+    throttle = None
+    if args.max_read_rate or args.max_ops_rate or args.drop_cache:
+        throttle = Throttle(args.max_read_rate and args.max_read_rate * (1 << 20), args.max_ops_rate,
+                            args.drop_cache)
+    # Only journal on request: the journal is written next to the snapshot by default, which may be
+    # read-only, and a journaled snapshot keeps its shard files until the end even with one job
+    journal_file = None
+    if args.journal or args.resume:
+        journal_file = args.journal or args.snapshot_file + '.journal'
 
-    if args.action == 'snapshot':
-        inode_map = build_inode_map(args.target_folders, args.debug_inode_map_file)
-        create_snapshot(args.source_folder, inode_map, args.snapshot_file)
+    if args.action == 'snapshot' and args.engine == 'sort':
+        if args.resume:
+            print("The sort engine cannot resume; starting over.")
+        if args.debug_inode_map_file:
+            print("The sort engine builds no inode map; ignoring --debug_inode_map_file.")
+        if args.jobs > 1:
+            print("The sort engine runs in a single process; ignoring --jobs.")
+        create_snapshot_sorted(args.source_folder, args.target_folders, args.snapshot_file, workers=args.workers,
+                               compression=args.compression, memory_limit=args.memory_limit << 20,
+                               tmp_dir=args.tmp_dir, cache_file=args.index_cache)
+    elif args.action == 'snapshot':
+        inode_map = build_inode_map(args.target_folders, args.debug_inode_map_file, workers=args.workers,
+                                    cache_file=args.index_cache)
+        create_snapshot_parallel(args.source_folder, inode_map, args.snapshot_file, jobs=args.jobs,
+                                 workers=args.workers, compression=args.compression, tmp_dir=args.tmp_dir,
+                                 journal_file=journal_file, resume=args.resume,
+                                 target_folders=args.target_folders)
+    elif args.action == 'restore' and args.jobs > 1:
+        if args.hash_cache:
+            print("Each restore process keeps its own in-memory hash cache; ignoring --hash_cache.")
+        restore_hardlinks_parallel(args.snapshot_file, jobs=args.jobs, tmp_dir=args.tmp_dir,
+                                   algorithm=args.hash_algorithm, workers=args.workers, compare=args.compare,
+                                   use_dir_fds=args.dir_fds, cross_device=args.cross_device,
+                                   journal_file=journal_file, resume=args.resume, throttle=throttle)
     elif args.action == 'restore':
-        restore_hardlinks(args.snapshot_file)
+        with HashCache(args.hash_cache_size, args.hash_cache) as hash_cache:
+            restore_hardlinks(args.snapshot_file, algorithm=args.hash_algorithm, workers=args.workers,
+                              compare=args.compare, hash_cache=hash_cache, use_dir_fds=args.dir_fds,
+                              cross_device=args.cross_device, journal_file=journal_file, resume=args.resume,
+                              throttle=throttle)
+    elif args.action == 'dedupe':
+        # Deduplicate across the source folder and all target folders
+        with HashCache(args.hash_cache_size, args.hash_cache) as hash_cache:
+            dedupe([args.source_folder] + args.target_folders, args.snapshot_file, algorithm=args.hash_algorithm,
+                   workers=args.workers, min_size=args.min_size, hash_cache=hash_cache, dry_run=args.dry_run,
+                   throttle=throttle)
+    elif args.action == 'usage':
+        # Account the source folder and every target folder in one walk
+        disk_usage([args.source_folder] + args.target_folders, args.snapshot_file, workers=args.workers)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Entries kept in memory, and on disk when the cache is persisted
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+# Number of cache writes between commits of the on-disk copy
+COMMIT_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (dev, ino, algorithm)
+);
+CREATE INDEX IF NOT EXISTS hashes_used ON hashes (used);
+"""
+
+
+def stat_key(st):
+    """Identity of a file's content: (dev, ino, size, mtime_ns, ctime_ns)."""
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+class HashCache:
+    """LRU cache of content hashes keyed by inode identity, size and timestamps.
+
+    A file is hashed again only when its (dev, ino, size, mtime_ns, ctime_ns) changes; any write
+    to the file or change to its metadata moves ctime. With `db_path` the cache is also kept in a
+    SQLite database so it survives between runs; both the in-memory and on-disk copies are capped
+    at `max_entries`, least recently used first. Safe to use from several threads.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, db_path=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._used = 0
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+            self._used = self._conn.execute("SELECT COALESCE(MAX(used), 0) FROM hashes").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, key, algorithm):
+        """Return the cached digest for a stat_key, or None."""
+        with self._lock:
+            digest = self._entries.get((key, algorithm))
+            if digest is not None:
+                self._entries.move_to_end((key, algorithm))
+            elif self._conn is not None:
+                dev, ino, size, mtime_ns, ctime_ns = key
+                row = self._conn.execute(
+                    "SELECT digest FROM hashes WHERE dev = ? AND ino = ? AND algorithm = ?"
+                    " AND size = ? AND mtime_ns = ? AND ctime_ns = ?",
+                    (dev, ino, algorithm, size, mtime_ns, ctime_ns)).fetchone()
+                if row:
+                    digest = row[0]
+                    self._remember(key, algorithm, digest)
+            if digest is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return digest
+
+    def put(self, key, algorithm, digest):
+        """Store the digest of the file identified by a stat_key."""
+        with self._lock:
+            self._remember(key, algorithm, digest)
+
+    def _remember(self, key, algorithm, digest):
+        self._entries[(key, algorithm)] = digest
+        self._entries.move_to_end((key, algorithm))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self._conn is not None:
+            self._used += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hashes (dev, ino, algorithm, size, mtime_ns, ctime_ns, digest, used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (key[0], key[1], algorithm, *key[2:], digest, self._used))
+            if self._used % COMMIT_EVERY == 0:
+                self._conn.commit()
+
+    def carry_over(self, path, old_key, algorithm):
+        """Keep a digest valid after a change that only touched metadata, such as adding a link.
+
+        Linking a file bumps its ctime; if size and mtime are unchanged, the digest cached for
+        `old_key` is stored again under the file's new key.
+        """
+        digest = self.get(old_key, algorithm)
+        if digest is None:
+            return
+        try:
+            new_key = stat_key(os.stat(path))
+        except OSError:
+            return
+        if new_key[:4] == old_key[:4] and new_key != old_key:
+            self.put(new_key, algorithm, digest)
+
+    def close(self):
+        if self._conn is None:
+            return
+        with self._lock:
+            # Trim the database to the newest max_entries rows
+            self._conn.execute("DELETE FROM hashes WHERE used <= ?", (self._used - self.max_entries,))
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,238 @@
+import json
+import os
+import sqlite3
+import time
+
+from walker import DirListing, FileRecord
+
+# Directories modified this close to the moment they were listed are not trusted on the next run:
+# a file created within the same timestamp tick would leave the mtime unchanged
+RACY_WINDOW_NS = 2 * 10**9
+
+# Number of stored directory listings between commits
+COMMIT_EVERY = 1000
+
+# A live index (see index_watcher) is trusted while its watcher checked in at most this many
+# polling intervals ago
+LIVE_MISSED_INTERVALS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    id INTEGER PRIMARY KEY,
+    path BLOB UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    run INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    dir_id INTEGER NOT NULL,
+    name BLOB NOT NULL,
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    nlink INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir_id);
+CREATE TABLE IF NOT EXISTS subdirs (
+    dir_id INTEGER NOT NULL,
+    name BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS subdirs_dir ON subdirs (dir_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+
+class DirectoryCache:
+    """On-disk cache of directory listings, invalidated by each directory's mtime.
+
+    A directory's mtime changes whenever an entry is created, removed or renamed in it, so while it
+    is unchanged the cached names, devices and inode numbers are still accurate and the walker can
+    skip listing and stat'ing its files. The nlink, size and mtime of cached files are those seen
+    when the directory was last listed, since changes to file contents do not touch the directory.
+    With `changed_only`, the listing of an unchanged directory has its subdirectories but no files,
+    for callers that only act on what changed since the previous run. With `read_only`, the
+    database is opened for reading only and no run is started, so it can be read while another
+    process keeps it current.
+    """
+
+    def __init__(self, db_path, changed_only=False, read_only=False):
+        self.db_path = db_path
+        self.changed_only = changed_only
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            self.run = None
+            self.hits = 0
+            self.misses = 0
+        else:
+            self.conn = sqlite3.connect(db_path)
+            self.conn.executescript(SCHEMA)
+            self.begin_run()
+        self._pending = 0
+
+    @classmethod
+    def open_live(cls, db_path, roots):
+        """Open `db_path` read-only if a watcher keeps `roots` live in it (see is_live), else return None."""
+        try:
+            cache = cls(db_path, read_only=True)
+        except sqlite3.Error:
+            return None  # No database yet
+        try:
+            if cache.is_live(roots):
+                return cache
+        except sqlite3.Error:
+            pass  # Never written by a watcher
+        cache.close()
+        return None
+
+    def begin_run(self):
+        """Start a new run: directories not seen from now on are the ones prune() forgets."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()
+        self.run = (row[0] if row else 0) + 1
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('run', ?)", (self.run,))
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def lookup(self, dirpath):
+        """Return the cached mtime_ns of `dirpath`, or None if it has never been listed."""
+        row = self.conn.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (os.fsencode(dirpath),)).fetchone()
+        return row[0] if row else None
+
+    def load(self, dirpath, mtime_ns):
+        """Return the cached DirListing of an unchanged directory and mark it as seen."""
+        encoded = os.fsencode(dirpath)
+        dir_id = self.conn.execute("SELECT id FROM dirs WHERE path = ?", (encoded,)).fetchone()[0]
+        self.conn.execute("UPDATE dirs SET run = ? WHERE id = ?", (self.run, dir_id))
+        files = [] if self.changed_only else [
+            FileRecord(os.path.join(dirpath, os.fsdecode(name)), *stat)
+            for name, *stat in self.conn.execute(
+                "SELECT name, dev, ino, nlink, size, mtime_ns FROM files WHERE dir_id = ?", (dir_id,))]
+        subdirs = [os.path.join(dirpath, os.fsdecode(name))
+                   for name, in self.conn.execute("SELECT name FROM subdirs WHERE dir_id = ?", (dir_id,))]
+        self.hits += 1
+        self._tick()
+        return DirListing(dirpath, mtime_ns, files, subdirs)
+
+    def store(self, listing, listed_at_ns=None, complete=True):
+        """Replace the cached listing of a directory that was just read from disk."""
+        mtime_ns = listing.mtime_ns
+        listed_at_ns = listed_at_ns or time.time_ns()
+        if not complete or mtime_ns >= listed_at_ns - RACY_WINDOW_NS:
+            # Incomplete or too recent to trust; store it but force a fresh listing next time
+            mtime_ns = -1
+
+        encoded = os.fsencode(listing.path)
+        row = self.conn.execute("SELECT id FROM dirs WHERE path = ?", (encoded,)).fetchone()
+        if row:
+            dir_id = row[0]
+            self.conn.execute("UPDATE dirs SET mtime_ns = ?, run = ? WHERE id = ?", (mtime_ns, self.run, dir_id))
+            self.conn.execute("DELETE FROM files WHERE dir_id = ?", (dir_id,))
+            self.conn.execute("DELETE FROM subdirs WHERE dir_id = ?", (dir_id,))
+        else:
+            dir_id = self.conn.execute("INSERT INTO dirs (path, mtime_ns, run) VALUES (?, ?, ?)",
+                                       (encoded, mtime_ns, self.run)).lastrowid
+
+        self.conn.executemany(
+            "INSERT INTO files (dir_id, name, dev, ino, nlink, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(dir_id, os.fsencode(os.path.basename(record.path)), record.dev, record.ino, record.nlink,
+              record.size, record.mtime_ns) for record in listing.files])
+        self.conn.executemany(
+            "INSERT INTO subdirs (dir_id, name) VALUES (?, ?)",
+            [(dir_id, os.fsencode(os.path.basename(subdir))) for subdir in listing.subdirs])
+        self.misses += 1
+        self._tick()
+
+    def _tick(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.conn.commit()
+            self._pending = 0
+
+    def _delete_dirs(self, where, params):
+        self.conn.execute(f"DELETE FROM files WHERE dir_id IN (SELECT id FROM dirs WHERE {where})", params)
+        self.conn.execute(f"DELETE FROM subdirs WHERE dir_id IN (SELECT id FROM dirs WHERE {where})", params)
+        self.conn.execute(f"DELETE FROM dirs WHERE {where}", params)
+
+    def prune(self, roots):
+        """Forget directories below `roots` that were not seen during this run."""
+        if isinstance(roots, (str, bytes, os.PathLike)):
+            roots = [roots]
+        for root in roots:
+            self._delete_dirs("run != ? AND " + _SUBTREE, (self.run,) + _subtree_params(root))
+        self.conn.commit()
+
+    def invalidate(self, dirpath):
+        """Make the next walk list `dirpath` again even if its mtime is unchanged."""
+        self.conn.execute("UPDATE dirs SET mtime_ns = -1 WHERE path = ?", (os.fsencode(dirpath),))
+        self._tick()
+
+    def forget(self, dirpath):
+        """Forget a directory and everything below it, e.g. once it was removed."""
+        self._delete_dirs(_SUBTREE, _subtree_params(dirpath))
+        self._tick()
+
+    def set_live(self, roots, interval):
+        """Record that a watcher keeps the listings below `roots` current, checking in every `interval` seconds."""
+        self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                              [('live_roots', json.dumps([os.path.abspath(root) for root in roots])),
+                               ('live_interval', interval), ('live_heartbeat', time.time())])
+        self.conn.commit()
+
+    def clear_live(self):
+        self.conn.execute("DELETE FROM meta WHERE key IN ('live_roots', 'live_interval', 'live_heartbeat')")
+        self.conn.commit()
+
+    def is_live(self, roots):
+        """Whether a running watcher keeps every directory below `roots` current."""
+        meta = dict(self.conn.execute(
+            "SELECT key, value FROM meta WHERE key IN ('live_roots', 'live_interval', 'live_heartbeat')"))
+        if len(meta) < 3 or time.time() - meta['live_heartbeat'] > LIVE_MISSED_INTERVALS * meta['live_interval']:
+            return False
+        live_roots = json.loads(meta['live_roots'])
+        if isinstance(roots, (str, bytes, os.PathLike)):
+            roots = [roots]
+        return all(any(_is_below(os.path.abspath(root), live_root) for live_root in live_roots) for root in roots)
+
+    def iter_files(self, roots):
+        """Yield a FileRecord for every cached file below `roots`, without touching the disk.
+
+        Paths are rebuilt relative to each root as given, as a walk of that root would yield them.
+        """
+        if isinstance(roots, (str, bytes, os.PathLike)):
+            roots = [roots]
+        for root in roots:
+            absolute = os.path.abspath(root)
+            rows = self.conn.execute(
+                "SELECT dirs.path, files.name, dev, ino, nlink, size, files.mtime_ns FROM dirs "
+                "JOIN files ON files.dir_id = dirs.id WHERE " + _SUBTREE.replace("path", "dirs.path"),
+                _subtree_params(absolute))
+            for dirpath, name, *stat in rows:
+                relative = os.path.relpath(os.fsdecode(dirpath), absolute)
+                dirpath = root if relative == os.curdir else os.path.join(root, relative)
+                yield FileRecord(os.path.join(dirpath, os.fsdecode(name)), *stat)
+
+
+# Matches a directory and everything below it, given _subtree_params
+_SUBTREE = "(path = ? OR (path >= ? AND path < ?))"
+
+
+def _subtree_params(root):
+    # Paths below root sort between "root/" and "root0", '0' being the byte after '/'
+    encoded = os.fsencode(root).rstrip(b'/')
+    return encoded or b'/', encoded + b'/', encoded + b'0'
+
+
+def _is_below(path, root):
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
@@ -0,0 +1,266 @@
+import argparse
+import ctypes
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+
+from index_cache import RACY_WINDOW_NS, DirectoryCache, _is_below
+from walker import _list_directory, scan_tree
+
+# Seconds between heartbeats, and between full walks when polling
+DEFAULT_INTERVAL = 5
+
+# inotify flags and event bits from <sys/inotify.h>
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+# Only entries appearing, disappearing or being renamed change a directory's listing
+WATCH_MASK = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+              | IN_ONLYDIR | IN_DONT_FOLLOW)
+
+# struct inotify_event: wd, mask, cookie, len, followed by len bytes of NUL-padded name
+_EVENT = struct.Struct('iIII')
+
+# Bytes read from the inotify descriptor at once
+READ_SIZE = 64 * 1024
+
+
+class Inotify:
+    """Minimal ctypes binding of Linux inotify; raises OSError where it is not available."""
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        # The running interpreter already links libc
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd):
+        # Fails harmlessly if the kernel already dropped the watch with its directory
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Return the events that arrive within `timeout` seconds as (wd, mask, cookie, name) tuples."""
+        events = []
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        while ready:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class IndexWatcher:
+    """Keep the DirectoryCache listings below `roots` current as the trees change.
+
+    The trees are walked once (reusing listings whose directory mtime is unchanged) and every
+    directory is watched with inotify. From then on, only directories where an entry was created,
+    removed or renamed are listed again; a directory created or moved into a tree is walked and
+    watched, and one removed or moved out of it is forgotten. Without inotify, or with
+    `use_inotify` false, the trees are walked every `interval` seconds instead, which still
+    stats every directory. Either way the cache is marked live (see DirectoryCache.is_live), so
+    snapshots read the index from it instead of walking the target folders.
+    """
+
+    def __init__(self, roots, cache_file, interval=DEFAULT_INTERVAL, workers=None, use_inotify=True):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.interval = interval
+        self.workers = workers
+        self.cache = DirectoryCache(cache_file)
+        # Snapshots read the cache while the watcher writes it
+        self.cache.conn.execute("PRAGMA journal_mode=WAL")
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify()
+            except (OSError, AttributeError) as e:
+                print(f"inotify is not available ({e}); walking the trees every {interval} seconds.")
+        self.changes = 0
+        self._watches = {}  # wd -> directory path
+        self._dirty = set()
+        self._new_dirs = set()
+        self._resync = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.cache.clear_live()
+        self.cache.close()
+        if self.inotify:
+            self.inotify.close()
+
+    def _report_error(self, path, error):
+        print(f"Error processing {path}: {error}")
+
+    def _watch(self, listing):
+        try:
+            self._watches[self.inotify.add_watch(listing.path)] = listing.path
+            st = os.stat(listing.path)
+        except OSError as e:
+            # ENOSPC means fs.inotify.max_user_watches is too low for these trees
+            print(f"Cannot watch {listing.path}: {e}")
+            return
+        # Changes made between listing the directory and watching it produced no event
+        if st.st_mtime_ns != listing.mtime_ns or st.st_mtime_ns >= time.time_ns() - RACY_WINDOW_NS:
+            self._dirty.add(listing.path)
+
+    def _unwatch(self, dirpath):
+        for wd, path in list(self._watches.items()):
+            if _is_below(path, dirpath):
+                del self._watches[wd]
+                self.inotify.rm_watch(wd)
+
+    def _scan(self, roots):
+        for listing in scan_tree(roots, workers=self.workers, onerror=self._report_error, listing_cache=self.cache):
+            if self.inotify:
+                self._watch(listing)
+
+    def sync(self):
+        """Walk every root, reusing unchanged listings, watch each directory and forget vanished ones."""
+        # Snapshots walk the trees themselves until the walk is done
+        self.cache.clear_live()
+        self._resync = False
+        self.cache.begin_run()
+        self._scan(self.roots)
+        self.cache.prune(self.roots)
+        print(f"Indexed {len(self.roots)} roots: reused {self.cache.hits} cached directories, "
+              f"listed {self.cache.misses} from disk.")
+
+    def _lost_track(self):
+        # The index is missing changes until the next sync
+        self._resync = True
+        self.cache.clear_live()
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            print("Too many changes at once, some were lost; walking the trees again.")
+            self._lost_track()
+            return
+        dirpath = self._watches.get(wd)
+        if dirpath is None:
+            # A watch that was already removed
+            return
+        if mask & IN_IGNORED:
+            del self._watches[wd]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # Below a root, the parent directory reports the same change
+            if dirpath in self.roots:
+                print(f"{dirpath} was removed or moved; walking the trees again.")
+                self._lost_track()
+            return
+
+        self.changes += 1
+        self._dirty.add(dirpath)
+        if not mask & IN_ISDIR:
+            return
+        path = os.path.join(dirpath, name)
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            self._unwatch(path)
+            self.cache.forget(path)
+            self._new_dirs.discard(path)
+            self._dirty = {dirty for dirty in self._dirty if not _is_below(dirty, path)}
+        else:
+            self._new_dirs.add(path)
+
+    def _apply(self):
+        # A new directory inside another new one is walked with it
+        new_dirs = [path for path in self._new_dirs
+                    if not any(_is_below(path, other) for other in self._new_dirs if other != path)]
+        self._scan(new_dirs)
+        for dirpath in self._dirty - self._new_dirs:
+            try:
+                listing, errors, listed_at_ns = _list_directory(dirpath, None)
+            except FileNotFoundError:
+                # Removed meanwhile; its parent's event forgets it
+                continue
+            except OSError as e:
+                self._report_error(dirpath, e)
+                continue
+            for path, error in errors:
+                self._report_error(path, error)
+            self.cache.store(listing, listed_at_ns, complete=not errors)
+        self._dirty = set()
+        self._new_dirs = set()
+
+    def step(self, timeout=0):
+        """Wait up to `timeout` seconds for changes, apply them to the cache and check in."""
+        if self._resync or self.inotify is None:
+            self.sync()
+        if self.inotify:
+            for wd, mask, _, name in self.inotify.read(timeout):
+                self._handle(wd, mask, name)
+            self._apply()
+        if not self._resync:
+            self.cache.set_live(self.roots, self.interval)
+
+    def run(self, stop):
+        """Keep the index current until the `stop` event is set."""
+        while not stop.is_set():
+            self.step(self.interval if self.inotify else 0)
+            if self.inotify is None:
+                stop.wait(self.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep an index cache of target folders current, so snapshots need not walk them.")
+    parser.add_argument('index_cache', help="SQLite file to maintain (pass the same file to snapshot --index_cache)")
+    parser.add_argument('target_folders', nargs='+', help="Folders to watch")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help="Seconds between heartbeats, and between walks when polling")
+    parser.add_argument('--workers', type=int, default=None, help="Number of threads used to scan directories")
+    parser.add_argument('--poll', action='store_true', help="Walk the folders periodically instead of using inotify")
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    with IndexWatcher(args.target_folders, args.index_cache, interval=args.interval, workers=args.workers,
+                      use_inotify=not args.poll) as watcher:
+        watcher.run(stop)
+        print(f"Stopped after applying {watcher.changes} changes.")
+
+
+if __name__ == '__main__':
+    main()
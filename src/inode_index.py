@@ -0,0 +1,93 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+from path_table import PathTable
+
+
+class InodeIndex:
+    """Compact map of (st_dev, st_ino) to the paths that share that inode.
+
+    Entries are kept per device in two parallel arrays (inode numbers and path slots), which costs
+    about 12 bytes per file instead of a dict entry plus a list per inode. Paths live in a
+    PathTable, so each file adds only its basename. The arrays are sorted lazily on the first
+    lookup after an add, and lookups bisect them.
+    """
+
+    __slots__ = ('_devices', '_paths', '_sorted')
+
+    def __init__(self):
+        self._devices = {}
+        self._paths = PathTable()
+        self._sorted = True
+
+    def add(self, dev, ino, path):
+        """Record that `path` refers to inode `ino` on device `dev`."""
+        entry = self._devices.get(dev)
+        if entry is None:
+            entry = self._devices[dev] = (array('Q'), array('I'))
+        inos, slots = entry
+        inos.append(ino)
+        slots.append(self._paths.add(path))
+        self._sorted = False
+
+    def _sort(self):
+        for dev, (inos, slots) in self._devices.items():
+            order = sorted(range(len(inos)), key=inos.__getitem__)
+            self._devices[dev] = (array('Q', (inos[i] for i in order)), array('I', (slots[i] for i in order)))
+        self._sorted = True
+
+    def sort(self):
+        """Sort now rather than on the next lookup, e.g. before forking processes that share the index."""
+        if not self._sorted:
+            self._sort()
+
+    def _range(self, dev, ino):
+        if not self._sorted:
+            self._sort()
+        entry = self._devices.get(dev)
+        if entry is None:
+            return None, 0, 0
+        inos = entry[0]
+        start = bisect_left(inos, ino)
+        if start == len(inos) or inos[start] != ino:
+            return None, 0, 0
+        return entry[1], start, bisect_right(inos, ino, start)
+
+    def __contains__(self, key):
+        slots, _, _ = self._range(*key)
+        return slots is not None
+
+    def get(self, dev, ino):
+        """Return the paths recorded for (dev, ino), or an empty list."""
+        slots, start, end = self._range(dev, ino)
+        if slots is None:
+            return []
+        return [self._paths.path(slots[i]) for i in range(start, end)]
+
+    def __len__(self):
+        """Number of files (paths) in the index."""
+        return len(self._paths)
+
+    @property
+    def paths(self):
+        """The PathTable holding every indexed path."""
+        return self._paths
+
+    def devices(self):
+        return list(self._devices)
+
+    def items(self):
+        """Yield ((dev, ino), paths) for every inode, grouped by device in inode order."""
+        if not self._sorted:
+            self._sort()
+        for dev, (inos, slots) in self._devices.items():
+            start = 0
+            while start < len(inos):
+                ino = inos[start]
+                end = bisect_right(inos, ino, start)
+                yield (dev, ino), [self._paths.path(slots[i]) for i in range(start, end)]
+                start = end
+
+    def to_dict(self):
+        """Return a JSON-friendly {"dev:ino": [paths]} dict, used for the debug dump."""
+        return {f"{dev}:{ino}": paths for (dev, ino), paths in self.items()}
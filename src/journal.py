@@ -0,0 +1,83 @@
+import json
+import os
+
+JOURNAL_FORMAT = "hardlinker-journal"
+JOURNAL_VERSION = 1
+
+# Completed units buffered before they are written out and synced
+SYNC_EVERY = 10
+
+
+class Journal:
+    """Append-only record of completed units of work, so an interrupted run can resume.
+
+    The first line identifies the run (`key`, a JSON-friendly dict such as the action and the
+    files it works on); every further line is one completed unit. With `resume`, the units of a
+    previous run with the same key are loaded into `completed`; otherwise, or if the key
+    differs, the journal starts over. Units are buffered and appended with fsync every
+    `sync_every` records and on flush/close, so a crash redoes at most that many units. Each
+    flush is a single write to an O_APPEND descriptor, so forked processes that inherit the
+    journal can record units into it too.
+    """
+
+    def __init__(self, journal_file, key, resume=False, sync_every=SYNC_EVERY):
+        self.journal_file = journal_file
+        self.key = key
+        self.sync_every = sync_every
+        self.completed = []
+        self._pending = []
+        loaded = self._load() if resume else None
+        if loaded is None:
+            with open(journal_file, 'w', encoding='utf-8', errors='surrogateescape') as f:
+                f.write(json.dumps({"format": JOURNAL_FORMAT, "version": JOURNAL_VERSION, "key": key}) + '\n')
+        else:
+            self.completed = loaded
+            print(f"Resuming from {journal_file}: {len(loaded)} units already done.")
+        self._fd = os.open(journal_file, os.O_WRONLY | os.O_APPEND)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _load(self):
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                header = json.loads(f.readline() or 'null')
+                if not header or header.get("format") != JOURNAL_FORMAT or header.get("key") != self.key:
+                    print(f"Journal {self.journal_file} belongs to a different run; starting over.")
+                    return None
+                completed = []
+                for line in f:
+                    try:
+                        completed.append(json.loads(line))
+                    except ValueError:
+                        break  # A line cut short by the interruption
+                return completed
+        except FileNotFoundError:
+            print(f"No journal at {self.journal_file}; starting from the beginning.")
+            return None
+
+    def record(self, entry):
+        self._pending.append(json.dumps(entry) + '\n')
+        if len(self._pending) >= self.sync_every:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        os.write(self._fd, ''.join(self._pending).encode('utf-8', 'surrogateescape'))
+        os.fsync(self._fd)
+        self._pending = []
+
+    def close(self):
+        if self._fd is not None:
+            self.flush()
+            os.close(self._fd)
+            self._fd = None
+
+    def remove(self):
+        """Close and delete the journal once the run it describes has finished."""
+        self.close()
+        os.remove(self.journal_file)
@@ -0,0 +1,183 @@
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from fs_ops import PathOps
+
+PLAN_FORMAT = "hardlinker-plan"
+PLAN_VERSION = 1
+
+# Links issued at once; on network filesystems each link is a round trip to the server
+DEFAULT_LINK_WORKERS = 16
+
+# Links applied between progress reports
+APPLY_BATCH_SIZE = 1000
+
+# Summary counter for each way PathOps.link can succeed
+LINK_RESULTS = {"link": "linked", "reflink": "reflinked", "copy": "copied"}
+
+
+def _link(ops, src, dest):
+    """Link one file; returns how (see PathOps.link), or the exception that prevented it."""
+    try:
+        return ops.link(src, dest)
+    except Exception as e:
+        return e
+
+
+def _link_all(pairs, link_workers, ops):
+    """Link (src, dest) pairs from a pool of `link_workers` threads; yields (pair, result of _link).
+
+    Only a bounded number of links is in flight at once, so the pool never holds a future per file.
+    """
+    if link_workers <= 1:
+        for pair in pairs:
+            yield pair, _link(ops, *pair)
+        return
+    pairs = iter(pairs)
+    with ThreadPoolExecutor(max_workers=link_workers) as executor:
+        in_flight = {}
+        while True:
+            while len(in_flight) < link_workers * 4:
+                pair = next(pairs, None)
+                if pair is None:
+                    break
+                in_flight[executor.submit(_link, ops, *pair)] = pair
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield in_flight.pop(future), future.result()
+
+
+class LinkPlan:
+    """The directories to create and hardlinks to make, computed before anything is changed.
+
+    Links are grouped by target directory and keyed by name, so a target planned twice is kept
+    once (the first source wins). Operations come out sorted by directory, parents before
+    children, then by name. A plan can be saved as JSON, reviewed, and applied later without
+    scanning the source again.
+    """
+
+    def __init__(self):
+        self._dirs = {}
+        self._mkdirs = set()
+        self.existing = 0
+
+    def __len__(self):
+        return sum(len(links) for links in self._dirs.values())
+
+    def add_dir(self, dirpath):
+        self._dirs.setdefault(os.path.normpath(dirpath), {})
+
+    def add_link(self, src, dest):
+        dirpath, name = os.path.split(os.path.normpath(dest))
+        self._dirs.setdefault(dirpath, {}).setdefault(name, src)
+
+    def drop_existing(self):
+        """Plan mkdir for missing directories and drop links whose target name already exists.
+
+        Costs one listing per target directory rather than a stat per link.
+        """
+        self._mkdirs = set()
+        for dirpath, links in self._dirs.items():
+            try:
+                present = set(os.listdir(dirpath))
+            except FileNotFoundError:
+                self._mkdirs.add(dirpath)
+                continue
+            for name in present.intersection(links):
+                del links[name]
+                self.existing += 1
+
+    @property
+    def mkdirs(self):
+        """Directories to create, parents first."""
+        return sorted(self._mkdirs)
+
+    def links(self):
+        """Yield (src, dest) in directory, then name order."""
+        for dirpath in sorted(self._dirs):
+            links = self._dirs[dirpath]
+            for name in sorted(links):
+                yield links[name], os.path.join(dirpath, name)
+
+    def describe(self):
+        """Print every planned operation, for a dry run."""
+        for dirpath in self.mkdirs:
+            print(f"mkdir {dirpath}")
+        for src, dest in self.links():
+            print(f"link {src} -> {dest}")
+        print(f"Plan: {len(self._mkdirs)} directories to create, {len(self)} links to make, "
+              f"{self.existing} targets already exist.")
+
+    def to_dict(self):
+        return {
+            "format": PLAN_FORMAT,
+            "version": PLAN_VERSION,
+            "existing": self.existing,
+            "mkdirs": self.mkdirs,
+            "links": [[dirpath, sorted(self._dirs[dirpath].items())] for dirpath in sorted(self._dirs)],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("format") != PLAN_FORMAT or data.get("version") != PLAN_VERSION:
+            raise ValueError("Not a hardlinker plan, or an unsupported version")
+        plan = cls()
+        plan.existing = data["existing"]
+        plan._mkdirs = set(data["mkdirs"])
+        for dirpath, links in data["links"]:
+            plan._dirs[dirpath] = {name: src for name, src in links}
+        return plan
+
+    def save(self, plan_file):
+        with open(plan_file, 'w', encoding='utf-8', errors='surrogateescape') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, plan_file):
+        with open(plan_file, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            return cls.from_dict(json.load(f))
+
+
+def apply_plan(plan, link_workers=DEFAULT_LINK_WORKERS, batch_size=APPLY_BATCH_SIZE, cross_device='skip'):
+    """Create the plan's directories, then its links in batches from a bounded thread pool.
+
+    Links between filesystems are skipped, reflinked or copied according to `cross_device`.
+    Returns a dict with the number of files linked, reflinked, copied, already existing and
+    failed, and directories created. Errors are printed and do not stop the rest of the plan.
+    """
+    summary = {"linked": 0, "reflinked": 0, "copied": 0, "existing": plan.existing, "failed": 0,
+               "directories_created": 0}
+    ops = PathOps(cross_device)
+
+    # Directory skeleton first, so no link waits on a mkdir
+    for dirpath in plan.mkdirs:
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath, exist_ok=True)
+            summary["directories_created"] += 1
+
+    total = len(plan)
+    done = 0
+    for (src, dest), result in _link_all(plan.links(), link_workers, ops):
+        done += 1
+        if isinstance(result, FileExistsError):
+            summary["existing"] += 1
+        elif isinstance(result, Exception):
+            summary["failed"] += 1
+            print(f"Error creating hardlink: {src} -> {dest}")
+            print(f"Error message: {str(result)}")
+        else:
+            summary[LINK_RESULTS[result]] += 1
+        if done % batch_size == 0:
+            print(f"Applied {done}/{total} links...")
+    return summary
+
+
+def format_summary(summary):
+    fallbacks = ""
+    if summary['reflinked'] or summary['copied']:
+        fallbacks = f", reflinked {summary['reflinked']} and copied {summary['copied']} across filesystems"
+    return (f"Hardlinked {summary['linked']} files{fallbacks}, skipped {summary['existing']} existing, "
+            f"{summary['failed']} failed; created {summary['directories_created']} directories.")
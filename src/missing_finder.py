@@ -1,39 +1,149 @@
+import argparse
+import csv
+import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from inode_index import InodeIndex
+from walker import walk_files
 
 # Define a list of common video file extensions
 VIDEO_EXTENSIONS = {'.mp4', '.mkv', '.avi', '.mov', '.flv', '.wmv', '.mpeg', '.mpg', '.webm'}
 
-def find_video_files_with_no_hardlinks(target_directory):
+def is_video(filename):
+    return os.path.splitext(filename)[1].lower() in VIDEO_EXTENSIONS
+
+
+def find_video_files_with_no_hardlinks(target_directory, workers=None):
     if not os.path.isdir(target_directory):
         print(f"Error: {target_directory} is not a valid directory.")
         return
 
     print(f"Checking for video files with no hardlinks in '{target_directory}'...\n")
 
-    for root, dirs, files in os.walk(target_directory):
-        for filename in files:
-            file_path = os.path.join(root, filename)
-
-            # Check if the file has a video extension
-            if os.path.splitext(filename)[1].lower() in VIDEO_EXTENSIONS:
-                try:
-                    # Get file stats
-                    file_stat = os.stat(file_path)
-
-                    # Check the number of hard links (st_nlink)
-                    if file_stat.st_nlink == 1:
-                        print(f"Video file with no hardlinks: {file_path}")
-                
-                except FileNotFoundError:
-                    print(f"Warning: File not found (possibly a broken symlink): {file_path}")
-                except Exception as e:
-                    print(f"Error checking {file_path}: {e}")
+    def report_error(path, error):
+        if isinstance(error, FileNotFoundError):
+            print(f"Warning: File not found (possibly a broken symlink): {path}")
+        else:
+            print(f"Error checking {path}: {error}")
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python find_no_hardlinks.py <target_directory>")
-        sys.exit(1)
+    # Only files with a video extension are stat'ed; the walker skips the rest by name
+    for record in walk_files(target_directory, workers=workers, onerror=report_error, name_filter=is_video):
+        # Check the number of hard links (st_nlink)
+        if record.nlink == 1:
+            print(f"Video file with no hardlinks: {record.path}")
+
+
+def _report_error(path, error):
+    print(f"Error checking {path}: {error}")
+
+
+def build_library_index(library_roots, workers=None, name_filter=None):
+    """Index the (device, inode) of every library file that has other links, which may be downloads."""
+    index = InodeIndex()
+    for record in walk_files(library_roots, workers=workers, onerror=_report_error, name_filter=name_filter):
+        # A file with a single link cannot share its inode with a download
+        if record.nlink > 1:
+            index.add(record.dev, record.ino, record.path)
+    index.sort()
+    return index
+
+
+def _top_level(root, path):
+    """The first path component below `root`: a torrent's folder, or the file itself for single files."""
+    return os.path.relpath(path, root).split(os.sep)[0]
+
+
+def find_orphans(download_roots, library_roots, workers=None, all_files=False):
+    """Find download files with no link inside the library roots.
+
+    Unlike checking st_nlink == 1, a file whose only other links are in the downloads themselves
+    (or anywhere outside the library) is still an orphan. The library is indexed on a background
+    thread while the downloads are walked; both walks use `workers` threads. Only video files are
+    considered unless `all_files`. Returns a report dict: the orphans with their size, and the
+    orphaned files and bytes per top-level folder of each download root. A file's bytes are
+    counted once however many orphaned paths it has.
+    """
+    name_filter = None if all_files else is_video
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='library') as executor:
+        library_future = executor.submit(build_library_index, library_roots, workers, name_filter)
+        # Files with a single link are orphans without a lookup; the rest wait for the library index
+        candidates = []
+        for root in download_roots:
+            for record in walk_files(root, workers=workers, onerror=_report_error, name_filter=name_filter):
+                candidates.append((root, record))
+        library = library_future.result()
+    print(f"Indexed {len(library)} linked library files, checking {len(candidates)} download files.")
 
-    target_directory = sys.argv[1]
-    find_video_files_with_no_hardlinks(target_directory)
+    orphans = []
+    folders = {}
+    counted = set()
+    for root, record in candidates:
+        if record.nlink > 1 and (record.dev, record.ino) in library:
+            continue
+        folder = _top_level(root, record.path)
+        orphans.append({"path": record.path, "size": record.size, "root": root, "folder": folder})
+        totals = folders.setdefault((root, folder), {"root": root, "folder": folder, "files": 0, "bytes": 0})
+        totals["files"] += 1
+        if (record.dev, record.ino) not in counted:
+            counted.add((record.dev, record.ino))
+            totals["bytes"] += record.size
+
+    return {
+        "total_files": len(orphans),
+        "total_bytes": sum(totals["bytes"] for totals in folders.values()),
+        "folders": sorted(folders.values(), key=lambda totals: (-totals["bytes"], totals["root"], totals["folder"])),
+        "orphans": sorted(orphans, key=lambda orphan: orphan["path"]),
+    }
+
+
+def write_report(report, output_file, output_format=None):
+    """Save an orphan report as JSON (everything) or CSV (one row per top-level folder).
+
+    The format defaults to the file's extension; "-" writes to standard output.
+    """
+    if output_format is None:
+        output_format = 'csv' if output_file.lower().endswith('.csv') else 'json'
+    f = sys.stdout if output_file == '-' else open(output_file, 'w', newline='')
+    try:
+        if output_format == 'csv':
+            writer = csv.DictWriter(f, fieldnames=["root", "folder", "files", "bytes"])
+            writer.writeheader()
+            writer.writerows(report["folders"])
+        else:
+            json.dump(report, f, indent=4)
+            f.write('\n')
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find downloaded video files that are not linked anywhere else.")
+    parser.add_argument('download_roots', nargs='+', help="Download folders to check")
+    parser.add_argument('--library_roots', nargs='+', default=None,
+                        help="Library folders; report download files with no link inside them")
+    parser.add_argument('--output', default=None, help="Save the orphan report to this file (- for stdout)")
+    parser.add_argument('--format', choices=['json', 'csv'], default=None,
+                        help="Report format (default: from the --output extension, else JSON)")
+    parser.add_argument('--all_files', action='store_true', help="Check every file, not only video files")
+    parser.add_argument('--workers', type=int, default=None, help="Number of threads used to scan directories")
+    args = parser.parse_args()
+
+    if not args.library_roots:
+        # Without library roots, any file with a single link is reported
+        for target_directory in args.download_roots:
+            find_video_files_with_no_hardlinks(target_directory, workers=args.workers)
+        return
+
+    report = find_orphans(args.download_roots, args.library_roots, workers=args.workers, all_files=args.all_files)
+    for totals in report["folders"]:
+        print(f"{totals['bytes']:>15} bytes in {totals['files']} files: {os.path.join(totals['root'], totals['folder'])}")
+    print(f"{report['total_files']} orphaned files, {report['total_bytes']} bytes in total.")
+    if args.output:
+        write_report(report, args.output, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,222 @@
+import argparse
+import json
 import os
-import shutil
-
-# Define the source and target directories
-source_dir = "/mnt/storage/media/downloads"
-target_dir = "/mnt/storage/media/hardlinks/missing/"
-
-# Iterate over all subdirectories and files in the source directory
-for root, dirs, files in os.walk(source_dir):
-    # Extract the first level of subdirectory
-    relative_path = os.path.relpath(root, source_dir).split(os.sep)[0]
-
-    # Only process files in subdirectories, not the root
-    if relative_path == '.':
-        continue
-
-    # Check each file in the subdirectory
-    for file in files:
-        if file.endswith(".mkv"):
-            # Get the full path of the file
-            file_path = os.path.join(root, file)
-
-            # Check if the file has no hardlinks (link count == 1)
-            if os.stat(file_path).st_nlink == 1:
-                # Create the corresponding target subdirectory
-                target_subdir = os.path.join(target_dir, relative_path)
-                os.makedirs(target_subdir, exist_ok=True)
-
-                # Define the target hardlink path
-                target_file_path = os.path.join(target_subdir, file)
-
-                # Create a hardlink in the target directory
-                try:
-                    os.link(file_path, target_file_path)
-                    print(f"Created hardlink: {target_file_path}")
-                except FileExistsError:
-                    print(f"Hardlink already exists: {target_file_path}")
-                except Exception as e:
-                    print(f"Error creating hardlink for {file_path}: {e}")
+import sys
+
+from index_cache import DirectoryCache
+from link_plan import LinkPlan, apply_plan, format_summary
+from walker import walk_files
+
+# config.json next to the script, as for qbit_linker; its "missing_linker" section configures this script
+DEFAULT_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+
+# Settings used for anything the "missing_linker" section leaves out:
+#   roots       downloads folder -> folder its unlinked files are linked into
+#   extensions  file extensions considered, case-insensitively
+#   state_file  SQLite file keeping directory mtimes and linked files between runs (None: none)
+DEFAULT_SETTINGS = {
+    "roots": {"/mnt/storage/media/downloads": "/mnt/storage/media/hardlinks/missing/"},
+    "extensions": [".mkv"],
+    "state_file": None,
+}
+
+# Files already linked, identified by inode, size and mtime so a reused inode number is a new file;
+# `dir` ties each row to a cached directory, so rows of files no longer there are dropped with it
+PROCESSED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    dir BLOB NOT NULL,
+    PRIMARY KEY (dev, ino, size, mtime_ns)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS processed_dir ON processed (dir);
+"""
+
+
+def load_settings(config_path=None):
+    """Return the "missing_linker" section of the configuration, completed with DEFAULT_SETTINGS."""
+    config_path = config_path or DEFAULT_CONFIG_FILE
+    try:
+        with open(config_path, 'r') as f:
+            section = json.load(f).get("missing_linker", {})
+    except FileNotFoundError:
+        print(f"Configuration file not found: {config_path}, using the default settings.")
+        section = {}
+    except json.JSONDecodeError as e:
+        print(f"Error: invalid JSON in configuration file {config_path}: {e}")
+        sys.exit(1)
+    settings = dict(DEFAULT_SETTINGS, **section)
+    if settings["state_file"] and not os.path.isabs(settings["state_file"]):
+        # Relative to the configuration, so cron jobs need not run from a particular directory
+        settings["state_file"] = os.path.join(os.path.dirname(os.path.abspath(config_path)), settings["state_file"])
+    return settings
+
+
+class ScanState(DirectoryCache):
+    """What previous runs saw, so a run only looks at new or changed directories.
+
+    Directory listings are cached by mtime (see DirectoryCache), and the files of unchanged
+    directories are not even loaded. The files already linked are remembered too, so a file
+    seen again because something else changed in its directory is not linked a second time,
+    even if its link was since removed from the target. A file is identified by its inode, size
+    and mtime, and is forgotten once its directory is listed without it or is removed, so a new
+    download that reuses an inode number is still linked. With `rescan`, every directory is
+    listed again, which catches files whose link count dropped in an unchanged directory.
+    """
+
+    def __init__(self, db_path, rescan=False):
+        super().__init__(db_path, changed_only=True)
+        self.conn.executescript(PROCESSED_SCHEMA)
+        self.rescan = rescan
+        self.pending = {}  # planned source path -> (FileRecord, target path)
+
+    def lookup(self, dirpath):
+        return None if self.rescan else super().lookup(dirpath)
+
+    def is_processed(self, record):
+        return self.conn.execute("SELECT 1 FROM processed WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+                                 (record.dev, record.ino, record.size, record.mtime_ns)).fetchone() is not None
+
+    def store(self, listing, listed_at_ns=None, complete=True):
+        super().store(listing, listed_at_ns, complete)
+        if not complete:
+            return
+        # Forget linked files that are no longer in the directory
+        present = {(record.dev, record.ino, record.size, record.mtime_ns) for record in listing.files}
+        rows = self.conn.execute("SELECT dev, ino, size, mtime_ns FROM processed WHERE dir = ?",
+                                 (os.fsencode(listing.path),)).fetchall()
+        self.conn.executemany("DELETE FROM processed WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+                              [row for row in rows if row not in present])
+
+    def prune(self, roots):
+        super().prune(roots)
+        self.conn.execute("DELETE FROM processed WHERE dir NOT IN (SELECT path FROM dirs)")
+        self.conn.commit()
+
+    def finish(self):
+        """Remember the planned files that now exist in the target; the others are retried next run."""
+        processed = []
+        for source, (record, target) in self.pending.items():
+            if os.path.lexists(target):
+                processed.append((record.dev, record.ino, record.size, record.mtime_ns,
+                                  os.fsencode(os.path.dirname(source))))
+            else:
+                self.invalidate(os.path.dirname(source))
+        self.conn.executemany("INSERT OR REPLACE INTO processed (dev, ino, size, mtime_ns, dir) VALUES (?, ?, ?, ?, ?)",
+                              processed)
+        self.conn.commit()
+        self.pending = {}
+
+
+def _add_missing(plan, source_dir, target_dir, workers, extensions, state):
+    suffixes = tuple(extension.lower() for extension in extensions)
+    # Only files with a matching extension are stat'ed
+    for record in walk_files(source_dir, workers=workers, name_filter=lambda name: name.lower().endswith(suffixes),
+                             listing_cache=state):
+        # Extract the first level of subdirectory
+        relative_path = os.path.relpath(os.path.dirname(record.path), source_dir).split(os.sep)[0]
+
+        # Only process files in subdirectories, not the root
+        if relative_path == '.':
+            continue
+
+        # Check if the file has no hardlinks (link count == 1)
+        if record.nlink == 1 and not (state and state.is_processed(record)):
+            # Files from nested folders land flat in the corresponding target subdirectory
+            target_file = os.path.join(target_dir, relative_path, os.path.basename(record.path))
+            plan.add_link(record.path, target_file)
+            if state:
+                state.pending[record.path] = (record, target_file)
+
+    if state:
+        state.prune(source_dir)
+        print(f"{source_dir}: skipped {state.hits} unchanged directories, listed {state.misses} from disk.")
+
+
+def plan_missing(source_dir, target_dir, workers=None, extensions=DEFAULT_SETTINGS["extensions"], state=None):
+    """Plan a hardlink into target_dir for every unlinked file below source_dir's subdirectories.
+
+    Only files with one of `extensions` are considered. With `state` (a ScanState), directories
+    unchanged since the previous run and inodes it already linked are skipped.
+    """
+    plan = LinkPlan()
+    _add_missing(plan, source_dir, target_dir, workers, extensions, state)
+    # Each target subdirectory is checked, and later created, once for all of its files
+    plan.drop_existing()
+    return plan
+
+
+def link_missing(source_dir, target_dir, workers=None, dry_run=False, extensions=DEFAULT_SETTINGS["extensions"],
+                 state=None):
+    """Hardlink every unlinked file below source_dir's subdirectories into target_dir.
+
+    With `dry_run` the plan is printed and returned instead of applied. With `state`, see plan_missing.
+    """
+    plan = plan_missing(source_dir, target_dir, workers=workers, extensions=extensions, state=state)
+    if dry_run:
+        plan.describe()
+        return plan
+    summary = apply_plan(plan)
+    if state:
+        state.finish()
+    print(format_summary(summary))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hardlink files that have no other links into a folder.")
+    parser.add_argument('--config', default=None,
+                        help="Configuration file with a \"missing_linker\" section (default: config.json next to the script)")
+    parser.add_argument('--source_dir', default=None, help="Downloads folder to search (instead of the configured roots)")
+    parser.add_argument('--target_dir', default=None, help="Folder to link unlinked files into (with --source_dir)")
+    parser.add_argument('--extensions', nargs='+', default=None, help="File extensions to link, e.g. .mkv .mp4")
+    parser.add_argument('--state_file', default=None, help="SQLite file keeping scan state between runs")
+    parser.add_argument('--rescan', action='store_true',
+                        help="List every directory again, not only changed ones; files already linked are still skipped")
+    parser.add_argument('--workers', type=int, default=None, help="Number of threads used to scan directories")
+    parser.add_argument('--dry_run', action='store_true',
+                        help="Print the planned operations without linking (scans everything, keeps no state)")
+    parser.add_argument('--plan_file', help="Save the plan to this JSON file")
+    parser.add_argument('--apply_plan', help="Apply a previously saved plan instead of scanning")
+    args = parser.parse_args()
+
+    settings = load_settings(args.config)
+    roots = settings["roots"]
+    if args.source_dir:
+        if not args.target_dir:
+            parser.error("--source_dir needs --target_dir")
+        roots = {args.source_dir: args.target_dir}
+    extensions = args.extensions or settings["extensions"]
+    state_file = args.state_file or settings["state_file"]
+
+    state = None
+    if state_file and not args.dry_run and not args.apply_plan:
+        state = ScanState(state_file, rescan=args.rescan)
+    try:
+        if args.apply_plan:
+            plan = LinkPlan.load(args.apply_plan)
+        else:
+            # One plan for all roots, so each target subdirectory is checked and created once per run
+            plan = LinkPlan()
+            for source_dir, target_dir in roots.items():
+                if state:
+                    state.begin_run()
+                _add_missing(plan, source_dir, target_dir, args.workers, extensions, state)
+            plan.drop_existing()
+        if args.plan_file:
+            plan.save(args.plan_file)
+            print(f"Plan saved to {args.plan_file}")
+        if args.dry_run:
+            plan.describe()
+        else:
+            print(format_summary(apply_plan(plan)))
+            if state:
+                state.finish()
+    finally:
+        if state:
+            state.close()
+
+if __name__ == "__main__":
+    main()
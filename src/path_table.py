@@ -0,0 +1,76 @@
+import os
+from array import array
+
+
+def _encode(name):
+    return name.encode('utf-8', 'surrogateescape')
+
+
+def _decode(data):
+    return data.decode('utf-8', 'surrogateescape')
+
+
+class PathTable:
+    """Prefix-compressed table of file paths.
+
+    Every directory is stored once and each file is a (dir_id, basename) pair, with the basenames
+    packed back to back in a single bytearray. Deep, repetitive trees such as
+    `/media/hardlinks/shows/<Series>/Season 01/` then cost one string per directory rather than
+    one full path string per file.
+    """
+
+    __slots__ = ('_dir_ids', '_dirs', '_file_dirs', '_names', '_name_ends')
+
+    def __init__(self):
+        self._dir_ids = {}
+        self._dirs = []
+        self._file_dirs = array('I')
+        self._names = bytearray()
+        self._name_ends = array('Q')
+
+    def dir_id(self, dirpath):
+        """Return the id of `dirpath`, adding it to the table if needed."""
+        dir_id = self._dir_ids.get(dirpath)
+        if dir_id is None:
+            dir_id = self._dir_ids[dirpath] = len(self._dirs)
+            self._dirs.append(dirpath)
+        return dir_id
+
+    def directory(self, dir_id):
+        return self._dirs[dir_id]
+
+    @property
+    def dirs(self):
+        """All directories in id order."""
+        return self._dirs
+
+    def add_entry(self, dir_id, name):
+        """Add the file `name` in directory `dir_id` and return its file id."""
+        self._file_dirs.append(dir_id)
+        self._names += _encode(name)
+        self._name_ends.append(len(self._names))
+        return len(self._file_dirs) - 1
+
+    def add(self, path):
+        """Add a full file path and return its file id."""
+        dirpath, name = os.path.split(path)
+        return self.add_entry(self.dir_id(dirpath), name)
+
+    def split(self, path):
+        """Return the (dir_id, basename) pair for a full path, interning its directory."""
+        dirpath, name = os.path.split(path)
+        return self.dir_id(dirpath), name
+
+    def entry(self, file_id):
+        """Return the (dir_id, basename) pair of a file."""
+        start = self._name_ends[file_id - 1] if file_id else 0
+        return self._file_dirs[file_id], _decode(self._names[start:self._name_ends[file_id]])
+
+    def path(self, file_id):
+        """Return the full path of a file."""
+        dir_id, name = self.entry(file_id)
+        return os.path.join(self._dirs[dir_id], name)
+
+    def __len__(self):
+        """Number of files in the table."""
+        return len(self._file_dirs)
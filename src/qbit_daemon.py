@@ -0,0 +1,214 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Socket shared by the daemon and the hook client
+DEFAULT_SOCKET = os.environ.get('QBIT_LINKER_SOCKET', '/tmp/qbit_linker.sock')
+
+# Jobs linked at once, and jobs waiting or running before new ones are refused
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PENDING = 10000
+
+# How long the client waits for the daemon to acknowledge a job
+CLIENT_TIMEOUT = 5.0
+
+
+class LinkDaemon:
+    """Long-running qbit_linker that links jobs submitted over a Unix domain socket.
+
+    The configuration is loaded once. Jobs are (content_path, category) pairs run on a bounded
+    pool of `workers` threads; a job identical to one still queued or running is merged into it
+    instead of being linked twice, and at most `max_pending` jobs are held at once.
+    The protocol is one JSON object per line in each direction:
+        {"content_path": ..., "category": ..., "wait": false}  ->  {"status": "queued"|"merged"|"busy"}
+    With "wait": true the reply is sent once the job finished: {"status": "done"|"error", ...}.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, config_path=None, config_data=None,
+                 workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING):
+        # Imported here so the hook client never loads the linker unless it has to
+        import qbit_linker
+
+        self.qbit_linker = qbit_linker
+        self.socket_path = socket_path
+        self.config_path = config_path
+        self.config = qbit_linker.load_config(config_path, config_data)
+        self.resolver = qbit_linker.CategoryResolver(self.config)
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='link')
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    response = daemon.handle_request(line)
+                    self.wfile.write((json.dumps(response) + '\n').encode())
+                    self.wfile.flush()
+
+        self._remove_stale_socket()
+        self._server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        self._server.daemon_threads = True
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.remove(self.socket_path)
+        else:
+            raise RuntimeError(f"Another daemon is already listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+    def reload_config(self):
+        """Re-read the configuration file; jobs already running keep the old one.
+
+        A missing or invalid file is logged and the previous configuration stays in use.
+        """
+        try:
+            config = self.qbit_linker.load_config(self.config_path)
+            resolver = self.qbit_linker.CategoryResolver(config)
+        except SystemExit:
+            # load_config already logged why
+            logging.error("Configuration not reloaded; keeping the previous one")
+            return
+        except (KeyError, TypeError, AttributeError) as e:
+            logging.error("Configuration not reloaded, keeping the previous one: invalid %s", e)
+            return
+        self.config, self.resolver = config, resolver
+        logging.info("Configuration reloaded")
+
+    def submit(self, content_path, category):
+        """Queue a job; returns (status, future) where status is "queued", "merged" or "busy"."""
+        key = (content_path, category)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return "merged", future
+            if len(self._pending) >= self.max_pending:
+                return "busy", None
+            future = self._pending[key] = self._executor.submit(self._run, key, self.config, self.resolver)
+            return "queued", future
+
+    def _run(self, key, config, resolver):
+        try:
+            return self.qbit_linker.link_torrent(config, *key, resolver=resolver)
+        except SystemExit as e:
+            # create_hardlinks exits when the source is missing; keep the daemon alive
+            raise RuntimeError(f"Linking {key[0]} failed (exit status {e.code})") from None
+        finally:
+            with self._lock:
+                del self._pending[key]
+
+    def handle_request(self, line):
+        try:
+            request = json.loads(line)
+            status, future = self.submit(request["content_path"], request["category"])
+        except (ValueError, KeyError, TypeError) as e:
+            return {"status": "error", "error": f"Invalid request: {e}"}
+        if not request.get("wait") or future is None:
+            return {"status": status}
+        try:
+            return {"status": "done", "destination": future.result()}
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+
+    def serve_forever(self):
+        logging.info("qbit_linker daemon listening on %s", self.socket_path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._executor.shutdown(wait=True)
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        self._server.shutdown()
+
+
+def submit_job(content_path, category, socket_path=DEFAULT_SOCKET, wait=False, timeout=CLIENT_TIMEOUT):
+    """Send one job to a running daemon and return its JSON response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(None if wait else timeout)
+        client.connect(socket_path)
+        request = {"content_path": content_path, "category": category, "wait": wait}
+        client.sendall((json.dumps(request) + '\n').encode())
+        with client.makefile('rb') as reply:
+            return json.loads(reply.readline())
+
+
+def serve(args):
+    import qbit_linker
+    qbit_linker.setup_logging()
+    daemon = LinkDaemon(args.socket, args.config, workers=args.workers, max_pending=args.max_pending)
+    signal.signal(signal.SIGHUP, lambda signum, frame: daemon.reload_config())
+    # serve_forever must be stopped from another thread than the one running it
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=daemon.shutdown).start())
+    daemon.serve_forever()
+
+
+def submit(args):
+    try:
+        response = submit_job(args.content_path, args.category, args.socket, wait=args.wait)
+    except (FileNotFoundError, ConnectionRefusedError):
+        reason = f"no qbit_linker daemon listening on {args.socket}"
+    except socket.timeout:
+        # Linking twice is harmless: existing links are kept
+        reason = f"the qbit_linker daemon on {args.socket} did not answer in time"
+    else:
+        if response.get("status") == "error":
+            print(f"Error: {response.get('error')}")
+            sys.exit(1)
+        if response.get("status") != "busy":
+            return
+        reason = "the qbit_linker daemon queue is full"
+    if not args.fallback:
+        print(f"Error: {reason}")
+        sys.exit(1)
+    # The daemon cannot take the job: link in this process like the plain hook would
+    import qbit_linker
+    qbit_linker.setup_logging()
+    logging.info("Linking in-process: %s", reason)
+    qbit_linker.link_torrent(qbit_linker.load_config(args.config), args.content_path, args.category)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run qbit_linker as a daemon, or submit a job to it.")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument('--config', default=None, help="Configuration file (default: config.json next to the script)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="Start the daemon")
+    serve_parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Jobs linked at once")
+    serve_parser.add_argument('--max_pending', type=int, default=DEFAULT_MAX_PENDING,
+                              help="Queued jobs held before new ones are refused")
+    serve_parser.set_defaults(handler=serve)
+
+    submit_parser = subparsers.add_parser('submit', help="Queue a torrent (use from qBittorrent's run-on-completion hook)")
+    submit_parser.add_argument('content_path')
+    submit_parser.add_argument('category')
+    submit_parser.add_argument('--wait', action='store_true', help="Wait until the job has been linked")
+    submit_parser.add_argument('--no_fallback', dest='fallback', action='store_false',
+                               help="Fail instead of linking in-process when no daemon is running, "
+                                    "it is busy or it does not answer")
+    submit_parser.set_defaults(handler=submit)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
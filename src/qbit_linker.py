@@ -1,8 +1,14 @@
 import sys
 import os
 import json
+import atexit
 import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 
 # Add the current directory to the Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -12,13 +18,78 @@ from raw_linker import create_hardlinks
 # Default path to the configuration file
 DEFAULT_CONFIG_FILE = 'config.json'
 LOG_FILE = 'qbit_linker.log'
+# Torrents linked at once in --batch mode
+DEFAULT_BATCH_WORKERS = 4
 
-# Set up logging
-logging.basicConfig(
-    filename=os.path.join(os.path.dirname(os.path.abspath(__file__)), LOG_FILE),
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Logging defaults; the hook has no options of its own, so these come from the environment
+LOG_LEVEL = os.environ.get('QBIT_LINKER_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('QBIT_LINKER_LOG_FORMAT', 'text')  # 'text' or 'json'
+TEXT_LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Record attributes passed through `extra` that JSON output keeps as fields
+STRUCTURED_FIELDS = ('job', 'span', 'duration_ms')
+
+_listener = None
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+def setup_logging(log_file=None, level=LOG_LEVEL, json_format=(LOG_FORMAT == 'json')):
+    """Log through a queue drained by a background thread that writes `log_file`.
+
+    Logging calls only enqueue the record, so jobs running at once never wait on each other for
+    the file. Calling this again replaces the previous setup. Entry points call it; importing
+    this module configures no logging.
+    """
+    global _listener
+    stop_logging()
+    handler = logging.FileHandler(log_file or os.path.join(os.path.dirname(os.path.abspath(__file__)), LOG_FILE))
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, QueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    _listener = QueueListener(log_queue, handler)
+    _listener.start()
+
+def stop_logging():
+    """Write out any queued records and close the log file."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+@contextmanager
+def timed(span, job=None):
+    """Log how long the enclosed block took, with `span` and `duration_ms` as structured fields."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = round((time.perf_counter() - start) * 1000, 3)
+        logging.info("%s took %.3f ms", span, duration_ms,
+                     extra={'job': job, 'span': span, 'duration_ms': duration_ms})
+
+atexit.register(stop_logging)
 
 def load_config(config_path=None, config_data=None):
     logging.info("Loading configuration...")
@@ -27,7 +98,7 @@ def load_config(config_path=None, config_data=None):
         return json.loads(config_data)
     
     config_path = config_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), DEFAULT_CONFIG_FILE)
-    logging.info(f"Loading config from file: {config_path}")
+    logging.info("Loading config from file: %s", config_path)
     try:
         with open(config_path, 'r') as f:
             config = json.load(f)
@@ -40,84 +111,175 @@ def load_config(config_path=None, config_data=None):
         logging.error(f"Invalid JSON in configuration file: {config_path}")
         sys.exit(1)
 
+class CategoryResolver:
+    """Configuration compiled once for fast, repeated path resolution.
+
+    `category_map` becomes a trie keyed on case-folded category segments (the first key wins
+    when two differ only in case) and resolved categories are memoised. `root_mapping` sources
+    are grouped by length so the longest matching prefix is found with one dict lookup per
+    distinct length.
+    """
+
+    def __init__(self, config):
+        self.root_default_directory = config['root_default_directory']
+        self._trie = self._compile(config['category_map'])
+        self._destinations = {}
+        self._root_mappings = {}
+        for source, dest in config.get('root_mapping', {}).items():
+            self._root_mappings.setdefault(len(source), {}).setdefault(source, dest)
+        self._root_lengths = sorted(self._root_mappings, reverse=True)
+        # Extra create_hardlinks arguments, e.g. "cross_device": "copy" for mergerfs branches
+        self.link_options = {'cross_device': config['cross_device']} if 'cross_device' in config else {}
+
+    @classmethod
+    def _compile(cls, category_map):
+        trie = {}
+        for key, value in category_map.items():
+            if key.lower() not in trie:
+                trie[key.lower()] = value if isinstance(value, str) else cls._compile(value)
+        return trie
+
+    def destination(self, category):
+        """Return the destination folder for a (possibly nested, '/'-separated) category."""
+        result = self._destinations.get(category)
+        if result is None:
+            result = self._destinations[category] = self._resolve(category)
+        return result
+
+    def _resolve(self, category):
+        category_parts = category.split('/')
+        node = self._trie
+        for i, part in enumerate(category_parts):
+            entry = node.get(part.lower())
+            if entry is None:
+                break
+            if isinstance(entry, str):
+                # Leaf node: the configured folder plus any remaining segments
+                return os.path.join(entry, *category_parts[i+1:])
+            node = entry
+        # No leaf reached: the category's own segments below the default directory
+        return os.path.join(self.root_default_directory, *category_parts)
+
+    def map_root(self, path):
+        """Rewrite the longest matching root_mapping prefix of `path`."""
+        for length in self._root_lengths:
+            dest = self._root_mappings[length].get(path[:length])
+            if dest is not None:
+                return dest + path[length:]
+        return path
+
 def get_destination_folder(config, category):
-    logging.info(f"Getting destination folder for category: {category}")
-    category_parts = category.split('/')
-    current_map = config['category_map']
-    path_parts = []
-
-    for i, part in enumerate(category_parts):
-        logging.debug(f"Processing part: {part}")
-        lower_part = part.lower()
-        if lower_part in [k.lower() for k in current_map.keys()]:
-            key = next(k for k in current_map.keys() if k.lower() == lower_part)
-            logging.debug(f"Match found in config: {key}")
-            if isinstance(current_map[key], str):
-                result = os.path.join(current_map[key], *category_parts[i+1:])
-                logging.info(f"Leaf node reached. Final path: {result}")
-                return result
-            else:
-                path_parts.append(part)
-                logging.debug(f"Added to path: {part}")
-                current_map = current_map[key]
-        else:
-            logging.debug(f"No match found for: {part}")
-            if path_parts:
-                result = os.path.join(config['root_default_directory'], *path_parts, *category_parts[i:])
-            else:
-                result = os.path.join(config['root_default_directory'], *category_parts)
-            logging.info(f"Using default directory. Final path: {result}")
-            return result
-    
-    if path_parts:
-        result = os.path.join(config['root_default_directory'], *path_parts)
-    else:
-        result = os.path.join(config['root_default_directory'], *category_parts)
-    logging.info(f"Reached end of category parts. Final path: {result}")
+    result = CategoryResolver(config).destination(category)
+    logging.debug("Destination folder for category %s: %s", category, result)
     return result
 
 def apply_root_mapping(config, path):
-    for source, dest in config.get('root_mapping', {}).items():
-        if path.startswith(source):
-            mapped_path = path.replace(source, dest, 1)
-            logging.info(f"Applied root mapping: {path} -> {mapped_path}")
-            return mapped_path
-    return path
+    mapped_path = CategoryResolver(config).map_root(path)
+    if mapped_path != path:
+        logging.debug("Applied root mapping: %s -> %s", path, mapped_path)
+    return mapped_path
+
+def link_torrent(config, content_path, category, resolver=None):
+    """Hardlink one torrent's content into the destination folder for its category.
+
+    Pass a CategoryResolver built from `config` to avoid compiling it again for every torrent.
+    """
+    resolver = resolver or CategoryResolver(config)
+    logging.debug("Original content path: %s, category: %s", content_path, category)
+
+    with timed("resolve", content_path):
+        # Apply root mapping to content_path
+        mapped_content_path = resolver.map_root(content_path)
+        dest_folder = resolver.destination(category)
+        full_dest_path = os.path.join(dest_folder, os.path.basename(mapped_content_path))
+    logging.debug("Mapped content path: %s, destination folder: %s", mapped_content_path, dest_folder)
+
+    with timed("makedirs", content_path):
+        os.makedirs(os.path.dirname(full_dest_path), exist_ok=True)
+
+    with timed("link", content_path):
+        create_hardlinks(mapped_content_path, full_dest_path, **resolver.link_options)
+
+    logging.info("Hardlinks created: %s -> %s", mapped_content_path, full_dest_path)
+    return full_dest_path
+
+def read_batch(batch_file):
+    """Yield (content_path, category) pairs from a batch file, or stdin for "-".
+
+    Each line is either `content_path<TAB>category` or a JSON object with those two keys.
+    """
+    f = sys.stdin if batch_file == '-' else open(batch_file, 'r')
+    try:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            if line.lstrip().startswith('{'):
+                try:
+                    job = json.loads(line)
+                    job = job['content_path'], job['category']
+                except (ValueError, KeyError):
+                    logging.error("Skipping malformed batch line %d: %s", line_number, line)
+                    continue
+                yield job
+            elif '\t' in line:
+                content_path, category = line.split('\t', 1)
+                yield content_path, category
+            else:
+                logging.error("Skipping malformed batch line %d: %s", line_number, line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def link_batch(config, jobs, workers=DEFAULT_BATCH_WORKERS):
+    """Link many (content_path, category) jobs in this process; returns (linked, failed) counts."""
+    resolver = CategoryResolver(config)
+    unique_jobs = list(dict.fromkeys(jobs))
+    linked = failed = 0
+
+    def run(job):
+        try:
+            link_torrent(config, *job, resolver=resolver)
+            return True
+        except (Exception, SystemExit) as e:
+            # create_hardlinks exits when a source is missing; that only fails this job
+            logging.error("Failed to link %s (%s): %r", job[0], job[1], e)
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for ok in executor.map(run, unique_jobs):
+            if ok:
+                linked += 1
+            else:
+                failed += 1
+
+    logging.info("Batch complete: %d linked, %d failed, %d unique jobs", linked, failed, len(unique_jobs))
+    return linked, failed
 
 def main(config_path=None, config_data=None):
     logging.info("Starting qbit_linker...")
+    if len(sys.argv) == 3 and sys.argv[1] == '--batch':
+        with timed("config_load"):
+            config = load_config(config_path, config_data)
+        _, failed = link_batch(config, read_batch(sys.argv[2]))
+        sys.exit(1 if failed else 0)
+
     if len(sys.argv) != 3:
         logging.error("Incorrect number of arguments")
         logging.error("Usage: python qbit_linker.py <content_path> <category>")
+        logging.error("       python qbit_linker.py --batch <file with content_path<TAB>category lines, or ->")
         sys.exit(1)
 
     content_path = sys.argv[1]
     category = sys.argv[2]
-    logging.info(f"Original content path: {content_path}")
-    logging.info(f"Category: {category}")
-
-    config = load_config(config_path, config_data)
-    logging.info("Configuration loaded")
-
-    # Apply root mapping to content_path
-    mapped_content_path = apply_root_mapping(config, content_path)
-    logging.info(f"Mapped content path: {mapped_content_path}")
-    
-    dest_folder = get_destination_folder(config, category)
-    logging.info(f"Destination folder: {dest_folder}")
-
-    full_dest_path = os.path.join(dest_folder, os.path.basename(mapped_content_path))
-    logging.info(f"Full destination path: {full_dest_path}")
-
-    logging.info(f"Creating destination directory: {os.path.dirname(full_dest_path)}")
-    os.makedirs(os.path.dirname(full_dest_path), exist_ok=True)
 
-    logging.info("Calling raw_hardlinker to create hardlinks...")
-    create_hardlinks(mapped_content_path, full_dest_path)
+    with timed("config_load", content_path):
+        config = load_config(config_path, config_data)
 
-    logging.info(f"Hardlinks created: {mapped_content_path} -> {full_dest_path}")
+    link_torrent(config, content_path, category)
     logging.info("qbit_linker completed successfully")
 
 if __name__ == "__main__":
+    setup_logging()
     main()
 
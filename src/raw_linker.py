@@ -1,71 +1,118 @@
 
+import argparse
 import os
 import sys
 
-def create_hardlink(src, dest):
-    """Create a hardlink from source to destination."""
+from cross_device import CROSS_DEVICE_MODES
+from fs_ops import PathOps
+from link_plan import DEFAULT_LINK_WORKERS, LinkPlan, apply_plan, format_summary
+from walker import scan_tree
+
+def create_hardlink(src, dest, cross_device='skip'):
+    """Create a hardlink from source to destination, or a reflink or copy across filesystems."""
     try:
-        os.link(src, dest)
-        print(f"Hardlinked: {src} -> {dest}")
+        method = PathOps(cross_device).link(src, dest)
+        print(f"{LINK_MESSAGES[method]}: {src} -> {dest}")
     except FileExistsError:
         print(f"Skipped (already exists): {dest}")
     except Exception as e:
         print(f"Error creating hardlink: {src} -> {dest}")
         print(f"Error message: {str(e)}")
 
-def create_hardlinks(src, dest):
-    """Create hardlinks from source to destination, handling both files and directories."""
-    
-    if not os.path.exists(src):
-        print(f"Error: Source '{src}' does not exist.")
-        sys.exit(1)
+LINK_MESSAGES = {"link": "Hardlinked", "reflink": "Reflinked", "copy": "Copied"}
 
+def plan_hardlinks(src, dest, workers=None):
+    """Plan the directories and hardlinks create_hardlinks would make, without changing anything."""
+    plan = LinkPlan()
     if os.path.isfile(src):
         if os.path.isdir(dest):
             # If dest is a directory, use the same filename
-            dest_file = os.path.join(dest, os.path.basename(src))
+            plan.add_link(src, os.path.join(dest, os.path.basename(src)))
         else:
             # If dest doesn't end with '/', assume it's a full file path
-            dest_file = dest
+            plan.add_link(src, dest)
 
-        # Create the destination directory if it doesn't exist
-        os.makedirs(os.path.dirname(dest_file), exist_ok=True)
-        create_hardlink(src, dest_file)
-    
     elif os.path.isdir(src):
-        if not os.path.exists(dest):
-            os.makedirs(dest)
-            print(f"Created destination directory: {dest}")
-
-        for root, dirs, files in os.walk(src):
-            relative_path = os.path.relpath(root, src)
+        for listing in scan_tree(src, workers=workers):
+            relative_path = os.path.relpath(listing.path, src)
             dest_subdir = os.path.join(dest, relative_path)
-            
-            if not os.path.exists(dest_subdir):
-                os.makedirs(dest_subdir)
-                print(f"Created subdirectory: {dest_subdir}")
+            plan.add_dir(dest_subdir)
+            for record in listing.files:
+                plan.add_link(record.path, os.path.join(dest_subdir, os.path.basename(record.path)))
 
-            for file in files:
-                src_file = os.path.join(root, file)
-                dest_file = os.path.join(dest_subdir, file)
-                create_hardlink(src_file, dest_file)
+    plan.drop_existing()
+    return plan
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python hardlinker.py <source> <destination>")
-        print("\nExamples:")
-        print("  1. Directory to directory:")
-        print("     python hardlinker.py /path/to/source_dir /path/to/dest_dir")
-        print("\n  2. File to directory:")
-        print("     python hardlinker.py /path/to/source_file.txt /path/to/dest_dir/")
-        print("\n  3. File to file (rename):")
-        print("     python hardlinker.py /path/to/source_file.txt /path/to/dest_file.txt")
+def create_hardlinks(src, dest, workers=None, link_workers=DEFAULT_LINK_WORKERS, dry_run=False,
+                     cross_device='skip'):
+    """Create hardlinks from source to destination, handling both files and directories.
+
+    The links are planned first (see plan_hardlinks); then the destination directory skeleton is
+    created and the files are linked `link_workers` at a time, and a summary is printed instead
+    of a line per file. Files that cannot be hardlinked because they are on another filesystem
+    are handled according to `cross_device` (skip, reflink or copy). With `dry_run` the plan is
+    only printed. Returns the apply_plan summary, or the plan for a dry run.
+    """
+    
+    if not os.path.exists(src):
+        print(f"Error: Source '{src}' does not exist.")
         sys.exit(1)
 
-    src = sys.argv[1]
-    dest = sys.argv[2]
+    plan = plan_hardlinks(src, dest, workers=workers)
+    if dry_run:
+        plan.describe()
+        return plan
+
+    summary = apply_plan(plan, link_workers=link_workers, cross_device=cross_device)
+    print(format_summary(summary))
+    return summary
+
+USAGE_EXAMPLES = """Examples:
+  1. Directory to directory:
+     python raw_linker.py /path/to/source_dir /path/to/dest_dir
+
+  2. File to directory:
+     python raw_linker.py /path/to/source_file.txt /path/to/dest_dir/
+
+  3. File to file (rename):
+     python raw_linker.py /path/to/source_file.txt /path/to/dest_file.txt
+
+  4. Review a plan, then apply it later without rescanning:
+     python raw_linker.py /path/to/source_dir /path/to/dest_dir --dry_run --plan_file plan.json
+     python raw_linker.py --apply_plan plan.json
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Hardlink a file or directory tree.", epilog=USAGE_EXAMPLES,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', nargs='?')
+    parser.add_argument('destination', nargs='?')
+    parser.add_argument('--dry_run', action='store_true', help="Print the planned operations without linking")
+    parser.add_argument('--plan_file', help="Save the plan to this JSON file")
+    parser.add_argument('--apply_plan', help="Apply a previously saved plan instead of scanning a source")
+    parser.add_argument('--link_workers', type=int, default=DEFAULT_LINK_WORKERS, help="Links issued at once")
+    parser.add_argument('--cross_device', choices=CROSS_DEVICE_MODES, default='skip',
+                        help="For files on another filesystem: skip them, reflink them, or reflink or copy them")
+    args = parser.parse_args()
+
+    if args.apply_plan:
+        plan = LinkPlan.load(args.apply_plan)
+    elif args.source and args.destination:
+        if not os.path.exists(args.source):
+            print(f"Error: Source '{args.source}' does not exist.")
+            sys.exit(1)
+        plan = plan_hardlinks(args.source, args.destination)
+    else:
+        parser.print_help()
+        sys.exit(1)
 
-    create_hardlinks(src, dest)
+    if args.plan_file:
+        plan.save(args.plan_file)
+        print(f"Plan saved to {args.plan_file}")
+    if args.dry_run:
+        plan.describe()
+    else:
+        print(format_summary(apply_plan(plan, link_workers=args.link_workers, cross_device=args.cross_device)))
 
 if __name__ == "__main__":
     main()
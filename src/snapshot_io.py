@@ -0,0 +1,125 @@
+import gzip
+import json
+import lzma
+import os
+
+from path_table import PathTable
+
+# Version 1 is the original {source: [targets]} document and version 2 a stream of JSON lines
+# that can be written and read incrementally
+SNAPSHOT_FORMAT = "hardlinker-snapshot"
+SNAPSHOT_VERSION = 2
+
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.xz': 'xz'}
+COMPRESSION_MAGIC = {b'\x1f\x8b': 'gzip', b'\xfd7zXZ\x00': 'xz'}
+
+
+def _open(path, mode, compression):
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8', errors='surrogateescape')
+    if compression == 'xz':
+        return lzma.open(path, mode + 't', encoding='utf-8', errors='surrogateescape')
+    if compression is None:
+        return open(path, mode, encoding='utf-8', errors='surrogateescape')
+    raise ValueError(f"Unknown snapshot compression: {compression}")
+
+
+def _detect_compression(path):
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, compression in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+class SnapshotWriter:
+    """Write a snapshot as a stream of JSON lines, one source file per line.
+
+    The first line is a {"format", "version"} header. A {"d": path} line declares the next
+    directory id the first time a directory is used, and each {"s": [dir_id, name],
+    "t": [[dir_id, name], ...]} line is a source file and its target hardlinks. Only the directory
+    table is kept in memory. Output goes to a temporary file that replaces `snapshot_file` on
+    close, so an interrupted run never leaves a truncated snapshot behind. Compression is gzip or
+    xz, chosen by `compression` or else by the file extension.
+    """
+
+    def __init__(self, snapshot_file, compression=None):
+        if compression is None:
+            compression = COMPRESSION_EXTENSIONS.get(os.path.splitext(snapshot_file)[1])
+        self.snapshot_file = snapshot_file
+        self.count = 0
+        self._tmp_file = snapshot_file + '.tmp'
+        self._paths = PathTable()
+        self._file = _open(self._tmp_file, 'w', compression)
+        self._file.write(json.dumps({"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION}) + '\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _entry(self, path):
+        known = len(self._paths.dirs)
+        dir_id, name = self._paths.split(path)
+        if dir_id == known:
+            self._file.write(json.dumps({"d": self._paths.directory(dir_id)}) + '\n')
+        return [dir_id, name]
+
+    def write(self, source, targets):
+        """Append one source file and its target hardlinks."""
+        source_entry = self._entry(source)
+        target_entries = [self._entry(target) for target in targets]
+        self._file.write(json.dumps({"s": source_entry, "t": target_entries}, separators=(',', ':')) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_file, self.snapshot_file)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_file)
+
+
+def _iter_stream(f):
+    dirs = []
+    for line in f:
+        record = json.loads(line)
+        if "d" in record:
+            dirs.append(record["d"])
+            continue
+        source_dir, source_name = record["s"]
+        yield (os.path.join(dirs[source_dir], source_name),
+               [os.path.join(dirs[target_dir], target_name) for target_dir, target_name in record["t"]])
+
+
+def iter_snapshot(snapshot_file):
+    """Yield (source, targets) pairs from a version 1 or version 2 snapshot file.
+
+    Version 2 files are read one line at a time, so memory use does not grow with the snapshot.
+    Version 1 files, a single {source: [targets]} document, are loaded whole.
+    """
+    with _open(snapshot_file, 'r', _detect_compression(snapshot_file)) as f:
+        first_line = f.readline()
+        try:
+            header = json.loads(first_line)
+        except ValueError:
+            header = None
+
+        if isinstance(header, dict) and header.get("format") == SNAPSHOT_FORMAT:
+            yield from _iter_stream(f)
+        elif isinstance(header, dict):
+            # A single-line document was complete on its own
+            yield from header.items()
+        else:
+            yield from json.loads(first_line + f.read()).items()
+
+
+def load_snapshot(snapshot_file):
+    """Load a whole snapshot file as a {source: [targets]} dict."""
+    return dict(iter_snapshot(snapshot_file))
@@ -0,0 +1,96 @@
+import ctypes
+import os
+import platform
+import sys
+import threading
+import time
+
+# ioprio_set(2) syscall numbers by machine; glibc has no wrapper for it
+SYS_IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'riscv64': 30, 'armv7l': 314,
+                  'ppc64le': 273, 's390x': 282}
+
+# From linux/ioprio.h: the idle class is only served when no other process waits for the disk
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+
+class TokenBucket:
+    """Let through `rate` units per second on average, in bursts of up to `burst` units (a second's worth).
+
+    Shared by threads. A request larger than what is available is granted at once and puts the
+    bucket in debt, which the next requests wait out, so a single large read is never refused.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class Throttle:
+    """Limits applied to content reads and link operations, so a long run leaves the disks usable.
+
+    `bytes_per_second` caps file reads and `ops_per_second` caps links and unlinks (None means
+    no limit). With `drop_cache`, every file read is dropped from the page cache afterwards, so
+    one pass over the library does not evict the data other services are using.
+    """
+
+    def __init__(self, bytes_per_second=None, ops_per_second=None, drop_cache=False):
+        self.bytes_per_second = bytes_per_second
+        self.ops_per_second = ops_per_second
+        self.drop_cache = drop_cache and hasattr(os, 'posix_fadvise')
+        self._bytes = TokenBucket(bytes_per_second) if bytes_per_second else None
+        self._ops = TokenBucket(ops_per_second) if ops_per_second else None
+
+    def split(self, parts):
+        """Return a throttle for one of `parts` processes sharing these limits."""
+        return Throttle(self.bytes_per_second and self.bytes_per_second / parts,
+                        self.ops_per_second and self.ops_per_second / parts, self.drop_cache)
+
+    def read(self, size):
+        """Account for `size` bytes just read, waiting if the read rate is exceeded."""
+        if self._bytes:
+            self._bytes.take(size)
+
+    def op(self):
+        """Wait until one more link operation is allowed."""
+        if self._ops:
+            self._ops.take(1)
+
+    def done(self, fd):
+        """Called once a file has been read through `fd`."""
+        if self.drop_cache:
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                pass  # Only advice; some filesystems do not take it
+
+
+def set_idle_io_priority():
+    """Move this process, and the threads and processes it starts later, to the idle I/O class.
+
+    Returns whether it worked. Only I/O schedulers with priorities (BFQ, CFQ) honour the class.
+    """
+    number = SYS_IOPRIO_SET.get(platform.machine())
+    if not sys.platform.startswith('linux') or number is None:
+        print("Idle I/O priority is not supported on this platform.")
+        return False
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.syscall(number, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) < 0:
+        errno = ctypes.get_errno()
+        print(f"Could not set idle I/O priority: {os.strerror(errno)}")
+        return False
+    return True
@@ -0,0 +1,280 @@
+import hashlib
+import os
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from hash_cache import stat_key
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+DEFAULT_ALGORITHM = 'sha256'
+
+# Large reads keep multi-GB files at a few thousand syscalls; hashlib releases the GIL while it
+# digests buffers this size, so several files hash truly in parallel
+BUFFER_SIZE = 1 << 20
+
+# Number of files hashed at once; roughly how many disks can usefully be read concurrently
+DEFAULT_WORKERS = 8
+
+# How pairs are compared: "hash" digests both files, "bytes" reads them side by side and stops
+# at the first difference, "tiered" first compares a few sampled blocks and then does "bytes"
+COMPARE_MODES = ('hash', 'bytes', 'tiered')
+
+# Sampled comparison: head, tail and this many evenly spaced blocks in between
+SAMPLE_BLOCK_SIZE = 64 * 1024
+SAMPLE_COUNT = 8
+
+
+class _Checksum:
+    """hashlib-style wrapper around zlib's crc32/adler32 (fast, non-cryptographic)."""
+
+    def __init__(self, function, initial):
+        self._function = function
+        self._value = initial
+
+    def update(self, data):
+        self._value = self._function(data, self._value)
+
+    def hexdigest(self):
+        return f"{self._value:08x}"
+
+
+def available_algorithms():
+    """Return the names accepted by new_hasher, fastest non-cryptographic ones first."""
+    names = ['crc32', 'adler32']
+    if xxhash is not None:
+        names = ['xxh3_64', 'xxh3_128', 'xxh64'] + names
+    return names + sorted(hashlib.algorithms_guaranteed - {'shake_128', 'shake_256'})
+
+
+def new_hasher(algorithm=DEFAULT_ALGORITHM):
+    """Return a fresh hasher object with update() and hexdigest() for `algorithm`."""
+    if algorithm == 'crc32':
+        return _Checksum(zlib.crc32, 0)
+    if algorithm == 'adler32':
+        return _Checksum(zlib.adler32, 1)
+    if algorithm.startswith('xxh'):
+        if xxhash is None:
+            raise ValueError(f"Hash algorithm {algorithm} needs the optional xxhash package")
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def _hash_open_file(f, algorithm, buffer_size, throttle=None):
+    hasher = new_hasher(algorithm)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    # Read into one reusable buffer to avoid allocating a bytes object per chunk
+    try:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            if throttle:
+                throttle.read(size)
+            hasher.update(view[:size])
+    finally:
+        if throttle:
+            throttle.done(f.fileno())
+    return hasher.hexdigest()
+
+
+def hash_file(file_path, algorithm=DEFAULT_ALGORITHM, buffer_size=BUFFER_SIZE, hash_cache=None, throttle=None):
+    """Generate a hash of the given file's contents (SHA256 by default).
+
+    With a HashCache, a file whose inode, size and timestamps are unchanged is not read again.
+    Reads are limited by `throttle` (a throttle.Throttle), if given.
+    """
+    with open(file_path, "rb", buffering=0) as f:
+        if hash_cache is None:
+            return _hash_open_file(f, algorithm, buffer_size, throttle)
+        key = stat_key(os.fstat(f.fileno()))
+        digest = hash_cache.get(key, algorithm)
+        if digest is None:
+            digest = _hash_open_file(f, algorithm, buffer_size, throttle)
+            hash_cache.put(key, algorithm, digest)
+        return digest
+
+
+def _read_at(fd, size, offset, throttle=None):
+    chunks = []
+    while size > 0:
+        chunk = os.pread(fd, size, offset)
+        if not chunk:
+            break
+        if throttle:
+            throttle.read(len(chunk))
+        chunks.append(chunk)
+        size -= len(chunk)
+        offset += len(chunk)
+    return b''.join(chunks)
+
+
+def samples_match(path_a, path_b, block_size=SAMPLE_BLOCK_SIZE, samples=SAMPLE_COUNT, throttle=None):
+    """Compare the head, tail and evenly spaced middle blocks of two files.
+
+    Returns False as soon as a sampled block differs (or the sizes differ). True only means the
+    samples agree, not that the whole files do.
+    """
+    with open(path_a, "rb", buffering=0) as fa, open(path_b, "rb", buffering=0) as fb:
+        size = os.fstat(fa.fileno()).st_size
+        if os.fstat(fb.fileno()).st_size != size:
+            return False
+        if size <= block_size * (samples + 2):
+            offsets = range(0, size, block_size)
+        else:
+            stride = (size - block_size) // (samples + 1)
+            offsets = [0] + [stride * i for i in range(1, samples + 1)] + [size - block_size]
+        try:
+            for offset in offsets:
+                if (_read_at(fa.fileno(), block_size, offset, throttle)
+                        != _read_at(fb.fileno(), block_size, offset, throttle)):
+                    return False
+        finally:
+            if throttle:
+                throttle.done(fa.fileno())
+                throttle.done(fb.fileno())
+    return True
+
+
+def _fill(f, buffer):
+    """readinto `buffer` until it is full or the file ends; returns the number of bytes read."""
+    view = memoryview(buffer)
+    filled = 0
+    # A raw read may return less than asked (network filesystems, signals) before the end
+    while filled < len(buffer):
+        size = f.readinto(view[filled:])
+        if not size:
+            break
+        filled += size
+    return filled
+
+
+def contents_equal(path_a, path_b, buffer_size=BUFFER_SIZE, throttle=None):
+    """Compare two files chunk by chunk, stopping at the first difference."""
+    buffer_a = bytearray(buffer_size)
+    buffer_b = bytearray(buffer_size)
+    with open(path_a, "rb", buffering=0) as fa, open(path_b, "rb", buffering=0) as fb:
+        if os.fstat(fa.fileno()).st_size != os.fstat(fb.fileno()).st_size:
+            return False
+        try:
+            while True:
+                size_a = _fill(fa, buffer_a)
+                size_b = _fill(fb, buffer_b)
+                if throttle:
+                    throttle.read(size_a + size_b)
+                if size_a != size_b:
+                    return False
+                if not size_a:
+                    return True
+                if size_a == buffer_size:
+                    if buffer_a != buffer_b:
+                        return False
+                elif memoryview(buffer_a)[:size_a] != memoryview(buffer_b)[:size_b]:
+                    return False
+        finally:
+            # Also after an early mismatch, which is most of what tiered mode reads
+            if throttle:
+                throttle.done(fa.fileno())
+                throttle.done(fb.fileno())
+
+
+class Verifier:
+    """Compare file contents on a thread pool, many pairs at a time.
+
+    With mode "hash", every distinct path is hashed once with `algorithm`, or not at all when
+    `hash_cache` already knows its digest; with a non-cryptographic algorithm (crc32, adler32,
+    xxhash), equal digests are confirmed byte for byte, as dedupe does. With "bytes" and
+    "tiered", each pair is compared directly, so a mismatch is found after reading only up to the
+    first difference and an identical pair is read exactly once. All reads go through `throttle`
+    (a throttle.Throttle), if given.
+    """
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, workers=None, buffer_size=BUFFER_SIZE, mode='hash',
+                 hash_cache=None, throttle=None):
+        if mode not in COMPARE_MODES:
+            raise ValueError(f"Unknown compare mode: {mode}")
+        new_hasher(algorithm)  # Fail early on an unknown algorithm
+        self.algorithm = algorithm
+        self.buffer_size = buffer_size
+        self.mode = mode
+        self.hash_cache = hash_cache
+        self.throttle = throttle
+        # Non-cryptographic digests collide too easily to link on them alone
+        self.confirm = mode == 'hash' and algorithm not in hashlib.algorithms_guaranteed
+        if self.confirm:
+            self.mismatch_reason = "Content mismatch (hashes or contents differ)"
+        elif mode == 'hash':
+            self.mismatch_reason = "Content mismatch (hashes do not match)"
+        else:
+            self.mismatch_reason = "Content mismatch (contents differ)"
+        self._executor = ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS,
+                                            thread_name_prefix='verify')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def hash(self, path):
+        return hash_file(path, self.algorithm, self.buffer_size, self.hash_cache, self.throttle)
+
+    def relinked(self, path, old_stat):
+        """Tell the hash cache that `path` gained a link since `old_stat` was taken."""
+        if self.hash_cache is not None and self.mode == 'hash':
+            self.hash_cache.carry_over(path, stat_key(old_stat), self.algorithm)
+
+    def compare_pair(self, source, target):
+        """Compare one pair directly, using the sampled check first in tiered mode."""
+        if self.mode == 'tiered' and not samples_match(source, target, throttle=self.throttle):
+            return False
+        return contents_equal(source, target, self.buffer_size, self.throttle)
+
+    def compare(self, pairs):
+        """Yield ((source, target), result) for each pair, in order.
+
+        `result` is True when the contents match, False when they differ, or the OSError raised
+        while reading either file. All pairs are compared in parallel.
+        """
+        pairs = list(pairs)
+        if self.mode != 'hash':
+            pair_futures = [self._executor.submit(self.compare_pair, *pair) for pair in pairs]
+            for pair, future in zip(pairs, pair_futures):
+                try:
+                    result = future.result()
+                except OSError as e:
+                    result = e
+                yield pair, result
+            return
+
+        # Hash every distinct path once
+        futures = {}
+        for pair in pairs:
+            for path in pair:
+                if path not in futures:
+                    futures[path] = self._executor.submit(self.hash, path)
+
+        results = []
+        for source, target in pairs:
+            try:
+                result = futures[source].result() == futures[target].result()
+            except OSError as e:
+                result = e
+            if result is True and self.confirm:
+                result = self._executor.submit(contents_equal, source, target, self.buffer_size, self.throttle)
+            results.append(((source, target), result))
+
+        for pair, result in results:
+            if isinstance(result, Future):
+                try:
+                    result = result.result()
+                except OSError as e:
+                    result = e
+            yield pair, result
@@ -0,0 +1,140 @@
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Number of threads used to list and stat directories when the caller does not say
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# One regular (non-directory) entry found during a walk
+FileRecord = namedtuple('FileRecord', ['path', 'dev', 'ino', 'nlink', 'size', 'mtime_ns'])
+
+# Everything found in one directory: its files and the subdirectories to descend into
+DirListing = namedtuple('DirListing', ['path', 'mtime_ns', 'files', 'subdirs'])
+
+
+def _print_error(path, error):
+    print(f"Error processing {path}: {error}")
+
+
+def _list_directory(dirpath, name_filter, cached_mtime_ns=None, skip_symlinks=False):
+    """List one directory and stat the files in it.
+
+    Returns (listing, errors, listed_at_ns). When the directory's mtime equals `cached_mtime_ns`
+    it is not listed at all and the returned listing has files and subdirs set to None. With
+    `skip_symlinks`, symlinks to files are left out instead of reported as their target.
+    """
+    files = []
+    subdirs = []
+    errors = []
+
+    listed_at_ns = time.time_ns()
+    dir_stat = os.stat(dirpath)
+    if cached_mtime_ns is not None and dir_stat.st_mtime_ns == cached_mtime_ns:
+        return DirListing(dirpath, cached_mtime_ns, None, None), errors, listed_at_ns
+
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            try:
+                # Same semantics as os.walk: symlinked directories are neither files nor descended into
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+                if name_filter is not None and not name_filter(entry.name):
+                    continue
+                # Known from the directory entry's type, without a syscall
+                if skip_symlinks and entry.is_symlink():
+                    continue
+                # DirEntry caches this stat, so each file costs exactly one syscall
+                st = entry.stat()
+                files.append(FileRecord(entry.path, st.st_dev, st.st_ino, st.st_nlink,
+                                        st.st_size, st.st_mtime_ns))
+            except OSError as e:
+                errors.append((entry.path, e))
+
+    return DirListing(dirpath, dir_stat.st_mtime_ns, files, subdirs), errors, listed_at_ns
+
+
+def scan_tree(roots, workers=None, onerror=None, name_filter=None, listing_cache=None, skip_symlinks=False):
+    """Walk the given roots with os.scandir, yielding one DirListing per directory.
+
+    Directories are listed on a thread pool of `workers` threads (1 lists inline). Listings are
+    yielded as they complete, so the order is not deterministic when several workers are used.
+    `name_filter`, if given, is called with each file name and files it rejects are never stat'ed.
+    `onerror` is called with (path, exception) for every entry that could not be read.
+    `listing_cache`, if given (see index_cache.DirectoryCache), supplies the listing of every
+    directory whose mtime is unchanged since it was cached and receives every fresh listing.
+    Symlinks to files are followed, like the files they point to, unless `skip_symlinks` is set;
+    the cache only holds complete listings, so it cannot be combined with `skip_symlinks`.
+    """
+    if listing_cache is not None and skip_symlinks:
+        raise ValueError("skip_symlinks cannot be used with a listing_cache")
+    if isinstance(roots, (str, bytes, os.PathLike)):
+        roots = [roots]
+    workers = DEFAULT_WORKERS if workers is None else max(1, workers)
+    onerror = onerror or _print_error
+    # The cache must hold complete listings, so filtering happens after it has seen them
+    list_filter = name_filter if listing_cache is None else None
+
+    def cached_mtime(dirpath):
+        return listing_cache.lookup(dirpath) if listing_cache is not None else None
+
+    def handle(dirpath, result):
+        listing, errors, listed_at_ns = result
+        for path, error in errors:
+            onerror(path, error)
+        if listing_cache is None:
+            return listing
+        if listing.files is None:
+            listing = listing_cache.load(dirpath, listing.mtime_ns)
+        else:
+            # A listing with unreadable entries is stored but never reused
+            listing_cache.store(listing, listed_at_ns, complete=not errors)
+        if name_filter is not None:
+            files = [record for record in listing.files if name_filter(os.path.basename(record.path))]
+            listing = listing._replace(files=files)
+        return listing
+
+    if workers == 1:
+        pending = deque(roots)
+        while pending:
+            dirpath = pending.popleft()
+            try:
+                listing = handle(dirpath, _list_directory(dirpath, list_filter, cached_mtime(dirpath), skip_symlinks))
+            except OSError as e:
+                onerror(dirpath, e)
+                continue
+            yield listing
+            pending.extend(listing.subdirs)
+        return
+
+    # Keep a bounded number of directories in flight and queue the rest, so a very wide
+    # tree does not turn into millions of pending futures
+    max_in_flight = workers * 4
+    queued = deque(roots)
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='walker') as executor:
+        while queued or in_flight:
+            while queued and len(in_flight) < max_in_flight:
+                dirpath = queued.popleft()
+                future = executor.submit(_list_directory, dirpath, list_filter, cached_mtime(dirpath), skip_symlinks)
+                in_flight[future] = dirpath
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                dirpath = in_flight.pop(future)
+                try:
+                    listing = handle(dirpath, future.result())
+                except OSError as e:
+                    onerror(dirpath, e)
+                    continue
+                queued.extend(listing.subdirs)
+                yield listing
+
+
+def walk_files(roots, workers=None, onerror=None, name_filter=None, listing_cache=None, skip_symlinks=False):
+    """Yield a FileRecord for every file below the given roots (see scan_tree for the options)."""
+    for listing in scan_tree(roots, workers=workers, onerror=onerror, name_filter=name_filter,
+                             listing_cache=listing_cache, skip_symlinks=skip_symlinks):
+        yield from listing.files
@@ -0,0 +1,114 @@
+import unittest
+import contextlib
+from unittest.mock import Mock, patch
+import errno
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from cross_device import clone_file, copy_file
+from fs_ops import DirFdOps, PathOps
+from hardlink_manager import restore_hardlinks
+from link_plan import LinkPlan, apply_plan
+from snapshot_io import SnapshotWriter
+
+def _exdev(*args, **kwargs):
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+class TestCrossDevice(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.test_dir, 'source.mkv')
+        with open(self.source, 'wb') as f:
+            f.write(os.urandom(300000))
+        os.utime(self.source, ns=(1_000_000_000, 2_000_000_000))
+        self.target = os.path.join(self.test_dir, 'target.mkv')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def assertSameContent(self, path):
+        with open(self.source, 'rb') as a, open(path, 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+        self.assertEqual(os.stat(path).st_mtime_ns, 2_000_000_000)
+        self.assertFalse(os.path.samefile(self.source, path))
+
+    def test_copy_file(self):
+        copy_file(self.source, self.target)
+        self.assertSameContent(self.target)
+        with self.assertRaises(FileExistsError):
+            copy_file(self.source, self.target)
+
+    def test_copy_is_throttled(self):
+        throttle = Mock()
+        with patch('cross_device.THROTTLED_COPY_CHUNK_SIZE', 100000):
+            copy_file(self.source, self.target, throttle)
+        self.assertSameContent(self.target)
+        self.assertEqual([c.args[0] for c in throttle.read.call_args_list], [100000] * 3)
+        self.assertEqual(throttle.done.call_count, 2)
+
+    def test_clone_file_modes(self):
+        with self.assertRaises(OSError) as cm:
+            clone_file(self.source, self.target, 'skip')
+        self.assertEqual(cm.exception.errno, errno.EXDEV)
+        self.assertIn(clone_file(self.source, self.target, 'copy'), ("reflink", "copy"))
+        self.assertSameContent(self.target)
+
+    def test_link_falls_back_on_exdev(self):
+        for ops_class in (PathOps, DirFdOps):
+            with patch('fs_ops.os.link', _exdev):
+                with ops_class() as ops, self.assertRaises(OSError):
+                    ops.link(self.source, self.target)
+                self.assertFalse(os.path.exists(self.target))
+                with ops_class(cross_device='copy') as ops:
+                    self.assertIn(ops.link(self.source, self.target), ("reflink", "copy"))
+            self.assertSameContent(self.target)
+            os.unlink(self.target)
+
+    def test_different_devices_are_not_linked(self):
+        target = os.path.join(self.test_dir, 'other', 'target.mkv')
+        plan = LinkPlan()
+        plan.add_link(self.source, target)
+        plan.drop_existing()
+        source_dir = os.path.dirname(self.source)
+        with patch.object(PathOps, '_device', lambda ops, dirpath: 1 if dirpath == source_dir else 2), \
+                patch('fs_ops.os.link') as mock_link:
+            summary = apply_plan(plan, link_workers=1)
+            self.assertEqual((summary["linked"], summary["failed"]), (0, 1))
+            summary = apply_plan(plan, link_workers=1, cross_device='copy')
+            self.assertEqual(summary["reflinked"] + summary["copied"], 1)
+        mock_link.assert_not_called()
+        self.assertSameContent(target)
+
+    def test_failed_replacement_keeps_the_target(self):
+        target = os.path.join(self.test_dir, 'other', 'target.mkv')
+        os.makedirs(os.path.dirname(target))
+        shutil.copy2(self.source, target)
+        snapshot_file = os.path.join(self.test_dir, 'snapshot.json')
+        non_restored_file = os.path.join(self.test_dir, 'non_restored.json')
+        with SnapshotWriter(snapshot_file) as writer:
+            writer.write(self.source, [target])
+
+        source_dir = os.path.dirname(self.source)
+        other_device = patch.object(PathOps, '_device', lambda ops, dirpath: 1 if dirpath == source_dir else 2)
+        failing_clone = patch('fs_ops.clone_file', side_effect=OSError(errno.EXDEV, "Invalid cross-device link"))
+        # A reflink to another filesystem that fails, and mergerfs refusing a link between branches
+        for mode, patches in (('reflink', [other_device, failing_clone]), ('skip', [patch('fs_ops.os.link', _exdev)])):
+            for use_dir_fds in (False, True):
+                with contextlib.ExitStack() as stack:
+                    for p in patches:
+                        stack.enter_context(p)
+                    restore_hardlinks(snapshot_file, non_restored_file, use_dir_fds=use_dir_fds, cross_device=mode)
+                self.assertSameContent(target)
+                self.assertEqual(os.listdir(os.path.dirname(target)), ['target.mkv'])
+
+        restore_hardlinks(snapshot_file, non_restored_file)
+        self.assertTrue(os.path.samefile(self.source, target))
+
+if __name__ == '__main__':
+    unittest.main()
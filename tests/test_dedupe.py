@@ -0,0 +1,87 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from dedupe import dedupe, find_duplicates
+
+class TestDedupe(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.downloads = os.path.join(self.test_dir, 'downloads')
+        self.library = os.path.join(self.test_dir, 'library')
+        os.makedirs(self.downloads)
+        os.makedirs(self.library)
+        self.content = os.urandom(400000)
+
+        self.original = self.write(self.downloads, 'movie.mkv', self.content)
+        self.linked = os.path.join(self.library, 'movie.mkv')
+        os.link(self.original, self.linked)
+        self.copy = self.write(self.downloads, 'movie (1).mkv', self.content)
+        # Same size, head and tail as the movie, different in the middle
+        middle = bytearray(self.content)
+        middle[200000] ^= 0xff
+        self.lookalike = self.write(self.downloads, 'lookalike.mkv', bytes(middle))
+        self.small = [self.write(self.downloads, f'small{i}.nfo', b'same small file') for i in range(2)]
+        self.empty = [self.write(self.downloads, f'empty{i}', b'') for i in range(2)]
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write(self, dirpath, name, data):
+        path = os.path.join(dirpath, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_find_duplicates(self):
+        _, groups = find_duplicates([self.downloads, self.library], workers=2)
+        paths = sorted(sorted(member[2] for member in members) for _, members in groups)
+        self.assertEqual(len(paths), 2)
+        self.assertIn(sorted(self.small), paths)
+        self.assertEqual(len([p for p in paths if self.copy in p]), 1)
+        self.assertFalse(any(self.lookalike in p for p in paths))
+
+    def test_dedupe(self):
+        for algorithm in ('sha256', 'crc32'):
+            report_file = os.path.join(self.test_dir, 'report.json')
+            dedupe([self.downloads, self.library], report_file, dry_run=True, algorithm=algorithm)
+            self.assertFalse(os.path.samefile(self.original, self.copy))
+            with open(report_file) as f:
+                self.assertEqual(len(json.load(f)), 2)
+
+        report = dedupe([self.downloads, self.library])
+        # The inode with the most links is kept
+        self.assertTrue(os.path.samefile(self.linked, self.copy))
+        self.assertEqual(os.stat(self.original).st_nlink, 3)
+        self.assertTrue(os.path.samefile(*self.small))
+        self.assertFalse(os.path.samefile(self.original, self.lookalike))
+        self.assertFalse(os.path.samefile(*self.empty))
+        self.assertEqual(sum(entry["reclaimed"] for entry in report), len(self.content) + len(b'same small file'))
+        self.assertEqual(sorted(os.listdir(self.downloads)), sorted(
+            ['movie.mkv', 'movie (1).mkv', 'lookalike.mkv', 'small0.nfo', 'small1.nfo', 'empty0', 'empty1']))
+
+        # Nothing is left to do on a second pass
+        self.assertEqual(dedupe([self.downloads, self.library]), [])
+
+    def test_symlinks_are_left_alone(self):
+        links = os.path.join(self.test_dir, 'links')
+        os.makedirs(links)
+        for path in (self.original, self.copy):
+            os.symlink(path, os.path.join(links, os.path.basename(path)))
+
+        report = dedupe([links, self.downloads, self.library], workers=1, min_size=1000)
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report[0]["canonical"], self.original)
+        self.assertTrue(os.path.samefile(self.original, self.copy))
+        for path in (self.original, self.copy):
+            self.assertTrue(os.path.islink(os.path.join(links, os.path.basename(path))))
+
+if __name__ == '__main__':
+    unittest.main()
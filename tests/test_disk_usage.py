@@ -0,0 +1,80 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from disk_usage import disk_usage
+
+class TestDiskUsage(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.downloads = os.path.join(self.test_dir, 'downloads')
+        self.library = os.path.join(self.test_dir, 'library')
+        self.outside = os.path.join(self.test_dir, 'outside')
+        for folder in [self.downloads, self.library, self.outside, os.path.join(self.downloads, 'show')]:
+            os.makedirs(folder, exist_ok=True)
+
+        def write(path, size):
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+            return path
+
+        # Only in the downloads
+        write(os.path.join(self.downloads, 'show', 'orphan.mkv'), 100)
+        # Linked into the library
+        linked = write(os.path.join(self.downloads, 'show', 'linked.mkv'), 200)
+        os.link(linked, os.path.join(self.library, 'linked.mkv'))
+        # Two links within the library
+        library_only = write(os.path.join(self.library, 'movie.mkv'), 400)
+        os.link(library_only, os.path.join(self.library, 'movie.copy.mkv'))
+        # Also linked from a folder that is not a root
+        elsewhere = write(os.path.join(self.library, 'elsewhere.mkv'), 800)
+        os.link(elsewhere, os.path.join(self.outside, 'elsewhere.mkv'))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def usage(self, report, root):
+        entry = next(entry for entry in report["roots"] if entry["root"] == root)
+        return entry["files"], entry["total_bytes"], entry["exclusive_bytes"], entry["shared_bytes"]
+
+    def test_shared_inodes_are_counted_once(self):
+        report_file = os.path.join(self.test_dir, 'usage.json')
+        report = disk_usage([self.downloads, self.library], report_file, workers=2)
+
+        self.assertEqual(self.usage(report, self.downloads), (2, 300, 100, 200))
+        self.assertEqual(self.usage(report, self.library), (4, 1400, 400, 1000))
+        combined = report["combined"]
+        self.assertEqual((combined["files"], combined["total_bytes"], combined["exclusive_bytes"]), (6, 1500, 700))
+        with open(report_file) as f:
+            self.assertEqual(json.load(f), report)
+
+    def test_nested_roots_are_walked_once(self):
+        show = os.path.join(self.downloads, 'show')
+        report = disk_usage([self.downloads, show], workers=1)
+        self.assertEqual(self.usage(report, show), (2, 300, 100, 200))
+        self.assertEqual(report["combined"]["files"], 2)
+
+    def test_symlinks_are_not_links(self):
+        a = os.path.join(self.test_dir, 'a')
+        b = os.path.join(self.test_dir, 'b')
+        os.makedirs(a)
+        os.makedirs(b)
+        with open(os.path.join(a, 'f.mkv'), 'wb') as f:
+            f.write(b'x' * 100)
+        os.symlink(os.path.join(a, 'f.mkv'), os.path.join(b, 'f.mkv'))
+
+        report = disk_usage([a, b, a + os.sep], workers=1)
+        self.assertEqual(len(report["roots"]), 2)
+        self.assertEqual(self.usage(report, a), (1, 100, 100, 0))
+        self.assertEqual(self.usage(report, b), (0, 0, 0, 0))
+        self.assertEqual(report["combined"]["files"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
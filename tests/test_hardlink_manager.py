@@ -1,17 +1,22 @@
 import unittest
+import contextlib
 import os
 import tempfile
 import shutil
 import json
 import sys
 from pathlib import Path
+from unittest.mock import patch
 
 # Add the src directory to sys.path
 src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
 sys.path.insert(0, src_path)
 
 # Now import the necessary functions from src
-from hardlink_manager import build_inode_map, create_snapshot, restore_hardlinks
+from hardlink_manager import (build_inode_map, create_snapshot, create_snapshot_parallel, create_snapshot_sorted,
+                              restore_hardlinks, restore_hardlinks_parallel)
+from fs_ops import DirFdOps, PathOps
+from snapshot_io import load_snapshot
 
 class TestHardlinkManager(unittest.TestCase):
 
@@ -87,10 +92,11 @@ class TestHardlinkManager(unittest.TestCase):
         
         # Ensure the inode map contains entries for the target files
         for target_link in self.target_links:
-            inode = os.stat(target_link).st_ino
-            # Ensure inode is in the map (it might be stored as a string in the JSON file)
-            self.assertIn(str(inode), inode_map_content)
-            self.assertIn(target_link, inode_map_content[str(inode)])
+            target_stat = os.stat(target_link)
+            # Ensure the inode is in the map (keyed as "dev:ino" in the JSON file)
+            key = f"{target_stat.st_dev}:{target_stat.st_ino}"
+            self.assertIn(key, inode_map_content)
+            self.assertIn(target_link, inode_map_content[key])
     
     def test_snapshot_creation(self):
         """Test the creation of a snapshot of hard links."""
@@ -105,8 +111,7 @@ class TestHardlinkManager(unittest.TestCase):
         # Check that the snapshot file exists and has content
         self.assertTrue(os.path.exists(snapshot_file))
         
-        with open(snapshot_file, 'r') as f:
-            snapshot_content = json.load(f)
+        snapshot_content = load_snapshot(snapshot_file)
         
         # Ensure that the snapshot contains the correct source -> target links
         for source_file in self.source_files:
@@ -122,6 +127,24 @@ class TestHardlinkManager(unittest.TestCase):
             for target_link in expected_target_links:
                 self.assertIn(target_link, target_links_from_snapshot, f"Target link {target_link} for {source_file} not found in snapshot")
 
+    def test_sorted_snapshot_matches_inode_map(self):
+        """The external-sort engine produces the same snapshot as the inode map, even when spilling runs."""
+        create_snapshot(self.source_dir, build_inode_map([self.target_dir]), self.snapshot_file)
+        expected = load_snapshot(self.snapshot_file)
+
+        sorted_snapshot_file = self.snapshot_file + '.sorted'
+        try:
+            # A tiny memory limit spills a run every couple of records, and merges them in passes
+            with patch('external_sort.MAX_OPEN_RUNS', 3):
+                create_snapshot_sorted(self.source_dir, [self.target_dir], sorted_snapshot_file, memory_limit=300)
+            actual = load_snapshot(sorted_snapshot_file)
+        finally:
+            if os.path.exists(sorted_snapshot_file):
+                os.remove(sorted_snapshot_file)
+
+        self.assertEqual({source: sorted(targets) for source, targets in actual.items()},
+                         {source: sorted(targets) for source, targets in expected.items()})
+
     def test_restore_hardlinks(self):
         """Test restoring the hard links from the snapshot."""
         # Build inode map for the target directory
@@ -144,6 +167,106 @@ class TestHardlinkManager(unittest.TestCase):
         for target_link in self.target_links:
             self.assertTrue(os.path.exists(target_link), f"Hardlink not found: {target_link}")
             
+    def test_restore_hardlinks_with_dir_fds(self):
+        """Test restoring through directory file descriptors, including a removed subfolder."""
+        inode_map = build_inode_map([self.target_dir], debug_inode_map_file=self.inode_map_file)
+        create_snapshot(self.source_dir, inode_map, self.snapshot_file)
+
+        # Remove one whole subfolder and replace a link in the other with an identical copy
+        shutil.rmtree(os.path.join(self.target_dir, "subfolder1"))
+        copied_link = self.target_links[1]
+        os.remove(copied_link)
+        shutil.copy2(self.source_files[0], copied_link)
+
+        restore_hardlinks(self.snapshot_file, self.non_restored_file, use_dir_fds=True)
+
+        self.assertFalse(os.path.exists(self.non_restored_file))
+        for i, source_file in enumerate(self.source_files):
+            for target_link in self.target_links[2 * i:2 * i + 2]:
+                self.assertTrue(os.path.samefile(source_file, target_link), f"Hardlink not restored: {target_link}")
+
+    def test_dir_fds_follow_replaced_directories(self):
+        """A directory removed or replaced after its descriptor was cached is reached by its path again."""
+        folder = os.path.join(self.target_dir, "replaced")
+        with DirFdOps() as ops:
+            self.assertTrue(ops.ensure_dir(folder))
+            ops.link(self.source_files[0], os.path.join(folder, "first.txt"))
+
+            shutil.rmtree(folder)
+            os.makedirs(folder)
+            self.assertFalse(ops.ensure_dir(folder))
+            ops.link(self.source_files[0], os.path.join(folder, "second.txt"))
+            self.assertEqual(os.listdir(folder), ["second.txt"])
+
+            # Removed for good: the link fails as it would by path, and the directory is created again
+            shutil.rmtree(folder)
+            with self.assertRaises(FileNotFoundError):
+                ops.link(self.source_files[0], os.path.join(folder, "third.txt"))
+            self.assertTrue(ops.ensure_dir(folder))
+            ops.link(self.source_files[0], os.path.join(folder, "third.txt"))
+        self.assertEqual(os.listdir(folder), ["third.txt"])
+
+    def test_filesystem_calls_per_link(self):
+        """Once its directories are open, a new link through DirFdOps costs no more calls than by path."""
+        counted = ['stat', 'lstat', 'fstat', 'open', 'link', 'mkdir']
+        folder = os.path.join(self.target_dir, "counted")
+        for ops_class in (PathOps, DirFdOps):
+            shutil.rmtree(folder, ignore_errors=True)
+            counts = {}
+
+            def counting(name, function):
+                def wrapper(*args, **kwargs):
+                    counts[name] = counts.get(name, 0) + 1
+                    return function(*args, **kwargs)
+                return wrapper
+
+            with ops_class() as ops, contextlib.ExitStack() as stack:
+                for name in counted:
+                    stack.enter_context(patch.object(os, name, counting(name, getattr(os, name))))
+                # As _restore_batch makes a missing link: stat both ends, ensure the parent, link
+                for i in range(11):
+                    if i == 1:
+                        counts.clear()
+                    target = os.path.join(folder, f"{i}.txt")
+                    ops.stat(self.source_files[0])
+                    self.assertIsNone(ops.stat(target, missing_ok=True))
+                    ops.ensure_dir(folder)
+                    self.assertEqual(ops.link(self.source_files[0], target), "link")
+            self.assertEqual(sum(counts.values()), 30, f"{ops_class.__name__}: {counts}")
+
+    def test_parallel_snapshot_and_restore(self):
+        """Snapshot and restore split over worker processes give the same result as one process."""
+        for i in range(4):
+            nested_file = os.path.join(self.source_dir, f"season{i}", f"episode{i}.txt")
+            os.makedirs(os.path.dirname(nested_file))
+            with open(nested_file, 'w') as f:
+                f.write(f"Episode {i}")
+            nested_link = os.path.join(self.target_dir, f"season{i}", f"episode{i}.txt")
+            os.makedirs(os.path.dirname(nested_link))
+            os.link(nested_file, nested_link)
+            self.target_links.append(nested_link)
+
+        inode_map = build_inode_map([self.target_dir])
+        create_snapshot(self.source_dir, inode_map, self.snapshot_file)
+        expected = load_snapshot(self.snapshot_file)
+        create_snapshot_parallel(self.source_dir, inode_map, self.snapshot_file, jobs=3)
+        self.assertEqual({source: sorted(targets) for source, targets in load_snapshot(self.snapshot_file).items()},
+                         {source: sorted(targets) for source, targets in expected.items()})
+
+        # Remove every link, and turn one into a different file so it cannot be restored
+        for target_link in self.target_links:
+            os.remove(target_link)
+        with open(self.target_links[0], 'w') as f:
+            f.write("Something else entirely")
+
+        restore_hardlinks_parallel(self.snapshot_file, self.non_restored_file, jobs=2)
+
+        for target_link in self.target_links[1:]:
+            self.assertTrue(os.path.exists(target_link), f"Hardlink not found: {target_link}")
+        with open(self.non_restored_file) as f:
+            non_restored = json.load(f)
+        self.assertEqual([entry["target_file"] for entry in non_restored], [self.target_links[0]])
+
     def test_non_restored_hardlinks(self):
         """Test the creation of a non-restored hard links report."""
         # Create a snapshot with a target that will fail restoration (e.g., by tampering with the target file)
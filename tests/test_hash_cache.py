@@ -0,0 +1,70 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from hash_cache import HashCache, stat_key
+from verify import hash_file
+
+class TestHashCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, 'hashes.sqlite')
+        self.file_path = os.path.join(self.test_dir, 'file.bin')
+        with open(self.file_path, 'wb') as f:
+            f.write(b'original content')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_lru_eviction(self):
+        cache = HashCache(max_entries=2)
+        cache.put((1, 1, 0, 0, 0), 'sha256', 'a')
+        cache.put((1, 2, 0, 0, 0), 'sha256', 'b')
+        self.assertEqual(cache.get((1, 1, 0, 0, 0), 'sha256'), 'a')
+        cache.put((1, 3, 0, 0, 0), 'sha256', 'c')
+
+        self.assertIsNone(cache.get((1, 2, 0, 0, 0), 'sha256'))
+        self.assertEqual(cache.get((1, 1, 0, 0, 0), 'sha256'), 'a')
+        self.assertIsNone(cache.get((1, 1, 0, 0, 0), 'md5'))
+
+    def test_file_is_hashed_once_across_runs(self):
+        with HashCache(db_path=self.db_path) as cache:
+            digest = hash_file(self.file_path, hash_cache=cache)
+            self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        with HashCache(db_path=self.db_path) as cache:
+            self.assertEqual(hash_file(self.file_path, hash_cache=cache), digest)
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+            # Changing the content changes the key, so the file is read again
+            with open(self.file_path, 'wb') as f:
+                f.write(b'modified content')
+            self.assertNotEqual(hash_file(self.file_path, hash_cache=cache), digest)
+            self.assertEqual(cache.misses, 1)
+
+    def test_carry_over_after_link(self):
+        cache = HashCache()
+        old_stat = os.stat(self.file_path)
+        digest = hash_file(self.file_path, hash_cache=cache)
+        os.link(self.file_path, os.path.join(self.test_dir, 'link.bin'))
+
+        cache.carry_over(self.file_path, stat_key(old_stat), 'sha256')
+        self.assertEqual(cache.get(stat_key(os.stat(self.file_path)), 'sha256'), digest)
+
+    def test_database_is_capped(self):
+        with HashCache(max_entries=3, db_path=self.db_path) as cache:
+            for ino in range(10):
+                cache.put((1, ino, 0, 0, 0), 'sha256', str(ino))
+
+        with HashCache(max_entries=3, db_path=self.db_path) as cache:
+            self.assertEqual([cache.get((1, ino, 0, 0, 0), 'sha256') for ino in (6, 7, 8, 9)],
+                             [None, '7', '8', '9'])
+
+if __name__ == '__main__':
+    unittest.main()
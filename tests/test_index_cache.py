@@ -0,0 +1,66 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from index_cache import DirectoryCache
+from walker import walk_files
+
+class TestDirectoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.tree = os.path.join(self.test_dir, 'tree')
+        self.cache_file = os.path.join(self.test_dir, 'cache.sqlite')
+        for sub in ['a', 'b', os.path.join('b', 'c')]:
+            os.makedirs(os.path.join(self.tree, sub))
+            with open(os.path.join(self.tree, sub, 'file.mkv'), 'w') as f:
+                f.write(sub)
+        self.age_directories()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def age_directories(self):
+        # Move directory mtimes out of the racy window so the cache trusts them
+        past = time.time() - 60
+        for dirpath, _, _ in os.walk(self.tree):
+            os.utime(dirpath, (past, past))
+
+    def walk(self):
+        with DirectoryCache(self.cache_file) as cache:
+            paths = sorted(record.path for record in walk_files(self.tree, workers=2, listing_cache=cache))
+            cache.prune(self.tree)
+            return paths, cache.hits, cache.misses
+
+    def test_unchanged_directories_are_reused(self):
+        first, hits, misses = self.walk()
+        self.assertEqual((hits, misses), (0, 4))
+
+        second, hits, misses = self.walk()
+        self.assertEqual(second, first)
+        self.assertEqual((hits, misses), (4, 0))
+
+    def test_changed_directories_are_listed_again(self):
+        self.walk()
+        new_file = os.path.join(self.tree, 'b', 'c', 'new.mkv')
+        with open(new_file, 'w') as f:
+            f.write('new')
+        shutil.rmtree(os.path.join(self.tree, 'a'))
+
+        paths, hits, misses = self.walk()
+        self.assertIn(new_file, paths)
+        self.assertNotIn(os.path.join(self.tree, 'a', 'file.mkv'), paths)
+        # The root and b/c changed; b is unchanged
+        self.assertEqual((hits, misses), (1, 2))
+
+        with DirectoryCache(self.cache_file) as cache:
+            self.assertIsNone(cache.lookup(os.path.join(self.tree, 'a')))
+
+if __name__ == '__main__':
+    unittest.main()
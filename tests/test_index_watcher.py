@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from hardlink_manager import build_inode_map
+from index_cache import DirectoryCache
+from index_watcher import IN_Q_OVERFLOW, Inotify, IndexWatcher
+
+try:
+    Inotify().close()
+    HAVE_INOTIFY = True
+except (OSError, AttributeError):
+    HAVE_INOTIFY = False
+
+class TestIndexWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.tree = os.path.join(self.test_dir, 'tree')
+        self.outside = os.path.join(self.test_dir, 'outside')
+        self.cache_file = os.path.join(self.test_dir, 'cache.sqlite')
+        for sub in ['a', 'b', os.path.join('b', 'c'), os.path.join('..', 'outside', 'd')]:
+            os.makedirs(os.path.join(self.tree, sub))
+            with open(os.path.join(self.tree, sub, 'file.mkv'), 'w') as f:
+                f.write(sub)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def change_tree(self):
+        with open(os.path.join(self.tree, 'b', 'c', 'new.mkv'), 'w') as f:
+            f.write('new')
+        os.remove(os.path.join(self.tree, 'a', 'file.mkv'))
+        os.rename(os.path.join(self.tree, 'b'), os.path.join(self.tree, 'renamed'))
+        os.makedirs(os.path.join(self.tree, 'renamed', 'e'))
+        os.rename(os.path.join(self.outside, 'd'), os.path.join(self.tree, 'renamed', 'e', 'd'))
+
+    def indexed(self):
+        with DirectoryCache(self.cache_file) as cache:
+            return sorted(record.path for record in cache.iter_files(self.tree))
+
+    def run_counter(self):
+        with DirectoryCache(self.cache_file, read_only=True) as cache:
+            return cache.conn.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()[0]
+
+    def on_disk(self):
+        return sorted(os.path.join(dirpath, name) for dirpath, _, names in os.walk(self.tree) for name in names)
+
+    def check_watcher(self, use_inotify):
+        with IndexWatcher([self.tree], self.cache_file, interval=60, workers=2, use_inotify=use_inotify) as watcher:
+            watcher.step()
+            self.assertEqual(self.indexed(), self.on_disk())
+
+            self.change_tree()
+            for _ in range(10):
+                watcher.step(timeout=0.1)
+                if self.indexed() == self.on_disk():
+                    break
+            self.assertEqual(self.indexed(), self.on_disk())
+
+            # Snapshots read the live index instead of walking the target folders, without writing to it
+            run = self.run_counter()
+            with patch('hardlink_manager.walk_files', side_effect=AssertionError("walked")):
+                inode_map = build_inode_map([self.tree], cache_file=self.cache_file)
+            self.assertEqual(sorted(path for _, paths in inode_map.items() for path in paths), self.on_disk())
+            self.assertEqual(self.run_counter(), run)
+
+        with DirectoryCache(self.cache_file) as cache:
+            self.assertFalse(cache.is_live([self.tree]))
+
+    @unittest.skipUnless(HAVE_INOTIFY, "inotify is not available")
+    def test_inotify_applies_changes(self):
+        self.check_watcher(use_inotify=True)
+
+    def test_polling_applies_changes(self):
+        self.check_watcher(use_inotify=False)
+
+    def test_live_index_covers_only_watched_roots(self):
+        with DirectoryCache(self.cache_file) as cache:
+            cache.set_live([self.tree], 60)
+            self.assertTrue(cache.is_live([os.path.join(self.tree, 'a')]))
+            self.assertFalse(cache.is_live([self.tree, self.outside]))
+            cache.set_live([self.tree], 0)
+            self.assertFalse(cache.is_live([self.tree]))
+
+    def test_lost_changes_end_the_live_index(self):
+        with IndexWatcher([self.tree], self.cache_file, interval=60, use_inotify=False) as watcher:
+            watcher.step()
+            self.assertTrue(watcher.cache.is_live([self.tree]))
+            watcher._handle(-1, IN_Q_OVERFLOW, '')
+            self.assertFalse(watcher.cache.is_live([self.tree]))
+            watcher.step()
+            self.assertTrue(watcher.cache.is_live([self.tree]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import os
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from inode_index import InodeIndex
+
+class TestInodeIndex(unittest.TestCase):
+
+    def test_lookup_is_device_aware(self):
+        index = InodeIndex()
+        index.add(1, 100, '/disk1/a')
+        index.add(2, 100, '/disk2/a')
+        index.add(1, 100, '/disk1/b')
+
+        self.assertEqual(sorted(index.get(1, 100)), ['/disk1/a', '/disk1/b'])
+        self.assertEqual(index.get(2, 100), ['/disk2/a'])
+        self.assertEqual(index.get(3, 100), [])
+        self.assertIn((2, 100), index)
+        self.assertNotIn((2, 101), index)
+        self.assertEqual(len(index), 3)
+
+    def test_add_after_lookup(self):
+        index = InodeIndex()
+        for ino in range(1000, 0, -1):
+            index.add(7, ino, f'/tree/{ino}')
+        self.assertEqual(index.get(7, 500), ['/tree/500'])
+
+        index.add(7, 500, '/tree/500-link')
+        self.assertEqual(sorted(index.get(7, 500)), ['/tree/500', '/tree/500-link'])
+        self.assertNotIn((7, 1001), index)
+
+    def test_items_and_to_dict(self):
+        index = InodeIndex()
+        index.add(1, 5, '/x')
+        index.add(1, 3, '/y')
+        index.add(1, 5, '/z')
+
+        self.assertEqual(list(index.items()), [((1, 3), ['/y']), ((1, 5), ['/x', '/z'])])
+        self.assertEqual(index.to_dict(), {'1:3': ['/y'], '1:5': ['/x', '/z']})
+
+if __name__ == '__main__':
+    unittest.main()
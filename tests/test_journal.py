@@ -0,0 +1,118 @@
+import unittest
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import hardlink_manager
+from hardlink_manager import build_inode_map, create_snapshot, create_snapshot_parallel, restore_hardlinks
+from journal import Journal
+from snapshot_io import load_snapshot
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.journal_file = os.path.join(self.test_dir, 'run.journal')
+        self.source_dir = os.path.join(self.test_dir, 'source')
+        self.target_dir = os.path.join(self.test_dir, 'target')
+        self.snapshot_file = os.path.join(self.test_dir, 'snapshot.json')
+        self.links = []
+        for i in range(6):
+            source_file = os.path.join(self.source_dir, f"show{i}", f"episode{i}.mkv")
+            os.makedirs(os.path.dirname(source_file))
+            with open(source_file, 'w') as f:
+                f.write(f"Episode {i}")
+            target_file = os.path.join(self.target_dir, f"show{i}", f"episode{i}.mkv")
+            os.makedirs(os.path.dirname(target_file))
+            os.link(source_file, target_file)
+            self.links.append((source_file, target_file))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_resume_loads_completed_units(self):
+        with Journal(self.journal_file, {"run": 1}, sync_every=2) as journal:
+            for i in range(3):
+                journal.record({"unit": i})
+        with open(self.journal_file, 'a') as f:
+            f.write('{"unit": 3, "cut sh')
+
+        self.assertEqual(Journal(self.journal_file, {"run": 1}, resume=True).completed,
+                         [{"unit": 0}, {"unit": 1}, {"unit": 2}])
+        # A journal of another run, or a fresh start, begins empty
+        self.assertEqual(Journal(self.journal_file, {"run": 2}, resume=True).completed, [])
+        self.assertEqual(Journal(self.journal_file, {"run": 2}, resume=True).completed, [])
+
+    def test_restore_resumes_after_interruption(self):
+        create_snapshot(self.source_dir, build_inode_map([self.target_dir]), self.snapshot_file)
+        for _, target_file in self.links:
+            os.remove(target_file)
+
+        restore_batch = hardlink_manager._restore_batch
+        calls = []
+        failures = []
+
+        def interrupted(links, *args):
+            calls.append(links)
+            if len(calls) == 2 and not failures:
+                failures.append(links)
+                raise OSError("disk went away")
+            restore_batch(links, *args)
+
+        with patch('hardlink_manager._restore_batch', interrupted), self.assertRaises(OSError):
+            restore_hardlinks(self.snapshot_file, batch_size=2, journal_file=self.journal_file)
+        self.assertTrue(os.path.exists(self.journal_file))
+
+        calls.clear()
+        with patch('hardlink_manager._restore_batch', interrupted):
+            restore_hardlinks(self.snapshot_file, batch_size=2, journal_file=self.journal_file, resume=True)
+
+        # The first batch was not restored (or stat'ed) again
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(os.path.exists(self.journal_file))
+        for source_file, target_file in self.links:
+            self.assertTrue(os.path.samefile(source_file, target_file))
+
+    def test_snapshot_resumes_after_interruption(self):
+        inode_map = build_inode_map([self.target_dir])
+        snapshot_shard = hardlink_manager._snapshot_shard
+        walked = []
+        failures = []
+
+        def failing(source_folder, names, *args):
+            walked.extend(names)
+            if "show3" in names and len(failures) < 2:
+                failures.append(names)
+                raise OSError("disk went away")
+            return snapshot_shard(source_folder, names, *args)
+
+        other_targets = [self.target_dir, self.test_dir]
+        with patch('hardlink_manager.SNAPSHOT_SHARD_DIRS', 2), patch('hardlink_manager._snapshot_shard', failing):
+            create_snapshot_parallel(self.source_dir, inode_map, self.snapshot_file, journal_file=self.journal_file,
+                                     target_folders=[self.target_dir])
+            self.assertFalse(os.path.exists(self.snapshot_file))
+
+            # A journal of a snapshot against other target folders is not resumed
+            walked.clear()
+            create_snapshot_parallel(self.source_dir, inode_map, self.snapshot_file, journal_file=self.journal_file,
+                                     target_folders=other_targets, resume=True)
+            self.assertIn("show0", walked)
+
+            walked.clear()
+            create_snapshot_parallel(self.source_dir, inode_map, self.snapshot_file, journal_file=self.journal_file,
+                                     target_folders=other_targets, resume=True)
+        self.assertNotIn("show0", walked)
+        self.assertNotIn("show1", walked)
+
+        snapshot = load_snapshot(self.snapshot_file)
+        self.assertEqual(snapshot, {source_file: [target_file] for source_file, target_file in self.links})
+        self.assertFalse(os.path.exists(self.journal_file))
+        self.assertFalse(os.path.exists(self.journal_file + '.shards'))
+
+if __name__ == '__main__':
+    unittest.main()
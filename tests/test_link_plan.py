@@ -0,0 +1,68 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from link_plan import LinkPlan, apply_plan
+from missing_linker import link_missing, plan_missing
+from raw_linker import plan_hardlinks
+
+class TestLinkPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.test_dir, 'source')
+        self.dest_dir = os.path.join(self.test_dir, 'dest')
+        for relative in ('b/file2.mkv', 'a/file1.mkv', 'a/nested/file3.mkv', 'root.mkv'):
+            path = os.path.join(self.source_dir, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(relative)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_plan_is_sorted_and_deduplicated(self):
+        plan = LinkPlan()
+        plan.add_link('/src/z', '/dest/b/z')
+        plan.add_link('/src/a', '/dest/a/x')
+        plan.add_link('/src/other', '/dest/a/x')
+        plan.add_link('/src/y', '/dest/a/y')
+        self.assertEqual(list(plan.links()), [('/src/a', '/dest/a/x'), ('/src/y', '/dest/a/y'),
+                                              ('/src/z', '/dest/b/z')])
+
+    def test_dry_run_then_apply_saved_plan(self):
+        plan = plan_hardlinks(self.source_dir, self.dest_dir)
+        self.assertFalse(os.path.exists(self.dest_dir))
+        self.assertEqual(plan.mkdirs[0], self.dest_dir)
+        self.assertEqual(len(plan), 4)
+
+        plan_file = os.path.join(self.test_dir, 'plan.json')
+        plan.save(plan_file)
+        summary = apply_plan(LinkPlan.load(plan_file), link_workers=2)
+
+        self.assertEqual(summary["linked"], 4)
+        self.assertTrue(os.path.samefile(os.path.join(self.source_dir, 'a', 'nested', 'file3.mkv'),
+                                         os.path.join(self.dest_dir, 'a', 'nested', 'file3.mkv')))
+        # Everything now exists, so a new plan has nothing left to do
+        plan = plan_hardlinks(self.source_dir, self.dest_dir)
+        self.assertEqual((len(plan), plan.existing, plan.mkdirs), (0, 4, []))
+
+    def test_missing_linker_plan(self):
+        os.link(os.path.join(self.source_dir, 'b', 'file2.mkv'), os.path.join(self.test_dir, 'linked.mkv'))
+        plan = plan_missing(self.source_dir, self.dest_dir)
+        self.assertEqual([dest for _, dest in plan.links()], [
+            os.path.join(self.dest_dir, 'a', 'file1.mkv'),
+            os.path.join(self.dest_dir, 'a', 'file3.mkv'),
+        ])
+
+        link_missing(self.source_dir, self.dest_dir, dry_run=True)
+        self.assertFalse(os.path.exists(self.dest_dir))
+        self.assertEqual(link_missing(self.source_dir, self.dest_dir)["linked"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
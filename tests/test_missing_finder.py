@@ -0,0 +1,71 @@
+import unittest
+import csv
+import json
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from missing_finder import find_orphans, write_report
+
+class TestFindOrphans(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.downloads = os.path.join(self.test_dir, 'downloads')
+        self.library = os.path.join(self.test_dir, 'library')
+        os.makedirs(os.path.join(self.downloads, 'Show.S01'))
+        os.makedirs(os.path.join(self.downloads, 'Movie'))
+        os.makedirs(self.library)
+
+        def write(path, size):
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+            return path
+
+        # Linked into the library: not an orphan
+        linked = write(os.path.join(self.downloads, 'Show.S01', 'e01.mkv'), 100)
+        os.link(linked, os.path.join(self.library, 'e01.mkv'))
+        # A single link: an orphan
+        write(os.path.join(self.downloads, 'Show.S01', 'e02.mkv'), 200)
+        # Linked only within the downloads: still an orphan, counted once
+        movie = write(os.path.join(self.downloads, 'Movie', 'movie.mkv'), 300)
+        os.link(movie, os.path.join(self.downloads, 'Movie', 'movie.copy.mkv'))
+        # A single-file torrent in the root, and a non-video file
+        write(os.path.join(self.downloads, 'single.mp4'), 50)
+        write(os.path.join(self.downloads, 'Movie', 'movie.nfo'), 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_orphans_and_folder_totals(self):
+        report = find_orphans([self.downloads], [self.library], workers=2)
+        self.assertEqual([os.path.relpath(orphan["path"], self.downloads) for orphan in report["orphans"]],
+                         [os.path.join('Movie', 'movie.copy.mkv'), os.path.join('Movie', 'movie.mkv'),
+                          os.path.join('Show.S01', 'e02.mkv'), 'single.mp4'])
+        self.assertEqual([(totals["folder"], totals["files"], totals["bytes"]) for totals in report["folders"]],
+                         [('Movie', 2, 300), ('Show.S01', 1, 200), ('single.mp4', 1, 50)])
+        self.assertEqual((report["total_files"], report["total_bytes"]), (4, 550))
+
+        report = find_orphans([self.downloads], [self.library], workers=1, all_files=True)
+        self.assertEqual(report["total_bytes"], 560)
+
+    def test_write_report(self):
+        report = find_orphans([self.downloads], [self.library])
+        csv_file = os.path.join(self.test_dir, 'orphans.csv')
+        json_file = os.path.join(self.test_dir, 'orphans.json')
+        write_report(report, csv_file)
+        write_report(report, json_file)
+
+        with open(csv_file, newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([(row["folder"], row["bytes"]) for row in rows],
+                         [('Movie', '300'), ('Show.S01', '200'), ('single.mp4', '50')])
+        with open(json_file) as f:
+            self.assertEqual(json.load(f), report)
+
+if __name__ == '__main__':
+    unittest.main()
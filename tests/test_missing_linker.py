@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import patch
+import json
+import os
+import shutil
+import tempfile
+import time
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import missing_linker
+from missing_linker import ScanState, link_missing, load_settings
+
+class TestIncrementalMissingLinker(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.test_dir, 'downloads')
+        self.target_dir = os.path.join(self.test_dir, 'missing')
+        self.state_file = os.path.join(self.test_dir, 'state.sqlite')
+        for name in ['a/file1.mkv', 'a/file2.MP4', 'b/nested/file3.mkv', 'root.mkv']:
+            self.write(name)
+        self.age_directories()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write(self, name):
+        path = os.path.join(self.source_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(name)
+
+    def age_directories(self):
+        # Move directory mtimes out of the racy window so the state trusts them
+        past = time.time() - 60
+        for dirpath, _, _ in os.walk(self.source_dir):
+            os.utime(dirpath, (past, past))
+
+    def run_linker(self):
+        with ScanState(self.state_file) as state:
+            summary = link_missing(self.source_dir, self.target_dir, extensions=['.mkv', '.mp4'], state=state)
+            return summary, state.hits, state.misses
+
+    def test_repeat_runs_only_look_at_changes(self):
+        summary, hits, misses = self.run_linker()
+        self.assertEqual((summary["linked"], summary["directories_created"]), (3, 2))
+        self.assertEqual((hits, misses), (0, 4))
+        self.assertTrue(os.path.samefile(os.path.join(self.source_dir, 'a', 'file2.MP4'),
+                                         os.path.join(self.target_dir, 'a', 'file2.MP4')))
+
+        # Nothing changed: no directory is listed and nothing is planned
+        summary, hits, misses = self.run_linker()
+        self.assertEqual((summary["linked"], summary["existing"]), (0, 0))
+        self.assertEqual((hits, misses), (4, 0))
+
+        # A removed target link is not recreated, a new download is linked
+        os.remove(os.path.join(self.target_dir, 'a', 'file1.mkv'))
+        self.write('c/file4.mkv')
+        self.write('a/file5.mkv')
+        summary, hits, misses = self.run_linker()
+        self.assertEqual(summary["linked"], 2)
+        self.assertEqual((hits, misses), (2, 3))
+        self.assertFalse(os.path.exists(os.path.join(self.target_dir, 'a', 'file1.mkv')))
+        self.assertTrue(os.path.exists(os.path.join(self.target_dir, 'c', 'file4.mkv')))
+
+    def test_removed_downloads_are_forgotten(self):
+        self.run_linker()
+        os.remove(os.path.join(self.source_dir, 'a', 'file1.mkv'))
+        os.remove(os.path.join(self.target_dir, 'a', 'file1.mkv'))
+        shutil.rmtree(os.path.join(self.source_dir, 'b'))
+        self.run_linker()
+        with ScanState(self.state_file) as state:
+            self.assertEqual(len(state.conn.execute("SELECT * FROM processed").fetchall()), 1)
+
+        # A new download is linked even if it gets the inode number of a linked file
+        self.write('a/file1.mkv')
+        new_ino = os.stat(os.path.join(self.source_dir, 'a', 'file1.mkv')).st_ino
+        with ScanState(self.state_file) as state:
+            state.conn.execute("UPDATE processed SET ino = ?", (new_ino,))
+        summary, _, _ = self.run_linker()
+        self.assertEqual(summary["linked"], 1)
+
+    def test_failed_links_are_retried(self):
+        with patch('link_plan.PathOps.link', side_effect=OSError("disk full")):
+            self.assertEqual(self.run_linker()[0]["failed"], 3)
+        summary, _, _ = self.run_linker()
+        self.assertEqual(summary["linked"], 3)
+
+    def test_settings_from_config(self):
+        config_file = os.path.join(self.test_dir, 'config.json')
+        with open(config_file, 'w') as f:
+            json.dump({"missing_linker": {"roots": {self.source_dir: self.target_dir}, "extensions": [".mkv"],
+                                          "state_file": "state.sqlite"}}, f)
+        settings = load_settings(config_file)
+        self.assertEqual(settings["state_file"], self.state_file)
+
+        with patch.object(sys, 'argv', ['missing_linker.py', '--config', config_file]):
+            missing_linker.main()
+        self.assertEqual(sorted(os.listdir(os.path.join(self.target_dir, 'a'))), ['file1.mkv'])
+        with ScanState(self.state_file) as state:
+            self.assertEqual(len(state.conn.execute("SELECT * FROM processed").fetchall()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import os
+import json
+import tempfile
+import shutil
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from path_table import PathTable
+from snapshot_io import SnapshotWriter, load_snapshot
+
+class TestPathTable(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_directories_are_stored_once(self):
+        table = PathTable()
+        paths = [f'/media/hardlinks/shows/Series/Season 01/Episode {i:02d}.mkv' for i in range(10)]
+        paths.append('/media/hardlinks/movies/Café \udcff.mkv')
+        file_ids = [table.add(path) for path in paths]
+
+        self.assertEqual(table.dirs, ['/media/hardlinks/shows/Series/Season 01', '/media/hardlinks/movies'])
+        self.assertEqual([table.path(file_id) for file_id in file_ids], paths)
+        self.assertEqual(table.entry(file_ids[3]), (0, 'Episode 03.mkv'))
+        self.assertEqual(len(table), 11)
+
+    def write_snapshot(self, snapshot_file, compression=None):
+        with SnapshotWriter(snapshot_file, compression) as writer:
+            writer.write('/src/a/1.mkv', ['/dst/x/1.mkv', '/dst/y/1.mkv'])
+            writer.write('/src/a/2.mkv', ['/dst/x/2.mkv'])
+        return {
+            '/src/a/1.mkv': ['/dst/x/1.mkv', '/dst/y/1.mkv'],
+            '/src/a/2.mkv': ['/dst/x/2.mkv'],
+        }
+
+    def test_snapshot_round_trip(self):
+        snapshot_file = os.path.join(self.test_dir, 'snapshot.json')
+        expected = self.write_snapshot(snapshot_file)
+
+        with open(snapshot_file, 'r') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(lines[0]['version'], 2)
+        self.assertEqual([line['d'] for line in lines if 'd' in line], ['/src/a', '/dst/x', '/dst/y'])
+        self.assertEqual(load_snapshot(snapshot_file), expected)
+        self.assertFalse(os.path.exists(snapshot_file + '.tmp'))
+
+    def test_compressed_snapshots(self):
+        for extension, compression in [('.json.gz', None), ('.json.xz', None), ('.json', 'gzip')]:
+            snapshot_file = os.path.join(self.test_dir, 'snapshot' + extension)
+            expected = self.write_snapshot(snapshot_file, compression)
+            self.assertEqual(load_snapshot(snapshot_file), expected)
+
+    def test_load_original_snapshot_format(self):
+        snapshot_file = os.path.join(self.test_dir, 'snapshot.json')
+        original = {'/src/1.mkv': ['/dst/1.mkv']}
+        with open(snapshot_file, 'w') as f:
+            json.dump(original, f, indent=4)
+        self.assertEqual(load_snapshot(snapshot_file), original)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import patch
+import argparse
+import json
+import socket
+import os
+import shutil
+import tempfile
+import threading
+import time
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from qbit_daemon import LinkDaemon, submit, submit_job
+
+class TestQbitDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.test_dir, 'daemon.sock')
+        config = {
+            'root_default_directory': '/root/default',
+            'category_map': {'Movies': '/dest/movies'},
+            'root_mapping': {'/downloads': '/media/downloads'},
+        }
+        self.daemon = LinkDaemon(self.socket_path, config_data=json.dumps(config), workers=2)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join()
+        shutil.rmtree(self.test_dir)
+
+    @patch('qbit_linker.os.makedirs')
+    @patch('qbit_linker.create_hardlinks')
+    def test_jobs_are_linked(self, mock_create_hardlinks, mock_makedirs):
+        response = submit_job('/downloads/great_movie.mkv', 'movies', self.socket_path, wait=True)
+        self.assertEqual(response, {"status": "done", "destination": "/dest/movies/great_movie.mkv"})
+        mock_create_hardlinks.assert_called_once_with('/media/downloads/great_movie.mkv',
+                                                      '/dest/movies/great_movie.mkv')
+
+    @patch('qbit_linker.os.makedirs')
+    @patch('qbit_linker.create_hardlinks')
+    def test_duplicate_jobs_are_merged(self, mock_create_hardlinks, mock_makedirs):
+        release = threading.Event()
+        mock_create_hardlinks.side_effect = lambda src, dest: release.wait(5)
+
+        first = submit_job('/downloads/show', 'tv', self.socket_path)
+        second = submit_job('/downloads/show', 'tv', self.socket_path)
+        release.set()
+        self.assertEqual(first, {"status": "queued"})
+        self.assertEqual(second, {"status": "merged"})
+
+        # Once the first job finished, the same torrent can be queued again
+        deadline = time.monotonic() + 5
+        while self.daemon._pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        response = submit_job('/downloads/show', 'tv', self.socket_path, wait=True)
+        self.assertEqual(response["status"], "done")
+        self.assertEqual(mock_create_hardlinks.call_count, 2)
+
+    def test_invalid_request(self):
+        self.assertEqual(self.daemon.handle_request(b'{"category": "movies"}')["status"], "error")
+
+    def test_invalid_reload_keeps_the_config(self):
+        config, resolver = self.daemon.config, self.daemon.resolver
+        broken = os.path.join(self.test_dir, 'config.json')
+        with open(broken, 'w') as f:
+            f.write('{"root_default_directory": ')
+        self.daemon.config_path = broken
+        self.daemon.reload_config()
+        self.assertIs(self.daemon.config, config)
+        self.assertIs(self.daemon.resolver, resolver)
+
+    @patch('qbit_linker.setup_logging')
+    @patch('qbit_linker.load_config', return_value={})
+    @patch('qbit_linker.link_torrent')
+    def test_client_links_in_process_when_the_daemon_cannot(self, mock_link_torrent, mock_load_config,
+                                                             mock_setup_logging):
+        args = argparse.Namespace(content_path='/downloads/show', category='tv', socket=self.socket_path,
+                                  wait=False, fallback=True, config=None)
+        # A full queue, then a daemon that does not answer
+        for outcome in [{"return_value": {"status": "busy"}}, {"side_effect": socket.timeout("timed out")}]:
+            mock_link_torrent.reset_mock()
+            with patch('qbit_daemon.submit_job', **outcome):
+                submit(args)
+            mock_link_torrent.assert_called_once_with({}, '/downloads/show', 'tv')
+
+        mock_link_torrent.reset_mock()
+        with patch('qbit_daemon.submit_job', return_value={"status": "queued"}):
+            submit(args)
+        mock_link_torrent.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,9 @@ import os
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 
-from src.qbit_linker import load_config, get_destination_folder, main
+from src.qbit_linker import load_config, get_destination_folder, main, CategoryResolver, link_batch, read_batch
+import src.qbit_linker as qbit_linker
+import tempfile
 
 class TestQbitLinker(unittest.TestCase):
 
@@ -72,6 +74,61 @@ class TestQbitLinker(unittest.TestCase):
         # Verify that os.makedirs was called for each destination
         mock_makedirs.assert_called()
 
+    def test_resolver_longest_root_mapping(self):
+        config = dict(self.mock_config, root_mapping={'/downloads': '/a', '/downloads/tv': '/b'})
+        resolver = CategoryResolver(config)
+        self.assertEqual(resolver.map_root('/downloads/tv/show'), '/b/show')
+        self.assertEqual(resolver.map_root('/downloads/movie.mkv'), '/a/movie.mkv')
+        self.assertEqual(resolver.map_root('/elsewhere/movie.mkv'), '/elsewhere/movie.mkv')
+
+    def test_resolver_memoises_destinations(self):
+        resolver = CategoryResolver(self.mock_config)
+        self.assertEqual(resolver.destination('TV_SHOWS/drama/x'), '/dest/tv/drama/x')
+        self.assertEqual(resolver.destination('TV_SHOWS/drama/x'), '/dest/tv/drama/x')
+        self.assertEqual(list(resolver._destinations), ['TV_SHOWS/drama/x'])
+
+    @patch('src.qbit_linker.create_hardlinks')
+    @patch('os.makedirs')
+    def test_link_batch(self, mock_makedirs, mock_create_hardlinks):
+        lines = ('/downloads/a.mkv\tmovies\n'
+                 '{"content_path": "/downloads/show", "category": "TV_Shows/Drama"}\n'
+                 '/downloads/a.mkv\tmovies\n'
+                 'malformed line\n'
+                 '{"content_path": "/downloads/b.mkv"\n'
+                 '{"content_path": "/downloads/b.mkv"}\n')
+        with patch('builtins.open', mock_open(read_data=lines)):
+            jobs = list(read_batch('batch.txt'))
+        self.assertEqual(len(jobs), 3)
+
+        # Duplicate jobs are linked once; a job whose source is missing fails on its own
+        mock_create_hardlinks.side_effect = lambda src, dest: sys.exit(1) if src == '/downloads/show' else None
+        linked, failed = link_batch(self.mock_config, jobs, workers=2)
+        self.assertEqual((linked, failed), (1, 1))
+        mock_create_hardlinks.assert_any_call('/downloads/a.mkv', '/dest/movies/a.mkv')
+        mock_create_hardlinks.assert_any_call('/downloads/show', '/dest/tv/drama/show')
+
+    @patch('src.qbit_linker.create_hardlinks')
+    @patch('os.makedirs')
+    def test_json_logging_with_spans(self, mock_makedirs, mock_create_hardlinks):
+        with tempfile.TemporaryDirectory() as log_dir:
+            log_file = os.path.join(log_dir, 'qbit_linker.log')
+            qbit_linker.setup_logging(log_file, json_format=True)
+            try:
+                qbit_linker.link_torrent(self.mock_config, '/downloads/great_movie.mkv', 'movies')
+            finally:
+                qbit_linker.stop_logging()
+            with open(log_file) as f:
+                records = [json.loads(line) for line in f]
+
+        spans = [r['span'] for r in records if 'span' in r]
+        self.assertEqual(spans, ['resolve', 'makedirs', 'link'])
+        for record in records:
+            if 'span' in record:
+                self.assertEqual(record['job'], '/downloads/great_movie.mkv')
+                self.assertGreaterEqual(record['duration_ms'], 0)
+        # Step-by-step details are debug records, not written at the default level
+        self.assertFalse(any(r['level'] == 'DEBUG' for r in records))
+
 if __name__ == '__main__':
     unittest.main()
 
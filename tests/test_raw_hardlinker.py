@@ -7,7 +7,7 @@ import sys
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 
-from raw_hardlinker import create_hardlinks
+from raw_linker import create_hardlinks
 
 class TestRawHardlinker(unittest.TestCase):
 
@@ -74,6 +74,25 @@ class TestRawHardlinker(unittest.TestCase):
         self.assertTrue(os.path.exists(dest_file))
         self.assertTrue(os.path.samefile(source_file, dest_file))
 
+    def test_parallel_links_summary(self):
+        for i in range(50):
+            subdir = os.path.join(self.source_dir, f'dir{i % 5}', 'nested')
+            os.makedirs(subdir, exist_ok=True)
+            with open(os.path.join(subdir, f'file{i}.txt'), 'w') as f:
+                f.write(f'Test content {i}')
+        os.makedirs(os.path.join(self.dest_dir, 'dir0', 'nested'))
+        shutil.copy(os.path.join(self.source_dir, 'dir0', 'nested', 'file0.txt'),
+                    os.path.join(self.dest_dir, 'dir0', 'nested', 'file0.txt'))
+
+        summary = create_hardlinks(self.source_dir, self.dest_dir, link_workers=4)
+
+        self.assertEqual(summary, {"linked": 49, "reflinked": 0, "copied": 0, "existing": 1, "failed": 0,
+                                   "directories_created": 8})
+        self.assertTrue(os.path.samefile(
+            os.path.join(self.source_dir, 'dir3', 'nested', 'file3.txt'),
+            os.path.join(self.dest_dir, 'dir3', 'nested', 'file3.txt')
+        ))
+
     def test_nonexistent_source(self):
         with self.assertRaises(SystemExit):
             create_hardlinks('/nonexistent/path', self.dest_dir)
@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from hardlink_manager import build_inode_map, create_snapshot, restore_hardlinks
+from throttle import Throttle, TokenBucket
+from dedupe import partial_hash
+from verify import contents_equal, hash_file, samples_match
+
+class TestThrottle(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_token_bucket_waits_out_its_debt(self):
+        bucket = TokenBucket(1000)
+        with patch('throttle.time.sleep') as sleep:
+            bucket.take(1000)
+            sleep.assert_not_called()
+            bucket.take(500)
+        self.assertAlmostEqual(sleep.call_args[0][0], 0.5, places=2)
+
+    def test_split_shares_the_limits(self):
+        throttle = Throttle(1000, None, drop_cache=True).split(4)
+        self.assertEqual((throttle.bytes_per_second, throttle.ops_per_second), (250, None))
+        self.assertEqual(throttle.drop_cache, hasattr(os, 'posix_fadvise'))
+
+    def test_hash_file_reads_through_throttle(self):
+        path = os.path.join(self.test_dir, 'file.mkv')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 3000)
+        throttle = Throttle(drop_cache=True)
+        with patch.object(throttle, 'read') as read, patch.object(throttle, 'done') as done:
+            hash_file(path, buffer_size=1024, throttle=throttle)
+        self.assertEqual(sum(call[0][0] for call in read.call_args_list), 3000)
+        done.assert_called_once()
+
+    def test_every_read_is_dropped_from_the_cache(self):
+        same = os.path.join(self.test_dir, 'same.mkv')
+        other = os.path.join(self.test_dir, 'other.mkv')
+        for path, data in [(same, b'x' * 3000), (other, b'y' * 3000)]:
+            with open(path, 'wb') as f:
+                f.write(data)
+        throttle = Throttle(drop_cache=True)
+        # The sampled check, an early mismatch and dedupe's partial hash drop both files, or the one file
+        for check, fds in [(lambda: samples_match(same, other, throttle=throttle), 2),
+                           (lambda: contents_equal(same, other, buffer_size=1024, throttle=throttle), 2),
+                           (lambda: partial_hash(same, block_size=1024, throttle=throttle), 1)]:
+            with patch.object(throttle, 'done') as done:
+                check()
+            self.assertEqual(done.call_count, fds)
+
+    def test_restore_counts_reads_and_link_operations(self):
+        source_dir = os.path.join(self.test_dir, 'source')
+        target_dir = os.path.join(self.test_dir, 'target')
+        snapshot_file = os.path.join(self.test_dir, 'snapshot.json')
+        os.makedirs(source_dir)
+        os.makedirs(target_dir)
+        for i in range(3):
+            with open(os.path.join(source_dir, f"episode{i}.mkv"), 'w') as f:
+                f.write(f"Episode {i}")
+            os.link(os.path.join(source_dir, f"episode{i}.mkv"), os.path.join(target_dir, f"episode{i}.mkv"))
+        create_snapshot(source_dir, build_inode_map([target_dir]), snapshot_file)
+
+        # One target is missing, one is a copy that must be compared and replaced
+        os.remove(os.path.join(target_dir, "episode0.mkv"))
+        os.remove(os.path.join(target_dir, "episode1.mkv"))
+        shutil.copy2(os.path.join(source_dir, "episode1.mkv"), os.path.join(target_dir, "episode1.mkv"))
+
+        throttle = Throttle(bytes_per_second=1 << 30, ops_per_second=1000)
+        with patch.object(throttle, 'op', wraps=throttle.op) as op, \
+                patch.object(throttle, 'read', wraps=throttle.read) as read:
+            restore_hardlinks(snapshot_file, os.path.join(self.test_dir, 'non_restored.json'), throttle=throttle)
+        self.assertEqual(op.call_count, 2)
+        self.assertEqual(sum(call[0][0] for call in read.call_args_list), 2 * len("Episode 1"))
+        for i in range(3):
+            self.assertTrue(os.path.samefile(os.path.join(source_dir, f"episode{i}.mkv"),
+                                             os.path.join(target_dir, f"episode{i}.mkv")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the benchmarks directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+from tree_generator import generate_tree
+
+class TestTreeGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_generated_links(self):
+        tree = generate_tree(self.test_dir, files=200, depth=4, link_fanout=2, linked_fraction=1.0,
+                             copied_fraction=0.25, sparse_files=1, sparse_size=1 << 20)
+
+        linked = copied = 0
+        for target in tree["targets"]:
+            for dirpath, _, filenames in os.walk(target):
+                # Series/Season/Part/Part below each library root
+                self.assertLessEqual(len(os.path.relpath(dirpath, target).split(os.sep)), 4)
+                for filename in filenames:
+                    if os.stat(os.path.join(dirpath, filename)).st_nlink > 1:
+                        linked += 1
+                    else:
+                        copied += 1
+
+        self.assertEqual(tree["files"], 201)
+        self.assertEqual((linked, copied), (tree["links"], tree["copies"]))
+        self.assertEqual(linked + copied, 2 * 201)
+        self.assertGreater(copied, 0)
+
+if __name__ == '__main__':
+    unittest.main()
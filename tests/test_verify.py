@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import patch
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import zlib
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from verify import Verifier, contents_equal, hash_file, samples_match
+
+class TestVerify(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.data = os.urandom(300 * 1024)
+        self.original = self.write('original.bin', self.data)
+        self.copy = self.write('copy.bin', self.data)
+        self.different = self.write('different.bin', self.data[:-1] + bytes([self.data[-1] ^ 0xFF]))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_hash_file(self):
+        self.assertEqual(hash_file(self.original), hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(hash_file(self.original, 'crc32', buffer_size=4096), f"{zlib.crc32(self.data):08x}")
+        self.assertEqual(hash_file(self.original, 'blake2b'), hashlib.blake2b(self.data).hexdigest())
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            Verifier('no-such-hash')
+
+    def test_compare_pairs(self):
+        missing = os.path.join(self.test_dir, 'missing.bin')
+        pairs = [(self.original, self.copy), (self.original, self.different), (self.original, missing)]
+        with Verifier('crc32', workers=4) as verifier:
+            results = list(verifier.compare(pairs))
+
+        self.assertEqual([pair for pair, _ in results], pairs)
+        self.assertIs(results[0][1], True)
+        self.assertIs(results[1][1], False)
+        self.assertIsInstance(results[2][1], FileNotFoundError)
+
+    def test_weak_hash_matches_are_confirmed(self):
+        pairs = [(self.original, self.copy), (self.original, self.different)]
+        # A crc32 collision: both files report the same digest
+        with patch('verify.hash_file', return_value='00000000'), Verifier('crc32') as verifier:
+            self.assertEqual([result for _, result in verifier.compare(pairs)], [True, False])
+        with patch('verify.hash_file', return_value='00000000'), Verifier('sha256') as verifier:
+            self.assertEqual([result for _, result in verifier.compare(pairs)], [True, True])
+
+    def test_direct_compare_modes(self):
+        # A difference at the end of a large file is caught by the sampled tail block
+        data = bytearray(os.urandom(4 * 1024 * 1024))
+        large = self.write('large.bin', data)
+        data[-10] ^= 0xFF
+        large_changed = self.write('large_changed.bin', data)
+        self.assertFalse(samples_match(large, large_changed))
+        self.assertTrue(samples_match(self.original, self.copy))
+
+        for mode in ('bytes', 'tiered'):
+            with Verifier(mode=mode) as verifier:
+                pairs = [(self.original, self.copy), (self.original, self.different), (large, large_changed)]
+                results = [result for _, result in verifier.compare(pairs)]
+                self.assertEqual(results, [True, False, False])
+                self.assertEqual(verifier.mismatch_reason, "Content mismatch (contents differ)")
+
+    def test_contents_equal_partial_chunks(self):
+        self.assertTrue(contents_equal(self.original, self.copy, buffer_size=7000))
+        self.assertFalse(contents_equal(self.original, self.different, buffer_size=7000))
+
+    def test_contents_equal_short_reads(self):
+        copy = self.copy
+
+        class ShortReads(io.FileIO):
+            # Reads of the copy return at most 1000 bytes at a time, as a network filesystem may
+            def readinto(self, buffer):
+                if self.name == copy:
+                    buffer = memoryview(buffer)[:1000]
+                return super().readinto(buffer)
+
+        with patch('verify.open', lambda path, mode, buffering: ShortReads(path, 'rb'), create=True):
+            self.assertTrue(contents_equal(self.original, self.copy, buffer_size=7000))
+            self.assertFalse(contents_equal(self.different, self.copy, buffer_size=7000))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from walker import scan_tree, walk_files
+
+class TestWalker(unittest.TestCase):
+
+    def setUp(self):
+        # Create a small tree: two levels of directories, a hardlink and a symlinked directory
+        self.test_dir = tempfile.mkdtemp()
+        self.files = []
+        for sub in ['a', os.path.join('a', 'b'), 'c']:
+            os.makedirs(os.path.join(self.test_dir, sub), exist_ok=True)
+            file_path = os.path.join(self.test_dir, sub, 'file.mkv')
+            with open(file_path, 'w') as f:
+                f.write(f'Content of {sub}')
+            self.files.append(file_path)
+        self.link = os.path.join(self.test_dir, 'c', 'link.txt')
+        os.link(self.files[0], self.link)
+        os.symlink(os.path.join(self.test_dir, 'a'), os.path.join(self.test_dir, 'symlinked_dir'))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_records_match_os_stat(self):
+        for workers in (1, 4):
+            records = {record.path: record for record in walk_files(self.test_dir, workers=workers)}
+            self.assertEqual(set(records), set(self.files + [self.link]))
+            for path, record in records.items():
+                st = os.stat(path)
+                self.assertEqual((record.dev, record.ino, record.nlink, record.size, record.mtime_ns),
+                                 (st.st_dev, st.st_ino, st.st_nlink, st.st_size, st.st_mtime_ns))
+            self.assertEqual(records[self.link].ino, records[self.files[0]].ino)
+            self.assertEqual(records[self.link].nlink, 2)
+
+    def test_name_filter(self):
+        paths = [record.path for record in walk_files(self.test_dir, name_filter=lambda name: name.endswith('.mkv'))]
+        self.assertEqual(sorted(paths), sorted(self.files))
+
+    def test_skip_symlinks(self):
+        symlink = os.path.join(self.test_dir, 'c', 'symlink.mkv')
+        os.symlink(self.files[0], symlink)
+        for workers in (1, 4):
+            self.assertIn(symlink, [record.path for record in walk_files(self.test_dir, workers=workers)])
+            paths = [record.path for record in walk_files(self.test_dir, workers=workers, skip_symlinks=True)]
+            self.assertEqual(sorted(paths), sorted(self.files + [self.link]))
+
+    def test_scan_tree_lists_every_directory(self):
+        listings = list(scan_tree(self.test_dir, workers=2))
+        expected = {self.test_dir} | {os.path.join(self.test_dir, sub) for sub in ['a', os.path.join('a', 'b'), 'c']}
+        self.assertEqual({listing.path for listing in listings}, expected)
+
+    def test_errors_are_reported(self):
+        errors = []
+        missing = os.path.join(self.test_dir, 'missing')
+        list(walk_files([missing], onerror=lambda path, error: errors.append(path)))
+        self.assertEqual(errors, [missing])
+
+if __name__ == '__main__':
+    unittest.main()